@@ -1,5 +1,5 @@
 """
-Francais フランセ 商品爬蟲 + Shopify 上架工具 v2.2
+Francais フランセ 商品爬蟲 + Shopify 上架工具 v3.0
 功能：
 1. 爬取 sucreyshopping.jp フランセ品牌所有商品
 2. 計算材積重量 vs 實際重量，取大值
@@ -9,18 +9,35 @@ Francais フランセ 商品爬蟲 + Shopify 上架工具 v2.2
 6. 【v2.1】翻譯保護機制 - 翻譯失敗不上架、預檢、連續失敗自動停止
 7. 【v2.1】日文商品掃描 - 找出並修復未翻譯的商品
 8. 【v2.2】缺貨商品自動刪除 - 官網消失、缺貨、お急ぎ便皆直接刪除
+9. 【v2.3】PageDoc 單次解析 - 頁面只 parse 一次，text / dt-dd / meta / img 延遲快取共用
+10. 【v2.4】sucreyshopping 共用爬蟲 - 與 cocoris / maple-mania 同一份列表/詳情抓取邏輯，每輪同頁只抓一次
+11. 【v2.5】分頁列表平行預抓（stream_listing），邊列表邊處理詳情
+12. 【v2.6】庫存快掃（/api/stock-sweep、STOCK_SWEEP_MINUTES）- 庫存取自列表頁徽章 / 購物車按鈕，判斷不了才抓詳情頁
+13. 【v2.7】售價快速同步（/api/sync-prices）- 售價取自列表頁，只更新有差的 variant，不抓詳情、不翻譯
+14. 【v2.8】翻譯快取 - 依 prompt 指紋 + 標題 + 清理後說明的 hash 存檔（translation_cache.json），LRU 上限，/api/status 回報命中率
+15. 【v2.9】翻譯 prompt 拆成 TRANSLATION_* 常數與 translation_result()；修正 prompt JSON 範例大括號造成的 f-string 錯誤
+16. 【v3.0】OpenAI 請求改走獨立 keep-alive 連線池（TRANSLATE_WORKERS + 2 條連線），受 OPENAI_RPM / OPENAI_TPM 預算控管，429 依 Retry-After 全部暫停後重送
 """
 
 from flask import Flask, jsonify, request
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import re
+import unicodedata
+import math
 import json
 import os
 import time
-from urllib.parse import urljoin
+import random
+from urllib.parse import urljoin, urlparse
 import threading
+import hashlib
+import atexit
+from collections import OrderedDict
 import base64
+from functools import cached_property, partial, wraps
+from concurrent.futures import ThreadPoolExecutor
 
 app = Flask(__name__)
 
@@ -29,8 +46,8 @@ SHOPIFY_SHOP = ""
 SHOPIFY_ACCESS_TOKEN = ""
 
 BASE_URL = "https://sucreyshopping.jp"
-LIST_BASE_URL = "https://sucreyshopping.jp/shop/c/c10/?brand=francais"
-LIST_PAGE_URL_TEMPLATE = "https://sucreyshopping.jp/shop/c/c10_p{page}/?brand=francais"
+SUCREY_BRAND = "francais"
+SUCREY_LIST_URL = "https://sucreyshopping.jp/shop/c/c10{suffix}/?brand={brand}"
 
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
 MIN_PRICE = 1000
@@ -44,6 +61,173 @@ HEADERS = {
     'Connection': 'keep-alive',
 }
 
+# ========== 每個 origin 的自適應節流（AIMD） ==========
+
+class OriginPacer:
+    """依回應延遲、429/503 與錯誤率調整請求間隔與併發：
+    順利時間隔線性遞減、併發逐步 +1；被限流 / 出錯時間隔加倍、併發減半"""
+    MIN_DELAY, MAX_DELAY, MAX_LIMIT = 0.05, 30.0, 8
+
+    def __init__(self, host, delay=0.5, limit=2):
+        self.host = host; self.delay = delay; self.limit = limit
+        self.active = 0; self.next_at = 0.0; self.streak = 0
+        self.latency = 0.0; self.ok = 0; self.throttled = 0; self.errors = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.active >= self.limit: self.cond.wait()
+            self.active += 1
+            now = time.time(); start = max(now, self.next_at)
+            self.next_at = start + self.delay
+        if start > now: time.sleep(start - now)
+
+    def release(self, status, elapsed, retry_after=None):
+        with self.cond:
+            self.active -= 1
+            slow = self.latency > 0 and elapsed > self.latency * 3
+            self.latency = elapsed if not self.latency else self.latency * 0.8 + elapsed * 0.2
+            if status is None or status in (429, 503) or status >= 500:
+                if status in (429, 503): self.throttled += 1
+                else: self.errors += 1
+                self.delay = min(self.MAX_DELAY, max(self.delay * 2, retry_after or 0, 0.5))
+                self.limit = max(1, self.limit // 2); self.streak = 0
+                self.next_at = max(self.next_at, time.time() + self.delay)
+            elif slow:
+                self.ok += 1; self.streak = 0
+                self.delay = min(self.MAX_DELAY, self.delay * 1.5)
+            else:
+                self.ok += 1; self.streak += 1
+                self.delay = max(self.MIN_DELAY, self.delay - 0.05)
+                if self.streak >= self.limit * 4 and self.limit < self.MAX_LIMIT:
+                    self.limit += 1; self.streak = 0
+            self.cond.notify_all()
+
+    def snapshot(self):
+        return {'delay': round(self.delay, 2), 'rate_per_sec': round(1 / self.delay, 2),
+                'concurrency': self.limit, 'active': self.active, 'latency': round(self.latency, 2),
+                'ok': self.ok, 'throttled': self.throttled, 'errors': self.errors}
+
+
+origin_pacers = {}
+origin_pacers_lock = threading.Lock()
+
+
+def pacer_for(url):
+    host = urlparse(url).netloc
+    with origin_pacers_lock:
+        if host not in origin_pacers: origin_pacers[host] = OriginPacer(host)
+        return origin_pacers[host]
+
+
+def pacer_snapshot():
+    return {h: p.snapshot() for h, p in list(origin_pacers.items())}
+
+
+# ========== 重試（指數退避 + jitter、每輪預算）與 hedged request ==========
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'}
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "true").lower() == "true"
+
+
+class RetryBudget:
+    """每輪爬取可用的重試 / hedge 次數上限，避免官網故障時重試把流量放大"""
+    def __init__(self, limit=200):
+        self.limit = limit; self.used = 0; self.hedged = 0; self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock: self.used = 0; self.hedged = 0
+
+    def take(self):
+        with self.lock:
+            if self.used >= self.limit: return False
+            self.used += 1; return True
+
+    def snapshot(self):
+        return {'used': self.used, 'limit': self.limit, 'hedged': self.hedged}
+
+
+retry_budget = RetryBudget()
+hedge_pool = ThreadPoolExecutor(max_workers=4)
+
+
+def retry_after_of(r):
+    ra = r.headers.get('Retry-After', '')
+    return float(ra) if ra.isdigit() else None
+
+
+def backoff_delay(attempt, retry_after=None, base=0.5, cap=20.0):
+    """指數退避 + full jitter；有 Retry-After 時不低於它"""
+    return max(random.uniform(0, min(cap, base * (2 ** attempt))), retry_after or 0)
+
+
+class PacedSession(requests.Session):
+    """所有請求先經過該 origin 的 OriginPacer，回應再回饋給它；
+    冪等請求遇到連線錯誤 / 429 / 5xx 時退避重試（POST 一律不重試）"""
+    def send_paced(self, method, url, *args, on_send=None, **kwargs):
+        pacer = pacer_for(url); pacer.acquire()
+        if on_send: on_send()
+        t = time.time(); status = None; retry_after = None
+        try:
+            r = super().request(method, url, *args, **kwargs)
+            status = r.status_code; retry_after = retry_after_of(r)
+            return r
+        finally:
+            pacer.release(status, time.time() - t, retry_after)
+
+    def request(self, method, url, *args, retries=3, **kwargs):
+        retryable = method.upper() in IDEMPOTENT_METHODS; attempt = 0
+        while True:
+            try:
+                r = self.send_paced(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not (retryable and attempt < retries and retry_budget.take()): raise
+                wait = backoff_delay(attempt); reason = type(e).__name__
+            else:
+                if r.status_code not in RETRY_STATUSES: return r
+                if not (retryable and attempt < retries and retry_budget.take()): return r
+                wait = backoff_delay(attempt, retry_after_of(r)); reason = r.status_code
+            print(f"[重試] {method} {url} ({reason}) 第 {attempt + 1} 次，{wait:.1f}s 後重送")
+            time.sleep(wait); attempt += 1
+
+    def get_hedged(self, url, hedge_after=None, **kwargs):
+        """慢速詳情頁：主請求在呼叫端執行緒直接送出，真正送出（通過 pacer）後超過 hedge_after 秒
+        （預設為該 origin 平均延遲 2 倍）仍未回應，才把備援請求丟進 hedge_pool；主請求失敗時改用備援的結果。
+        主請求不進 pool，pool 滿載時排隊的時間不會被算成慢回應而多送一份"""
+        if not HEDGE_ENABLED or hedge_pool is None: return self.get(url, **kwargs)
+        pacer = pacer_for(url)
+        hedge_after = hedge_after or max(2.0, pacer.latency * 2)
+        lock = threading.Lock(); state = {'done': False, 'timer': None, 'hedge': None}
+
+        def fire():
+            with lock:
+                if state['done'] or not retry_budget.take(): return
+                with retry_budget.lock: retry_budget.hedged += 1
+                state['hedge'] = hedge_pool.submit(self.get, url, **kwargs)
+
+        def on_send():  # 主請求重試時會再經過 pacer，計時只從第一次送出開始
+            with lock:
+                if state['timer'] or state['done']: return
+                state['timer'] = threading.Timer(hedge_after, fire); state['timer'].daemon = True
+                state['timer'].start()
+
+        error = None
+        try: r = self.get(url, on_send=on_send, **kwargs)
+        except Exception as e: r = None; error = e
+        with lock:
+            state['done'] = True
+            if state['timer']: state['timer'].cancel()
+        hedge = state['hedge']
+        if hedge and (error or r.status_code in RETRY_STATUSES):
+            try: return hedge.result()
+            except Exception: pass
+        if error: raise error
+        return r
+
+
+client = PacedSession()  # 所有對外請求（官網 / Shopify / OpenAI / 圖片）
+
 scrape_status = {
     "running": False, "progress": 0, "total": 0,
     "current_product": "", "products": [], "errors": [],
@@ -140,17 +324,181 @@ def clean_html_for_translation(html_text):
     return text.strip()
 
 
-def translate_with_chatgpt(title, description, retry=False):
-    clean_description = clean_html_for_translation(description)
-    prompt = f"""你是專業的日本商品翻譯和 SEO 專家。將以下日本商品資訊翻譯成繁體中文並優化 SEO。
+# ========== OpenAI 連線池與 RPM / TPM 預算 ==========
+OPENAI_URL = "https://api.openai.com/v1/chat/completions"
+OPENAI_RPM = int(os.environ.get("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.environ.get("OPENAI_TPM", "200000"))
+OPENAI_RETRIES = int(os.environ.get("OPENAI_RETRIES", "4"))
+TRANSLATE_WORKERS = int(os.environ.get("TRANSLATE_WORKERS", "4"))
+
+
+class OpenAIBudget:
+    """每分鐘請求數 / token 數兩個 token bucket：送出前先扣預估 token（prompt 字數 + max_tokens），
+    回應後依 usage 多退少補；遇到 429 整個預算暫停，所有 worker 一起等"""
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm; self.tpm = tpm
+        self.requests = float(rpm); self.tokens = float(tpm); self.updated = time.time()
+        self.paused_until = 0.0; self.cond = threading.Condition()
+        self.sent = 0; self.throttled = 0; self.waited = 0.0; self.used_tokens = 0
+
+    def _refill(self):
+        now = time.time(); dt = now - self.updated; self.updated = now
+        self.requests = min(self.rpm, self.requests + dt * self.rpm / 60)
+        self.tokens = min(self.tpm, self.tokens + dt * self.tpm / 60)
+
+    def acquire(self, tokens):
+        tokens = min(tokens, self.tpm); t0 = time.time()
+        with self.cond:
+            while True:
+                self._refill(); now = time.time()
+                if now >= self.paused_until and self.requests >= 1 and self.tokens >= tokens:
+                    self.requests -= 1; self.tokens -= tokens; self.sent += 1; self.waited += now - t0
+                    return
+                self.cond.wait(max(0.05, self.paused_until - now, (1 - self.requests) * 60 / self.rpm,
+                                   (tokens - self.tokens) * 60 / self.tpm))
+
+    def settle(self, estimated, actual):
+        with self.cond:
+            self.tokens += estimated - actual; self.used_tokens += actual
+            self.cond.notify_all()
+
+    def pause(self, seconds):
+        with self.cond:
+            self.throttled += 1; self.paused_until = max(self.paused_until, time.time() + seconds)
+
+    def snapshot(self):
+        with self.cond:
+            self._refill()
+            return {'rpm': self.rpm, 'tpm': self.tpm, 'requests_left': int(self.requests), 'tokens_left': int(self.tokens),
+                    'sent': self.sent, 'throttled': self.throttled, 'waited_sec': round(self.waited, 1),
+                    'used_tokens': self.used_tokens, 'paused': max(0, round(self.paused_until - time.time(), 1))}
+
+
+openai_budget = OpenAIBudget(OPENAI_RPM, OPENAI_TPM)
+openai_session = requests.Session()  # 不走 OriginPacer，改由 openai_budget 控速；keep-alive 連線數對齊 worker 數
+openai_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=TRANSLATE_WORKERS + 2))
+
+
+def openai_chat(payload, timeout=60):
+    """送 chat/completions：先向 openai_budget 取得額度再從連線池送出；
+    429 依 Retry-After（沒有就指數退避）暫停整個預算後重送，5xx / 連線錯誤退避重送，回傳最後一個 response"""
+    est = sum(len(m['content']) for m in payload['messages']) + payload.get('max_tokens', 1000)
+    headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
+    for attempt in range(OPENAI_RETRIES + 1):
+        openai_budget.acquire(est)
+        try:
+            r = openai_session.post(OPENAI_URL, headers=headers, json=payload, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            openai_budget.settle(est, 0)
+            if attempt >= OPENAI_RETRIES: raise
+            wait = backoff_delay(attempt, base=1.0, cap=60.0); reason = type(e).__name__
+        else:
+            if r.status_code == 200:
+                try: used = r.json().get('usage', {}).get('total_tokens', est)
+                except ValueError: used = est
+                openai_budget.settle(est, used); return r
+            openai_budget.settle(est, 0)
+            if r.status_code not in RETRY_STATUSES or attempt >= OPENAI_RETRIES: return r
+            wait = backoff_delay(attempt, retry_after_of(r), base=1.0, cap=60.0); reason = r.status_code
+            if r.status_code == 429:
+                openai_budget.pause(wait)
+                print(f"[OpenAI] 429，全部翻譯暫停 {wait:.1f}s（第 {attempt + 1} 次）"); continue
+        print(f"[OpenAI] {reason}，第 {attempt + 1} 次，{wait:.1f}s 後重送")
+        time.sleep(wait)
+
+
+# ========== 翻譯快取（來源內容 hash） ==========
+TRANSLATION_CACHE_FILE = os.environ.get("TRANSLATION_CACHE_FILE", "translation_cache.json")
+TRANSLATION_CACHE_MAX = int(os.environ.get("TRANSLATION_CACHE_MAX", "3000"))
+TRANSLATION_PROMPT_VERSION = os.environ.get("TRANSLATION_PROMPT_VERSION", "1")  # 改這個值可讓舊快取全部失效
+
+
+class TranslationCache:
+    """翻譯結果以 sha256(prompt 指紋 + 標題 + 清理後說明 + 其他參數) 為 key 存成 JSON 檔，重啟後沿用；
+    LRU：超過 max_entries 淘汰最久沒用到的。只存成功且標題已無日文的結果"""
+    def __init__(self, path, max_entries=3000):
+        self.path = path; self.max_entries = max_entries; self.lock = threading.Lock()
+        self.hits = 0; self.misses = 0; self.evicted = 0; self.dirty = 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f: self.entries = OrderedDict(json.load(f))
+        except (OSError, ValueError):
+            self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1; return None
+            self.entries.move_to_end(key); self.hits += 1
+            return dict(self.entries[key])
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value; self.entries.move_to_end(key); self.dirty += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False); self.evicted += 1
+            if self.dirty >= 5: self._save()
+
+    def has(self, key):
+        with self.lock: return key in self.entries
+
+    def save(self):
+        with self.lock:
+            if self.dirty: self._save()
+
+    def _save(self):
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f: json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp, self.path); self.dirty = 0
+        except OSError as e:
+            print(f"[翻譯快取] 儲存失敗: {e}")
 
-商品名稱：{title}
-商品說明：{clean_description[:1500]}
+    def snapshot(self):
+        total = self.hits + self.misses
+        return {'entries': len(self.entries), 'max': self.max_entries, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0, 'evicted': self.evicted}
+
+
+translation_cache = TranslationCache(TRANSLATION_CACHE_FILE, TRANSLATION_CACHE_MAX)
+atexit.register(translation_cache.save)
+
+
+def translation_source(description):
+    """快取 key 用的說明文字：去掉 script / style / 標籤與多餘空白"""
+    text = re.sub(r'<(script|style)[^>]*>.*?</\1>', ' ', description or '', flags=re.S | re.I)
+    return re.sub(r'\s+', ' ', re.sub(r'<[^>]+>', ' ', text)).strip()
+
+
+def cached_translation(fn):
+    """translate_with_chatgpt 的快取層；prompt 指紋取自 TRANSLATION_* 常數與翻譯函式內的字串常數，
+    規則 / 詞彙表一改，舊快取自動失效"""
+    consts = [c for f in (fn, translation_input, translation_result) for c in f.__code__.co_consts if isinstance(c, str)]
+    fingerprint = hashlib.sha256(json.dumps([TRANSLATION_PROMPT_VERSION, TRANSLATION_SYSTEM, TRANSLATION_FORMAT,
+                                             TRANSLATION_RULES, consts], ensure_ascii=False)
+                                 .encode('utf-8')).hexdigest()[:16]
+
+    @wraps(fn)
+    def wrapper(title, description, *args, **kwargs):
+        key = translation_key(title, description, *args, **kwargs)
+        hit = translation_cache.get(key)
+        if hit: return hit
+        result = fn(title, description, *args, **kwargs)
+        if result.get('success') and not is_japanese_text(result.get('title', '')): translation_cache.put(key, result)
+        return result
+    wrapper.fingerprint = fingerprint
+    return wrapper
+
+
+def translation_key(title, description, *args, **kwargs):
+    """快取 key：prompt 指紋 + 標題 + 清理後說明 + 其他參數"""
+    return hashlib.sha256(json.dumps([translate_with_chatgpt.fingerprint, title, translation_source(description), args, kwargs],
+                                     ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
 
-只回傳此 JSON 格式，不加 markdown、不加任何其他文字：
-{"title":"翻譯後的商品名稱","description":"翻譯後的商品說明（HTML格式）","page_title":"SEO標題50字以內","meta_description":"SEO描述100字以內"}
 
-規則：
+# ========== 翻譯 prompt ==========
+TRANSLATION_SYSTEM = "你是專業的日本商品翻譯和 SEO 專家。你的輸出必須完全使用繁體中文和英文，絕對禁止出現任何日文字元。"
+TRANSLATION_FORMAT = '{"title":"翻譯後的商品名稱","description":"翻譯後的商品說明（HTML格式）","page_title":"SEO標題50字以內","meta_description":"SEO描述100字以內"}'
+TRANSLATION_RULES = """規則：
 1. 品牌背景：日本高級洋菓子品牌，主打千層派與精緻西式甜點
 2. 標題開頭必須是「Francais」，後接繁體中文商品名，不得省略
 3. 【強制禁止日文】所有輸出必須是繁體中文或英文，不可出現任何平假名或片假名
@@ -158,14 +506,38 @@ def translate_with_chatgpt(title, description, retry=False):
 5. SEO 關鍵字必須自然融入，包含：Francais、日本、千層派、西式甜點、伴手禮、送禮
 6. 只回傳 JSON，不得有任何其他文字"""
 
+
+def translation_input(description):
+    """送進 prompt 的商品說明"""
+    return clean_html_for_translation(description)[:1500]
+
+
+def translation_result(t, title, description):
+    """模型回傳的 JSON → 上架用的翻譯結果"""
+    tt = t.get('title', title)
+    if not tt.startswith('Francais'): tt = f"Francais {tt}"
+    return {'success': True, 'title': tt, 'description': t.get('description', description),
+            'page_title': t.get('page_title', ''), 'meta_description': t.get('meta_description', '')}
+
+
+@cached_translation
+def translate_with_chatgpt(title, description, retry=False):
+    prompt = f"""你是專業的日本商品翻譯和 SEO 專家。將以下日本商品資訊翻譯成繁體中文並優化 SEO。
+
+商品名稱：{title}
+商品說明：{translation_input(description)}
+
+只回傳此 JSON 格式，不加 markdown、不加任何其他文字：
+{TRANSLATION_FORMAT}
+
+{TRANSLATION_RULES}"""
+
     try:
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers={"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"},
-            json={
+        response = openai_chat(
+            {
                 "model": "gpt-4o-mini",
                 "messages": [
-                    {"role": "system", "content": "你是專業的日本商品翻譯和 SEO 專家。你的輸出必須完全使用繁體中文和英文，絕對禁止出現任何日文字元。"},
+                    {"role": "system", "content": TRANSLATION_SYSTEM},
                     {"role": "user", "content": prompt}
                 ],
                 "temperature": 0, "max_tokens": 1000
@@ -181,15 +553,7 @@ def translate_with_chatgpt(title, description, retry=False):
                 content = content.rsplit('```', 1)[0]
             content = content.strip()
             translated = json.loads(content)
-            trans_title = translated.get('title', title)
-            if not trans_title.startswith('Francais'):
-                trans_title = f"Francais {trans_title}"
-            return {
-                'success': True, 'title': trans_title,
-                'description': translated.get('description', description),
-                'page_title': translated.get('page_title', ''),
-                'meta_description': translated.get('meta_description', '')
-            }
+            return translation_result(translated, title, description)
         else:
             error_msg = response.text[:200]
             print(f"[翻譯失敗] HTTP {response.status_code}: {error_msg}")
@@ -207,19 +571,17 @@ def download_image_to_base64(img_url, max_retries=3):
         'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8',
         'Referer': 'https://sucreyshopping.jp/',
     }
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(img_url, headers=headers, timeout=30)
-            if response.status_code == 200:
-                content_type = response.headers.get('Content-Type', 'image/jpeg')
-                if 'png' in content_type: img_format = 'image/png'
-                elif 'webp' in content_type: img_format = 'image/webp'
-                elif 'gif' in content_type: img_format = 'image/gif'
-                else: img_format = 'image/jpeg'
-                return {'success': True, 'base64': base64.b64encode(response.content).decode('utf-8'), 'content_type': img_format}
-        except Exception as e:
-            print(f"[圖片下載] 第 {attempt+1} 次異常: {e}")
-        time.sleep(1)
+    try:
+        response = client.get(img_url, headers=headers, timeout=30, retries=max_retries)
+        if response.status_code == 200:
+            content_type = response.headers.get('Content-Type', 'image/jpeg')
+            if 'png' in content_type: img_format = 'image/png'
+            elif 'webp' in content_type: img_format = 'image/webp'
+            elif 'gif' in content_type: img_format = 'image/gif'
+            else: img_format = 'image/jpeg'
+            return {'success': True, 'base64': base64.b64encode(response.content).decode('utf-8'), 'content_type': img_format}
+    except Exception as e:
+        print(f"[圖片下載] 下載異常: {e}")
     return {'success': False}
 
 
@@ -227,7 +589,7 @@ def get_existing_products_map():
     products_map = {}
     url = shopify_api_url("products.json?limit=250")
     while url:
-        response = requests.get(url, headers=get_shopify_headers())
+        response = client.get(url, headers=get_shopify_headers())
         if response.status_code != 200: break
         data = response.json()
         for product in data.get('products', []):
@@ -247,12 +609,13 @@ def get_existing_products_map():
     return products_map
 
 
-def get_collection_products_map(collection_id):
+def get_collection_products_map(collection_id, variants=False):
+    """collection 內 SKU → product_id；variants=True 時改為 {product_id, variant_id, 目前售價}（售價同步用）"""
     products_map = {}
     if not collection_id: return products_map
     url = shopify_api_url(f"collections/{collection_id}/products.json?limit=250")
     while url:
-        response = requests.get(url, headers=get_shopify_headers())
+        response = client.get(url, headers=get_shopify_headers())
         if response.status_code != 200: break
         data = response.json()
         for product in data.get('products', []):
@@ -260,7 +623,9 @@ def get_collection_products_map(collection_id):
             for variant in product.get('variants', []):
                 sku = variant.get('sku')
                 if sku and product_id:
-                    products_map[normalize_sku(sku)] = product_id
+                    products_map[normalize_sku(sku)] = product_id if not variants else {
+                        'product_id': product_id, 'variant_id': variant.get('id'),
+                        'price': float(variant.get('price') or 0)}
         link_header = response.headers.get('Link', '')
         if 'rel="next"' in link_header:
             match = re.search(r'<([^>]+)>; rel="next"', link_header)
@@ -269,37 +634,38 @@ def get_collection_products_map(collection_id):
     return products_map
 
 
+
 def set_product_to_draft(product_id):
     url = shopify_api_url(f"products/{product_id}.json")
-    response = requests.put(url, headers=get_shopify_headers(), json={"product": {"id": product_id, "status": "draft"}})
+    response = client.put(url, headers=get_shopify_headers(), json={"product": {"id": product_id, "status": "draft"}})
     return response.status_code == 200
 
 
 def delete_product(product_id):
     url = shopify_api_url(f"products/{product_id}.json")
-    response = requests.delete(url, headers=get_shopify_headers())
+    response = client.delete(url, headers=get_shopify_headers())
     return response.status_code == 200
 
 
 def update_product(product_id, data):
     url = shopify_api_url(f"products/{product_id}.json")
-    response = requests.put(url, headers=get_shopify_headers(), json={"product": {"id": product_id, **data}})
+    response = client.put(url, headers=get_shopify_headers(), json={"product": {"id": product_id, **data}})
     return response.status_code == 200, response
 
 
 def get_or_create_collection(collection_title="Francais"):
-    response = requests.get(shopify_api_url(f'custom_collections.json?title={collection_title}'), headers=get_shopify_headers())
+    response = client.get(shopify_api_url(f'custom_collections.json?title={collection_title}'), headers=get_shopify_headers())
     if response.status_code == 200:
         for col in response.json().get('custom_collections', []):
             if col['title'] == collection_title: return col['id']
-    response = requests.post(shopify_api_url('custom_collections.json'), headers=get_shopify_headers(),
+    response = client.post(shopify_api_url('custom_collections.json'), headers=get_shopify_headers(),
                              json={'custom_collection': {'title': collection_title, 'published': True}})
     if response.status_code == 201: return response.json()['custom_collection']['id']
     return None
 
 
 def add_product_to_collection(product_id, collection_id):
-    response = requests.post(shopify_api_url('collects.json'), headers=get_shopify_headers(),
+    response = client.post(shopify_api_url('collects.json'), headers=get_shopify_headers(),
                              json={'collect': {'product_id': product_id, 'collection_id': collection_id}})
     return response.status_code == 201
 
@@ -308,7 +674,7 @@ def publish_to_all_channels(product_id):
     graphql_url = f"https://{SHOPIFY_SHOP}.myshopify.com/admin/api/2024-01/graphql.json"
     headers = {'X-Shopify-Access-Token': SHOPIFY_ACCESS_TOKEN, 'Content-Type': 'application/json'}
     query = """{ publications(first: 20) { edges { node { id name } } } }"""
-    response = requests.post(graphql_url, headers=headers, json={'query': query})
+    response = client.post(graphql_url, headers=headers, json={'query': query})
     if response.status_code != 200: return False
     publications = response.json().get('data', {}).get('publications', {}).get('edges', [])
     seen = set()
@@ -319,64 +685,267 @@ def publish_to_all_channels(product_id):
     mutation = """mutation publishablePublish($id: ID!, $input: [PublicationInput!]!) {
       publishablePublish(id: $id, input: $input) { userErrors { field message } } }"""
     variables = {"id": f"gid://shopify/Product/{product_id}", "input": [{"publicationId": p['id']} for p in unique]}
-    requests.post(graphql_url, headers=headers, json={'query': mutation, 'variables': variables})
+    client.post(graphql_url, headers=headers, json={'query': mutation, 'variables': variables})
     return True
 
 
+class PageDoc:
+    """單次解析頁面，衍生資料延遲快取供所有 extractor 共用"""
+    def __init__(self, html):
+        self.html = html; self.soup = BeautifulSoup(html, 'html.parser')
+
+    @cached_property
+    def text(self): return self.soup.get_text()
+
+    @cached_property
+    def pairs(self):
+        out = []
+        for dt in self.soup.find_all('dt'):
+            dd = dt.find_next_sibling('dd')
+            if dd: out.append((dt.get_text(strip=True), dd.get_text(strip=True)))
+        return out
+
+    def label(self, *keys):
+        for k, v in self.pairs:
+            if any(x in k for x in keys): return v
+        return ''
+
+    @cached_property
+    def meta(self):
+        out = {}
+        for m in self.soup.find_all('meta'):
+            k = m.get('property') or m.get('name') or m.get('itemprop')
+            if k and k not in out: out[k] = m.get('content', '')
+        return out
+
+    @cached_property
+    def images(self): return self.soup.find_all('img')
+
+
+# ========== 尺寸 / 重量抽取引擎 ==========
+SIZE_TRANS = str.maketrans({'×': 'x', '✕': 'x', 'Φ': '', 'φ': '', ',': ''})
+SIZE_NUM = r'(\d+(?:\.\d+)?)'
+SIZE_LABEL = r'(?:[WDHL]|縦|横|高さ|タテ|ヨコ|奥行き?|幅)?'
+
+
+class SizeWeightRule:
+    """尺寸 + 重量單次抽取：NFKC 正規化（全形數字 / ｍｍ / ㎏ 等）後，一條編譯好的 regex
+    finditer 一遍同時收尺寸與重量，單位統一成 cm / kg。
+    dim_unit：尺寸沒寫單位時當作的單位（None = 必須寫單位）；weight_units：接受的重量單位，順序即優先序；
+    weight_end：g 之後不可接的字元；cylinder：允許「直徑 x 高 mm」兩維"""
+    def __init__(self, dim_prefix='', weight_prefix='', dim_unit=None, weight_units=('kg', 'g'),
+                 weight_end=r'(?![a-z0-9])', cylinder=False, dims=True, ndigits=2):
+        dim = (rf'{dim_prefix}{SIZE_LABEL}\s*(?P<a>\d+(?:\.\d+)?)\s*(?P<ua>mm|cm)?\s*x\s*'
+               rf'{SIZE_LABEL}\s*(?P<b>\d+(?:\.\d+)?)\s*(?P<ub>mm|cm)?'
+               rf'(?:\s*x\s*{SIZE_LABEL}\s*(?P<c>\d+(?:\.\d+)?))?(?:\s*\(?\s*(?P<u>mm|cm)(?:\s*\))?)?')
+        wt = rf'{weight_prefix}(?P<w>\d+(?:\.\d+)?)\s*(?P<wu>kg|g{weight_end})'
+        parts = ([f'(?P<dim>{dim})'] if dims else []) + ([f'(?P<wt>{wt})'] if weight_units else [])
+        self.rx = re.compile('|'.join(parts), re.I)
+        self.dim_unit = dim_unit; self.weight_units = weight_units
+        self.cylinder = cylinder; self.dims = dims; self.ndigits = ndigits
+
+    def __call__(self, text):
+        box = cyl = None; weights = {}
+        for m in self.rx.finditer(unicodedata.normalize('NFKC', text or '').translate(SIZE_TRANS)):
+            if m.lastgroup == 'wt':
+                u = m['wu'].lower()
+                if u in self.weight_units and u not in weights:
+                    weights[u] = float(m['w']) / (1000 if u == 'g' else 1)
+            else:
+                units = [m['ua'] or m['u'] or self.dim_unit, m['ub'] or m['u'] or self.dim_unit, m['u'] or self.dim_unit]
+                nums = [n for n in (m['a'], m['b'], m['c']) if n is not None]
+                if not all(units[:len(nums)]): continue
+                vals = [float(n) / (10 if un.lower() == 'mm' else 1) for n, un in zip(nums, units)]
+                if len(vals) == 3 and box is None: box = vals
+                elif len(vals) == 2 and self.cylinder and cyl is None and (m['u'] or m['ub']): cyl = vals
+            if (box or not self.dims) and len(weights) == len(self.weight_units): break
+        weight = next((weights[u] for u in self.weight_units if u in weights), None)
+        dimension = None
+        if box:
+            l, w, h = box
+            dimension = {'l': l, 'w': w, 'h': h, 'volume_weight': round(l * w * h / 6000, self.ndigits)}
+        elif cyl:
+            d, h = cyl
+            dimension = {'diameter': d, 'height': h, 'volume_weight': round(math.pi * (d / 2) ** 2 * h / 6000, self.ndigits)}
+        vw = dimension['volume_weight'] if dimension else 0
+        return {'dimension': dimension, 'actual_weight': round(weight, 3) if weight else None,
+                'volume_weight': vw, 'final_weight': round(max(vw, weight or 0), self.ndigits)}
+
+
+SIZE_RULE = SizeWeightRule(dim_unit='mm', weight_units=())  # 箱サイズ dd：沒寫單位視為 mm
+SIZE_FIXTURES = [  # (文字, actual_weight, final_weight)：改 SIZE_RULE 後打 /api/test-size 對一遍
+    ('200×150×60mm 450g', None, 0.3),
+    ('200×150×60mm\u3000450g', None, 0.3),
+    ('200×150×60mm\n450g', None, 0.3),
+    ('120mm×80mm×40mm 250g', None, 0.06),
+    ('W260×D180×H60', None, 0.47),
+    ('260×180×60 mm', None, 0.47),
+]
+
+
 def parse_box_size(text):
-    text = text.replace('×', 'x').replace('Ｘ', 'x').replace('ｘ', 'x')
-    text = text.replace('ｍｍ', 'mm').replace('ｇ', 'g').replace('ｋｇ', 'kg').replace(',', '')
-    pattern = r'[Ww]?\s*(\d+(?:\.\d+)?)\s*[xX×]\s*[Dd]?\s*(\d+(?:\.\d+)?)\s*[xX×]\s*[Hh]?\s*(\d+(?:\.\d+)?)'
-    match = re.search(pattern, text)
-    if match:
-        w, d, h = float(match.group(1)), float(match.group(2)), float(match.group(3))
-        return {"width": w, "depth": d, "height": h, "volume_weight": round((w * d * h) / 6000000, 2)}
-    simple = re.search(r'(\d+(?:\.\d+)?)\s*[xX×]\s*(\d+(?:\.\d+)?)\s*[xX×]\s*(\d+(?:\.\d+)?)', text)
-    if simple:
-        l, w, h = float(simple.group(1)), float(simple.group(2)), float(simple.group(3))
-        return {"length": l, "width": w, "height": h, "volume_weight": round((l * w * h) / 6000000, 2)}
+    return SIZE_RULE(text)['dimension']
+
+
+# ========== 分頁列表引擎 ==========
+
+LISTING_WINDOW = 4
+
+
+def stream_listing(load_page, seen=None, max_pages=20, window=LISTING_WINDOW):
+    """一次平行預抓 window 頁、依頁序輸出；load_page(n) 回傳 (records, has_more)。
+    None / 空頁 / 整頁都是已見過的 SKU（被導回第一頁）/ has_more=False 皆視為到底。
+    seen 可跨分類共用，逐筆 yield 讓呼叫端邊列表邊抓詳情。"""
+    seen = set() if seen is None else seen
+    page = 1
+    with ThreadPoolExecutor(max_workers=window) as pool:
+        while page <= max_pages:
+            batch = range(page, min(page + window, max_pages + 1))
+            futures = [pool.submit(load_page, n) for n in batch]
+            for n, fu in zip(batch, futures):
+                try: res = fu.result()
+                except Exception as e:
+                    print(f"[列表] 第 {n} 頁失敗: {e}"); return
+                if not res or not res[0]: return
+                records, has_more = res; new_count = 0
+                for rec in records:
+                    if rec['sku'] in seen: continue
+                    seen.add(rec['sku']); new_count += 1
+                    yield rec
+                if new_count == 0 or not has_more: return
+            page += window
+
+
+# ========== sucreyshopping.jp 共用爬蟲 ==========
+# cocoris / francais / maple-mania 共用同一份實作，只差 SUCREY_BRAND
+
+def sucrey_fetch(url, timeout=30, retries=3, cache=None):
+    """cache 是該輪爬取自己的 dict，同一 URL（列表/詳情頁）只抓一次；None（輪外呼叫）一律重抓"""
+    if cache is not None and url in cache: return cache[url]
+    r = client.get_hedged(url, headers=HEADERS, timeout=timeout, retries=retries)
+    if r.status_code != 200: return None
+    if cache is not None: cache[url] = r.text
+    return r.text
+
+
+def fetch_sucrey_list_page(brand, page, cache=None):
+    """解析一頁品牌列表，同頁多個連結合併成一筆；has_more 依「下一頁」連結判斷"""
+    url = SUCREY_LIST_URL.format(suffix='' if page == 1 else f'_p{page}', brand=brand)
+    print(f"[INFO] [{brand}] 載入第 {page} 頁: {url}")
+    html = sucrey_fetch(url, cache=cache)
+    if not html: return None
+    soup = BeautifulSoup(html, 'html.parser')
+    records = []; index = {}
+    for link in soup.find_all('a', href=re.compile(r'/shop/g/g[^/]+/?')):
+        href = link.get('href', '')
+        sm = re.search(r'/shop/g/g([^/]+)/?', href)
+        if not sm: continue
+        sku = normalize_sku(sm.group(1))
+        rec = index.get(sku)
+        if rec is None:
+            rec = {'brand': brand, 'url': urljoin(BASE_URL, href), 'sku': sku, 'sku_raw': sm.group(1),
+                   'title': '', 'list_price': 0, 'is_express': False, 'is_points': False, 'list_stock': None}
+            index[sku] = rec; records.append(rec)
+        label = link.get('title', '') or link.get_text(strip=True)
+        if label and not rec['title']: rec['title'] = label
+        parent = link.find_parent(['dl', 'div', 'li'])
+        card = parent.get_text() if parent else ''
+        if 'お急ぎ便' in label or 'お急ぎ便' in card: rec['is_express'] = True
+        if 'ポイント' in card and '円' not in card: rec['is_points'] = True
+        st = card_stock(parent)
+        if st is not None and rec['list_stock'] is not False: rec['list_stock'] = st
+        if not rec['list_price']: rec['list_price'] = card_price(parent)
+    return records, bool(soup.find('a', href=re.compile(f'c10_p{page + 1}')))
+
+
+def crawl_sucrey_listing(brand, cache=None):
+    """品牌列表串流：每筆標記 brand，跨頁依出現順序去重"""
+    return stream_listing(partial(fetch_sucrey_list_page, brand, cache=cache), max_pages=50)
+
+
+def scrape_product_list(cache=None):
+    return list(crawl_sucrey_listing(SUCREY_BRAND, cache))
+
+
+# ========== 列表頁庫存（庫存快掃模式） ==========
+GOODS_HREF = re.compile(r'/shop/g/g([^/?#]+)')
+LIST_SOLD_OUT = re.compile(r'品切れ|在庫なし|在庫切れ|SOLD\s*OUT|販売終了|入荷待ち', re.I)
+LIST_CART = re.compile(r'カートに入れる|カートへ入れる|買い物かごに入れる')
+CARD_PRICE_RX = re.compile(r'[￥¥]\s*([\d,]+)|([\d,]+)\s*円')
+LIST_SOLD_OUT_CSS = '[class*="soldout"], [class*="sold-out"], [class*="nostock"], img[alt*="品切"]'
+LIST_CART_CSS = 'form[action*="cart"], a[href*="cart.aspx"], button[class*="cart"], input[class*="cart"], input[alt*="カート"]'
+STOCK_SWEEP_MINUTES = int(os.environ.get("STOCK_SWEEP_MINUTES", "0"))  # >0：背景每 N 分鐘快掃一次
+
+
+def card_goods(card):
+    """商品卡連到的商品代碼；超過一個代表抓到整個列表那一層"""
+    return {m.group(1) for a in card.find_all('a', href=True) for m in [GOODS_HREF.search(a['href'])] if m}
+
+
+def card_stock(card):
+    """列表商品卡的庫存：缺貨徽章 / 缺貨 class → False，購物車按鈕 → True，其餘 None（交給詳情頁）。
+    卡片連到不只一個商品一律 None，免得別的商品的「品切れ」誤判"""
+    if card is None or len(card_goods(card)) > 1: return None
+    text = card.get_text(' ')
+    if LIST_SOLD_OUT.search(text) or card.select_one(LIST_SOLD_OUT_CSS): return False
+    if LIST_CART.search(text) or card.select_one(LIST_CART_CSS): return True
     return None
 
 
-def scrape_product_list():
-    products = []
-    page_num = 1
-    has_next_page = True
-    while has_next_page:
-        url = LIST_BASE_URL if page_num == 1 else LIST_PAGE_URL_TEMPLATE.format(page=page_num)
-        try:
-            response = requests.get(url, headers=HEADERS, timeout=30)
-            if response.status_code != 200: has_next_page = False; continue
-            soup = BeautifulSoup(response.text, 'html.parser')
-            product_links = soup.find_all('a', href=re.compile(r'/shop/g/g[^/]+/?'))
-            if not product_links: has_next_page = False; continue
-            seen_skus = set()
-            page_products = []
-            for link in product_links:
-                href = link.get('href', '')
-                if '/shop/g/g' not in href: continue
-                sku_match = re.search(r'/shop/g/g([^/]+)/?', href)
-                if not sku_match: continue
-                sku_raw = sku_match.group(1)
-                sku = normalize_sku(sku_raw)
-                if sku in seen_skus: continue
-                seen_skus.add(sku)
-                link_title = link.get('title', '') or link.get_text(strip=True)
-                is_express = 'お急ぎ便' in link_title
-                page_products.append({'url': urljoin(BASE_URL, href), 'sku': sku, 'sku_raw': sku_raw, 'is_express': is_express})
-            products.extend(page_products)
-            next_link = soup.find('a', href=re.compile(f'c10_p{page_num + 1}'))
-            if next_link: page_num += 1
-            else: has_next_page = False
-        except Exception as e:
-            print(f"[ERROR] {e}"); has_next_page = False
-    unique = []; seen = set()
-    for p in products:
-        if p['sku'] not in seen: seen.add(p['sku']); unique.append(p)
-    return unique
-
-
-def scrape_product_detail(url):
+def card_price(card):
+    """列表商品卡上的價格（只認單一商品的卡片）；找不到回傳 0"""
+    if card is None or len(card_goods(card)) > 1: return 0
+    m = CARD_PRICE_RX.search(card.get_text(' '))
+    return int((m.group(1) or m.group(2)).replace(',', '')) if m else 0
+
+
+def listed_in_stock(item, cache=None):
+    """列表頁判斷得出來就直接用，判斷不了才抓詳情頁"""
+    if item.get('list_stock') is not None:
+        scrape_status['list_hits'] = scrape_status.get('list_hits', 0) + 1; return item['list_stock']
+    scrape_status['detail_checks'] = scrape_status.get('detail_checks', 0) + 1
+    html = sucrey_fetch(item['url'], cache=cache)
+    return STOCK_RULE(BeautifulSoup(html, 'html.parser')) if html else True
+
+
+# ========== 庫存判定（商品區塊內單次多關鍵字掃描） ==========
+class StockDetector:
+    """缺貨關鍵字編成一條 alternation regex，只在商品 / 購物車區塊內掃一次，
+    頁尾、推薦商品裡的「品切れ」不會誤判。region 依序嘗試，第一個命中的 selector 為準，
+    全部沒命中時退回整頁文字（舊行為）。
+    判定順序沿用小倉：缺貨字 → 在庫 ○△× → 購物車（正向訊號，看整頁）→ 缺貨 class"""
+    def __init__(self, sold_out, region=(), marker=r'在庫[：:]\s*([○△×])',
+                 cart=None, cart_text=None, sold_out_css=None):
+        self.sold_out = re.compile('|'.join(map(re.escape, sold_out)))
+        self.region = region; self.marker = re.compile(marker) if marker else None
+        self.cart = cart; self.cart_text = cart_text; self.sold_out_css = sold_out_css
+
+    def scope(self, soup):
+        for sel in self.region:
+            nodes = soup.select(sel)
+            if nodes: return nodes
+        return None
+
+    def __call__(self, soup, page_text=None):
+        nodes = self.scope(soup)
+        if page_text is None and (not nodes or self.cart_text): page_text = soup.get_text()
+        text = '\n'.join(n.get_text() for n in nodes) if nodes else page_text
+        if self.sold_out.search(text): return False
+        if self.marker:
+            m = self.marker.search(text)
+            if m: return m.group(1) != '×'
+        if (self.cart or self.cart_text) and not (
+                (self.cart and soup.select_one(self.cart)) or (self.cart_text and self.cart_text in page_text)):
+            return False
+        if self.sold_out_css and any(n.select_one(self.sold_out_css) for n in (nodes or [soup])): return False
+        return True
+
+
+ECBEING_REGION = ('.pane-goods-right-side', '.block-goods-detail')  # ecbeing 商品頁右欄（名稱 / 價格 / 在庫 / 購物車）
+STOCK_RULE = StockDetector(['品切れ', '在庫なし', 'SOLD OUT'], ECBEING_REGION)
+
+
+def scrape_product_detail(url, cache=None):
     product = {
         'url': url, 'title': '', 'price': 0, 'description': '', 'box_size_text': '',
         'weight': 0, 'images': [], 'in_stock': True, 'is_point_product': False, 'is_express': False,
@@ -387,10 +956,11 @@ def scrape_product_detail(url):
         product['sku_raw'] = sku_match.group(1)
         product['sku'] = normalize_sku(product['sku_raw'])
     try:
-        response = requests.get(url, headers=HEADERS, timeout=30)
-        if response.status_code != 200: return product
-        soup = BeautifulSoup(response.text, 'html.parser')
-        page_text = soup.get_text()
+        html = sucrey_fetch(url, cache=cache)
+        if not html: return product
+        doc = PageDoc(html)
+        soup = doc.soup
+        page_text = doc.text
         title_el = soup.find('h1')
         if title_el: product['title'] = title_el.get_text(strip=True)
         if 'お急ぎ便' in product['title']:
@@ -406,20 +976,14 @@ def scrape_product_detail(url):
             if not product['price']:
                 pm = re.search(r'(\d{1,3}(?:,\d{3})*)\s*円', page_text)
                 if pm: product['price'] = int(pm.group(1).replace(',', ''))
-        all_dt = soup.find_all('dt'); all_dd = soup.find_all('dd')
-        for i, dt in enumerate(all_dt):
-            try:
-                dt_text = dt.get_text(strip=True)
-                if i < len(all_dd):
-                    dd_text = all_dd[i].get_text(strip=True)
-                    if '内容' in dt_text: product['content'] = dd_text
-                    elif '箱サイズ' in dt_text or 'サイズ' in dt_text:
-                        product['box_size_text'] = dd_text
-                        size_info = parse_box_size(dd_text)
-                        if size_info: product['weight'] = size_info.get('volume_weight', 0)
-                    elif '賞味期限' in dt_text: product['shelf_life'] = dd_text
-                    elif 'アレルギー' in dt_text or '特定原材料' in dt_text: product['allergens'] = dd_text[:200]
-            except: continue
+        for dt_text, dd_text in doc.pairs:
+            if '内容' in dt_text: product['content'] = dd_text
+            elif '箱サイズ' in dt_text or 'サイズ' in dt_text:
+                product['box_size_text'] = dd_text
+                size_info = parse_box_size(dd_text)
+                if size_info: product['weight'] = size_info.get('volume_weight', 0)
+            elif '賞味期限' in dt_text: product['shelf_life'] = dd_text
+            elif 'アレルギー' in dt_text or '特定原材料' in dt_text: product['allergens'] = dd_text[:200]
         desc_parts = []
         for cn in ['item-description', 'product-description', 'detail-text']:
             el = soup.find('div', class_=cn)
@@ -433,15 +997,15 @@ def scrape_product_detail(url):
         for prefix in ['L', '2', '3', '4', 'D1', 'D2', 'D3', 'D4', 'D5', 'D6', 'D7', 'D8']:
             img_url = f"{BASE_URL}/img/goods/{prefix}/{sku_raw}.jpg"
             try:
-                if requests.head(img_url, headers=HEADERS, timeout=5).status_code == 200: images.append(img_url)
+                if client.head(img_url, headers=HEADERS, timeout=5).status_code == 200: images.append(img_url)
             except: pass
         if not images:
-            for img in soup.find_all('img', src=re.compile(sku_raw)):
+            for img in doc.images:
                 src = img.get('src', '')
-                if src and src not in images:
+                if src and sku_raw in src and src not in images:
                     images.append(urljoin(BASE_URL, src) if not src.startswith('http') else src)
         product['images'] = images
-        if any(kw in page_text for kw in ['品切れ', '在庫なし', 'SOLD OUT']): product['in_stock'] = False
+        product['in_stock'] = STOCK_RULE(soup, page_text)
     except Exception as e:
         print(f"[ERROR] 爬取商品詳細失敗: {e}")
     return product
@@ -476,7 +1040,6 @@ def upload_to_shopify(product, collection_id=None):
         result = download_image_to_base64(img_url)
         if result['success']:
             images_base64.append({'attachment': result['base64'], 'position': idx + 1, 'filename': f"francais_{product['sku']}_{idx+1}.jpg"})
-        time.sleep(0.5)
 
     shopify_product = {
         'product': {
@@ -493,12 +1056,12 @@ def upload_to_shopify(product, collection_id=None):
         }
     }
 
-    response = requests.post(shopify_api_url('products.json'), headers=get_shopify_headers(), json=shopify_product)
+    response = client.post(shopify_api_url('products.json'), headers=get_shopify_headers(), json=shopify_product)
     if response.status_code == 201:
         created = response.json()['product']
         product_id = created['id']
         variant_id = created['variants'][0]['id']
-        requests.put(shopify_api_url(f'variants/{variant_id}.json'), headers=get_shopify_headers(),
+        client.put(shopify_api_url(f'variants/{variant_id}.json'), headers=get_shopify_headers(),
                      json={'variant': {'id': variant_id, 'cost': f"{cost:.2f}"}})
         if collection_id: add_product_to_collection(product_id, collection_id)
         publish_to_all_channels(product_id)
@@ -523,7 +1086,7 @@ def run_update_shipping():
         pids = []
         url = shopify_api_url("products.json?limit=250&vendor=Francais&fields=id,body_html")
         while url:
-            r = requests.get(url, headers=get_shopify_headers())
+            r = client.get(url, headers=get_shopify_headers())
             if r.status_code != 200:
                 update_shipping_status["errors"].append(f"取得商品列表失敗: {r.status_code}")
                 break
@@ -539,7 +1102,7 @@ def run_update_shipping():
                 if "國際運費" in body:
                     update_shipping_status["skipped"] += 1
                     continue
-                ru = requests.put(
+                ru = client.put(
                     shopify_api_url(f"products/{pid}.json"),
                     headers=get_shopify_headers(),
                     json={"product": {"id": pid, "body_html": body + SHIPPING_HTML}}
@@ -868,7 +1431,7 @@ def api_scan_japanese():
     products = []
     url = shopify_api_url("products.json?limit=250&vendor=Francais")
     while url:
-        response = requests.get(url, headers=get_shopify_headers())
+        response = client.get(url, headers=get_shopify_headers())
         if response.status_code != 200: break
         data = response.json()
         for p in data.get('products', []):
@@ -897,7 +1460,7 @@ def api_retranslate_product():
     product_id = data.get('product_id')
     if not product_id: return jsonify({'error': '缺少 product_id'}), 400
     url = shopify_api_url(f"products/{product_id}.json")
-    response = requests.get(url, headers=get_shopify_headers())
+    response = client.get(url, headers=get_shopify_headers())
     if response.status_code != 200: return jsonify({'error': f'無法取得商品: {response.status_code}'}), 400
     product = response.json().get('product', {})
     old_title = product.get('title', ''); old_body = product.get('body_html', '')
@@ -930,7 +1493,9 @@ def api_delete_product():
 
 @app.route('/api/status')
 def get_status():
-    return jsonify(scrape_status)
+    return jsonify({**scrape_status, 'pacing': pacer_snapshot(), 'retries': retry_budget.snapshot(),
+                    'translation_cache': translation_cache.snapshot(),
+                    'openai': openai_budget.snapshot()})
 
 
 @app.route('/api/test-translate')
@@ -946,11 +1511,19 @@ def test_translate():
 @app.route('/api/test-shopify')
 def test_shopify():
     if not load_shopify_token(): return jsonify({'success': False, 'error': '找不到 Token'})
-    response = requests.get(shopify_api_url('shop.json'), headers=get_shopify_headers())
+    response = client.get(shopify_api_url('shop.json'), headers=get_shopify_headers())
     if response.status_code == 200: return jsonify({'success': True, 'shop': response.json()['shop']})
     else: return jsonify({'success': False, 'error': response.text}), 400
 
 
+@app.route('/api/test-size')
+def test_size():
+    rows = [{'text': t, 'expected': [aw, fw], 'got': [r['actual_weight'], r['final_weight']]}
+            for t, aw, fw in SIZE_FIXTURES for r in [SIZE_RULE(t)]]
+    failed = [r for r in rows if r['expected'] != r['got']]
+    return jsonify({'success': not failed, 'total': len(rows), 'failed': failed})
+
+
 @app.route('/api/start-scrape', methods=['POST'])
 def start_scrape():
     global scrape_status
@@ -977,6 +1550,8 @@ def api_start():
 
 def run_scrape():
     global scrape_status
+    retry_budget.reset()
+    pages = {}  # 本輪自己的頁面快取，不與同時在跑的其他工作共用，結束即丟
     try:
         scrape_status = {
             "running": True, "progress": 0, "total": 0,
@@ -998,40 +1573,37 @@ def run_scrape():
         collection_skus = set(collection_products_map.keys())
 
         scrape_status['current_product'] = "正在爬取商品列表..."
-        product_list = scrape_product_list()
-        scrape_status['total'] = len(product_list)
-
-        website_skus = set(item['sku'] for item in product_list)
-        express_skus = set(item['sku'] for item in product_list if item.get('is_express'))
+        website_skus = set()
+        express_skus = set()
 
         # === v2.2: 記錄缺貨的 SKU ===
         out_of_stock_skus = set()
 
         consecutive_translation_failures = 0
 
-        for idx, item in enumerate(product_list):
+        for idx, item in enumerate(crawl_sucrey_listing(SUCREY_BRAND, pages)):
+            website_skus.add(item['sku']); scrape_status['total'] = len(website_skus)
             scrape_status['progress'] = idx + 1
             scrape_status['current_product'] = f"處理中: {item['sku']}"
 
             # お急ぎ便商品：跳過不上架，記錄為需刪除
             if item.get('is_express'):
+                express_skus.add(item['sku'])
                 scrape_status['skipped'] += 1
                 continue
 
             # 已存在於 Shopify
             if item['sku'] in existing_skus:
-                # === v2.2: 已上架商品檢查庫存 ===
+                # === v2.2: 已上架商品檢查庫存（v2.6: 列表頁判斷得出來就不抓詳情頁）===
                 if item['sku'] in collection_skus:
-                    product = scrape_product_detail(item['url'])
-                    if product and not product.get('in_stock', True):
+                    if not listed_in_stock(item, pages):
                         out_of_stock_skus.add(item['sku'])
                         print(f"[缺貨偵測] {item['sku']} 官網缺貨，稍後刪除")
-                    time.sleep(0.5)
                 scrape_status['skipped_exists'] += 1
                 scrape_status['skipped'] += 1
                 continue
 
-            product = scrape_product_detail(item['url'])
+            product = scrape_product_detail(item['url'], cache=pages)
 
             # === v2.2: 缺貨 → 不上架，記錄 SKU ===
             if not product.get('in_stock', True):
@@ -1062,7 +1634,6 @@ def run_scrape():
                 scrape_status['errors'].append({'sku': product['sku'], 'error': result['error']})
                 consecutive_translation_failures = 0
 
-            time.sleep(1)
 
         if not scrape_status['translation_stopped']:
             scrape_status['current_product'] = "清理缺貨/下架/お急ぎ便商品..."
@@ -1089,7 +1660,6 @@ def run_scrape():
                             print(f"[已刪除] SKU: {sku}, Product ID: {pid}")
                         else:
                             scrape_status['errors'].append({'sku': sku, 'error': '刪除失敗'})
-                    time.sleep(0.3)
 
     except Exception as e:
         scrape_status['errors'].append({'error': str(e)})
@@ -1098,9 +1668,121 @@ def run_scrape():
         scrape_status['current_product'] = "完成" if not scrape_status['translation_stopped'] else "翻譯異常停止"
 
 
+# ========== 售價快速同步（只看列表價） ==========
+def run_price_sync():
+    """列表頁的價格一次收齊，和 collection 的 SKU 索引比對，只 PUT 售價有差的 variant。
+    不抓詳情頁、不翻譯、不碰圖片；列表上找不到價格或低於門檻的 SKU 不動"""
+    global scrape_status
+    retry_budget.reset()
+    pages = {}  # 本輪自己的頁面快取，不與同時在跑的其他工作共用，結束即丟
+    try:
+        scrape_status = {
+            "running": True, "mode": "prices", "progress": 0, "total": 0,
+            "current_product": "", "products": [], "errors": [],
+            "uploaded": 0, "skipped": 0, "skipped_exists": 0,
+            "filtered_by_price": 0, "out_of_stock": 0, "deleted": 0,
+            "price_checked": 0, "price_updated": 0,
+            "translation_failed": 0, "translation_stopped": False
+        }
+        scrape_status['current_product'] = "取得 Collection 售價..."
+        variants = get_collection_products_map(get_or_create_collection("Francais"), variants=True)
+        scrape_status['total'] = len(variants)
+        for item in crawl_sucrey_listing(SUCREY_BRAND, pages):
+            info = variants.get(item['sku']); cost = item.get('list_price', 0)
+            if not info or item.get('is_points') or cost < MIN_PRICE: continue
+            scrape_status['progress'] += 1; scrape_status['price_checked'] += 1
+            scrape_status['current_product'] = f"售價: {item['sku']}"
+            new_price = calculate_selling_price(cost)
+            if abs(new_price - info['price']) < 1: continue
+            r = client.put(shopify_api_url(f"variants/{info['variant_id']}.json"), headers=get_shopify_headers(),
+                           json={'variant': {'id': info['variant_id'], 'price': f"{new_price:.2f}", 'cost': f"{cost:.2f}"}})
+            if r.status_code == 200:
+                scrape_status['price_updated'] += 1
+                print(f"[售價] {item['sku']}: {info['price']:.0f} → {new_price:.0f}")
+            else:
+                scrape_status['errors'].append({'sku': item['sku'], 'error': f'售價更新失敗 {r.status_code}'})
+        print(f"[售價] 比對 {scrape_status['price_checked']} 筆、更新 {scrape_status['price_updated']} 筆")
+        scrape_status['current_product'] = "完成"
+    except Exception as e:
+        scrape_status['errors'].append({'error': str(e)})
+    finally:
+        scrape_status['running'] = False
+
+
+@app.route('/api/sync-prices', methods=['POST'])
+def api_sync_prices():
+    if scrape_status['running']: return jsonify({'success': False, 'error': '爬取正在進行中'})
+    if not load_shopify_token(): return jsonify({'success': False, 'error': '找不到 Token'})
+    threading.Thread(target=run_price_sync).start()
+    return jsonify({'success': True, 'message': '售價同步已啟動'})
+
+# ========== 庫存快掃 ==========
+def run_stock_sweep():
+    """只看已上架（collection 內）商品的庫存：列表頁判斷得出來的直接採用，判斷不了的才抓詳情頁，缺貨即刪除。
+    不上架、不翻譯、不處理官網消失的商品（留給完整爬取）"""
+    global scrape_status
+    retry_budget.reset()
+    pages = {}  # 本輪自己的頁面快取，不與同時在跑的其他工作共用，結束即丟
+    try:
+        scrape_status = {
+            "running": True, "mode": "stock", "progress": 0, "total": 0,
+            "current_product": "", "products": [], "errors": [],
+            "uploaded": 0, "skipped": 0, "skipped_exists": 0,
+            "filtered_by_price": 0, "out_of_stock": 0, "deleted": 0,
+            "list_hits": 0, "detail_checks": 0,
+            "translation_failed": 0, "translation_stopped": False
+        }
+        scrape_status['current_product'] = "取得 Collection 商品..."
+        cpm = get_collection_products_map(get_or_create_collection("Francais"))
+        scrape_status['total'] = len(cpm)
+        for item in crawl_sucrey_listing(SUCREY_BRAND, pages):
+            pid = cpm.get(item['sku'])
+            if not pid: continue
+            scrape_status['progress'] += 1
+            scrape_status['current_product'] = f"庫存: {item['sku']}"
+            if listed_in_stock(item, pages): continue
+            scrape_status['out_of_stock'] += 1
+            if delete_product(pid):
+                scrape_status['deleted'] += 1
+                print(f"[快掃-已刪除] SKU: {item['sku']}, Product ID: {pid}")
+            else:
+                scrape_status['errors'].append({'sku': item['sku'], 'error': '刪除失敗'})
+        print(f"[快掃] 列表判定 {scrape_status['list_hits']} 筆、詳情頁 {scrape_status['detail_checks']} 筆、刪除 {scrape_status['deleted']} 筆")
+        scrape_status['current_product'] = "完成"
+    except Exception as e:
+        scrape_status['errors'].append({'error': str(e)})
+    finally:
+        scrape_status['running'] = False
+
+
+@app.route('/api/stock-sweep', methods=['POST'])
+def api_stock_sweep():
+    if scrape_status['running']: return jsonify({'success': False, 'error': '爬取正在進行中'})
+    if not load_shopify_token(): return jsonify({'success': False, 'error': '找不到 Token'})
+    threading.Thread(target=run_stock_sweep).start()
+    return jsonify({'success': True, 'message': '庫存快掃已啟動'})
+
+
+def start_stock_sweep_scheduler():
+    """每 STOCK_SWEEP_MINUTES 分鐘快掃一次；完整爬取進行中就跳過這一輪"""
+    def loop():
+        while True:
+            time.sleep(STOCK_SWEEP_MINUTES * 60)
+            try:
+                if not scrape_status['running'] and load_shopify_token(): run_stock_sweep()
+            except Exception as e:
+                print(f"[快掃排程] 錯誤: {e}")
+    threading.Thread(target=loop, daemon=True).start()
+    print(f"[快掃排程] 已啟動（每 {STOCK_SWEEP_MINUTES} 分鐘）")
+
+
+if STOCK_SWEEP_MINUTES > 0:
+    start_stock_sweep_scheduler()
+
+
 if __name__ == '__main__':
     print("=" * 50)
-    print("Francais 爬蟲工具 v2.2")
+    print("Francais 爬蟲工具 v3.0")
     print("新增: 缺貨商品自動刪除（官網消失、缺貨、お急ぎ便皆刪除）")
     print("=" * 50)
     port = int(os.environ.get('PORT', 8080))
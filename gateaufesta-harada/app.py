@@ -1,5 +1,5 @@
 """
-ガトーフェスタ ハラダ (Gateau Festa Harada) 商品爬蟲 + Shopify 上架工具 v2.2
+ガトーフェスタ ハラダ (Gateau Festa Harada) 商品爬蟲 + Shopify 上架工具 v2.8
 功能：
 1. 爬取 shop.gateaufesta-harada.com 所有分類商品
 2. 計算材積重量 vs 實際重量，取大值
@@ -8,17 +8,34 @@
 5. OpenAI 翻譯成繁體中文
 6. 【v2.1】翻譯保護機制、日文商品掃描
 7. 【v2.2】缺貨商品自動刪除 - 官網消失或缺貨皆直接刪除
+8. 【v2.3】庫存檢查改為串流早停抓取（命中缺貨字 / 商品區塊結束即停）
+9. 【v2.4】庫存快掃（/api/stock-sweep、STOCK_SWEEP_MINUTES）- 庫存取自列表頁徽章 / 購物車按鈕，判斷不了才抓商品頁
+10. 【v2.5】售價快速同步（/api/sync-prices）- 售價取自列表頁，只更新有差的 variant，不抓詳情、不翻譯
+11. 【v2.6】翻譯快取 - 依 prompt 指紋 + 標題 + 清理後說明的 hash 存檔（translation_cache.json），LRU 上限，/api/status 回報命中率
+12. 【v2.7】批次翻譯：預抓到的新商品每 TRANSLATE_BATCH_SIZE 個打包成一次 gpt-4o-mini 請求（JSON 以 SKU 為 key），逐筆驗證、沒過的退回單筆；修正 prompt JSON 範例大括號造成的 f-string 錯誤
+13. 【v2.8】翻譯 worker pool：TRANSLATE_WORKERS 條執行緒並行翻譯，OpenAI 請求改走獨立 keep-alive 連線池，受 OPENAI_RPM / OPENAI_TPM 預算控管，429 依 Retry-After 全部暫停後重送
 """
 
 from flask import Flask, jsonify, request
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import re
+import unicodedata
+import math
 import json
 import os
 import time
-from urllib.parse import urljoin
+import random
+from urllib.parse import urljoin, urlparse
 import threading
+import hashlib
+import atexit
+from collections import OrderedDict
+from functools import wraps
+import codecs
+from html.parser import HTMLParser
+from concurrent.futures import ThreadPoolExecutor, Future
 import base64
 
 app = Flask(__name__)
@@ -47,6 +64,233 @@ HEADERS = {
     'Connection': 'keep-alive',
 }
 
+# ========== 每個 origin 的自適應節流（AIMD） ==========
+
+class OriginPacer:
+    """依回應延遲、429/503 與錯誤率調整請求間隔與併發：
+    順利時間隔線性遞減、併發逐步 +1；被限流 / 出錯時間隔加倍、併發減半"""
+    MIN_DELAY, MAX_DELAY, MAX_LIMIT = 0.05, 30.0, 8
+
+    def __init__(self, host, delay=0.5, limit=2):
+        self.host = host; self.delay = delay; self.limit = limit
+        self.active = 0; self.next_at = 0.0; self.streak = 0
+        self.latency = 0.0; self.ok = 0; self.throttled = 0; self.errors = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.active >= self.limit: self.cond.wait()
+            self.active += 1
+            now = time.time(); start = max(now, self.next_at)
+            self.next_at = start + self.delay
+        if start > now: time.sleep(start - now)
+
+    def release(self, status, elapsed, retry_after=None):
+        with self.cond:
+            self.active -= 1
+            slow = self.latency > 0 and elapsed > self.latency * 3
+            self.latency = elapsed if not self.latency else self.latency * 0.8 + elapsed * 0.2
+            if status is None or status in (429, 503) or status >= 500:
+                if status in (429, 503): self.throttled += 1
+                else: self.errors += 1
+                self.delay = min(self.MAX_DELAY, max(self.delay * 2, retry_after or 0, 0.5))
+                self.limit = max(1, self.limit // 2); self.streak = 0
+                self.next_at = max(self.next_at, time.time() + self.delay)
+            elif slow:
+                self.ok += 1; self.streak = 0
+                self.delay = min(self.MAX_DELAY, self.delay * 1.5)
+            else:
+                self.ok += 1; self.streak += 1
+                self.delay = max(self.MIN_DELAY, self.delay - 0.05)
+                if self.streak >= self.limit * 4 and self.limit < self.MAX_LIMIT:
+                    self.limit += 1; self.streak = 0
+            self.cond.notify_all()
+
+    def snapshot(self):
+        return {'delay': round(self.delay, 2), 'rate_per_sec': round(1 / self.delay, 2),
+                'concurrency': self.limit, 'active': self.active, 'latency': round(self.latency, 2),
+                'ok': self.ok, 'throttled': self.throttled, 'errors': self.errors}
+
+
+origin_pacers = {}
+origin_pacers_lock = threading.Lock()
+
+
+def pacer_for(url):
+    host = urlparse(url).netloc
+    with origin_pacers_lock:
+        if host not in origin_pacers: origin_pacers[host] = OriginPacer(host)
+        return origin_pacers[host]
+
+
+def pacer_snapshot():
+    return {h: p.snapshot() for h, p in list(origin_pacers.items())}
+
+
+# ========== 重試（指數退避 + jitter、每輪預算）與 hedged request ==========
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'}
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "true").lower() == "true"
+
+
+class RetryBudget:
+    """每輪爬取可用的重試 / hedge 次數上限，避免官網故障時重試把流量放大"""
+    def __init__(self, limit=200):
+        self.limit = limit; self.used = 0; self.hedged = 0; self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock: self.used = 0; self.hedged = 0
+
+    def take(self):
+        with self.lock:
+            if self.used >= self.limit: return False
+            self.used += 1; return True
+
+    def snapshot(self):
+        return {'used': self.used, 'limit': self.limit, 'hedged': self.hedged}
+
+
+retry_budget = RetryBudget()
+hedge_pool = ThreadPoolExecutor(max_workers=4)
+
+
+def retry_after_of(r):
+    ra = r.headers.get('Retry-After', '')
+    return float(ra) if ra.isdigit() else None
+
+
+def backoff_delay(attempt, retry_after=None, base=0.5, cap=20.0):
+    """指數退避 + full jitter；有 Retry-After 時不低於它"""
+    return max(random.uniform(0, min(cap, base * (2 ** attempt))), retry_after or 0)
+
+
+class PacedSession(requests.Session):
+    """所有請求先經過該 origin 的 OriginPacer，回應再回饋給它；
+    冪等請求遇到連線錯誤 / 429 / 5xx 時退避重試（POST 一律不重試）"""
+    def send_paced(self, method, url, *args, on_send=None, **kwargs):
+        pacer = pacer_for(url); pacer.acquire()
+        if on_send: on_send()
+        t = time.time(); status = None; retry_after = None
+        try:
+            r = super().request(method, url, *args, **kwargs)
+            status = r.status_code; retry_after = retry_after_of(r)
+            return r
+        finally:
+            pacer.release(status, time.time() - t, retry_after)
+
+    def request(self, method, url, *args, retries=3, **kwargs):
+        retryable = method.upper() in IDEMPOTENT_METHODS; attempt = 0
+        while True:
+            try:
+                r = self.send_paced(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not (retryable and attempt < retries and retry_budget.take()): raise
+                wait = backoff_delay(attempt); reason = type(e).__name__
+            else:
+                if r.status_code not in RETRY_STATUSES: return r
+                if not (retryable and attempt < retries and retry_budget.take()): return r
+                wait = backoff_delay(attempt, retry_after_of(r)); reason = r.status_code
+            print(f"[重試] {method} {url} ({reason}) 第 {attempt + 1} 次，{wait:.1f}s 後重送")
+            time.sleep(wait); attempt += 1
+
+    def get_hedged(self, url, hedge_after=None, **kwargs):
+        """慢速詳情頁：主請求在呼叫端執行緒直接送出，真正送出（通過 pacer）後超過 hedge_after 秒
+        （預設為該 origin 平均延遲 2 倍）仍未回應，才把備援請求丟進 hedge_pool；主請求失敗時改用備援的結果。
+        主請求不進 pool，pool 滿載時排隊的時間不會被算成慢回應而多送一份"""
+        if not HEDGE_ENABLED or hedge_pool is None: return self.get(url, **kwargs)
+        pacer = pacer_for(url)
+        hedge_after = hedge_after or max(2.0, pacer.latency * 2)
+        lock = threading.Lock(); state = {'done': False, 'timer': None, 'hedge': None}
+
+        def fire():
+            with lock:
+                if state['done'] or not retry_budget.take(): return
+                with retry_budget.lock: retry_budget.hedged += 1
+                state['hedge'] = hedge_pool.submit(self.get, url, **kwargs)
+
+        def on_send():  # 主請求重試時會再經過 pacer，計時只從第一次送出開始
+            with lock:
+                if state['timer'] or state['done']: return
+                state['timer'] = threading.Timer(hedge_after, fire); state['timer'].daemon = True
+                state['timer'].start()
+
+        error = None
+        try: r = self.get(url, on_send=on_send, **kwargs)
+        except Exception as e: r = None; error = e
+        with lock:
+            state['done'] = True
+            if state['timer']: state['timer'].cancel()
+        hedge = state['hedge']
+        if hedge and (error or r.status_code in RETRY_STATUSES):
+            try: return hedge.result()
+            except Exception: pass
+        if error: raise error
+        return r
+
+
+client = PacedSession()  # 所有對外請求（官網 / Shopify / OpenAI / 圖片）
+
+
+# ========== 串流早停抓取（只需要 head meta / 庫存區塊時不下載整頁） ==========
+class PageSniffer(HTMLParser):
+    """邊下載邊解析：收集 <meta>，並只在 region 區塊內找缺貨關鍵字；
+    需要的 meta 到手（或 </head> 已過）且區塊結束、或已命中缺貨字 → done。
+    找不到 region 時退回整頁比對（與舊行為相同）"""
+    def __init__(self, metas=(), region=None, keywords=()):
+        super().__init__(convert_charrefs=True)
+        self.want = set(metas); self.meta = {}; self.head_done = False
+        self.region = region; self.keywords = keywords
+        self.region_tag = None; self.depth = 0; self.region_seen = False
+        self.region_done = region is None
+        self.sold_out = False; self.page_hit = False
+
+    def handle_starttag(self, tag, attrs):
+        a = dict(attrs)
+        if tag == 'meta':
+            key = a.get('property') or a.get('name') or a.get('itemprop')
+            if key and key not in self.meta: self.meta[key] = a.get('content') or ''
+        elif self.region_tag:
+            if tag == self.region_tag: self.depth += 1
+        elif self.region and not self.region_done and self.region[1] in (a.get(self.region[0]) or '').split():
+            self.region_tag = tag; self.depth = 1; self.region_seen = True
+
+    def handle_endtag(self, tag):
+        if tag == 'head': self.head_done = True
+        if self.region_tag and tag == self.region_tag:
+            self.depth -= 1
+            if not self.depth: self.region_tag = None; self.region_done = True
+
+    def handle_data(self, data):
+        if not any(kw in data for kw in self.keywords): return
+        self.page_hit = True
+        if self.region_tag or self.region is None: self.sold_out = True
+
+    @property
+    def done(self):
+        return self.sold_out or ((self.head_done or self.want <= self.meta.keys()) and self.region_done)
+
+    @property
+    def in_stock(self):
+        return not (self.sold_out if self.region_seen or self.region is None else self.page_hit)
+
+
+def sniff_page(sess, url, sniffer, encoding=None, chunk_size=8192, **kwargs):
+    """stream=True 逐塊餵給 sniffer，done 就關閉連線不再讀；回傳 (status_code, sniffer)"""
+    r = sess.get(url, stream=True, **kwargs)
+    try:
+        if r.status_code != 200: return r.status_code, sniffer
+        charset = r.encoding if 'charset' in r.headers.get('Content-Type', '').lower() else None
+        dec = codecs.getincrementaldecoder(encoding or charset or 'utf-8')(errors='replace')
+        for chunk in r.iter_content(chunk_size):
+            sniffer.feed(dec.decode(chunk))
+            if sniffer.done: break
+        else:
+            sniffer.feed(dec.decode(b'', final=True)); sniffer.close()
+        return r.status_code, sniffer
+    finally:
+        r.close()
+
 scrape_status = {
     "running": False, "progress": 0, "total": 0,
     "current_product": "", "products": [], "errors": [],
@@ -113,16 +357,181 @@ def calculate_selling_price(cost):
     return round(cost + fee)
 
 
-def translate_with_chatgpt(title, description):
-    prompt = f"""你是專業的日本商品翻譯和 SEO 專家。將以下日本商品資訊翻譯成繁體中文並優化 SEO。
+# ========== OpenAI 連線池與 RPM / TPM 預算 ==========
+OPENAI_URL = "https://api.openai.com/v1/chat/completions"
+OPENAI_RPM = int(os.environ.get("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.environ.get("OPENAI_TPM", "200000"))
+OPENAI_RETRIES = int(os.environ.get("OPENAI_RETRIES", "4"))
+TRANSLATE_WORKERS = int(os.environ.get("TRANSLATE_WORKERS", "4"))
+
+
+class OpenAIBudget:
+    """每分鐘請求數 / token 數兩個 token bucket：送出前先扣預估 token（prompt 字數 + max_tokens），
+    回應後依 usage 多退少補；遇到 429 整個預算暫停，所有 worker 一起等"""
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm; self.tpm = tpm
+        self.requests = float(rpm); self.tokens = float(tpm); self.updated = time.time()
+        self.paused_until = 0.0; self.cond = threading.Condition()
+        self.sent = 0; self.throttled = 0; self.waited = 0.0; self.used_tokens = 0
+
+    def _refill(self):
+        now = time.time(); dt = now - self.updated; self.updated = now
+        self.requests = min(self.rpm, self.requests + dt * self.rpm / 60)
+        self.tokens = min(self.tpm, self.tokens + dt * self.tpm / 60)
+
+    def acquire(self, tokens):
+        tokens = min(tokens, self.tpm); t0 = time.time()
+        with self.cond:
+            while True:
+                self._refill(); now = time.time()
+                if now >= self.paused_until and self.requests >= 1 and self.tokens >= tokens:
+                    self.requests -= 1; self.tokens -= tokens; self.sent += 1; self.waited += now - t0
+                    return
+                self.cond.wait(max(0.05, self.paused_until - now, (1 - self.requests) * 60 / self.rpm,
+                                   (tokens - self.tokens) * 60 / self.tpm))
+
+    def settle(self, estimated, actual):
+        with self.cond:
+            self.tokens += estimated - actual; self.used_tokens += actual
+            self.cond.notify_all()
+
+    def pause(self, seconds):
+        with self.cond:
+            self.throttled += 1; self.paused_until = max(self.paused_until, time.time() + seconds)
+
+    def snapshot(self):
+        with self.cond:
+            self._refill()
+            return {'rpm': self.rpm, 'tpm': self.tpm, 'requests_left': int(self.requests), 'tokens_left': int(self.tokens),
+                    'sent': self.sent, 'throttled': self.throttled, 'waited_sec': round(self.waited, 1),
+                    'used_tokens': self.used_tokens, 'paused': max(0, round(self.paused_until - time.time(), 1))}
+
+
+openai_budget = OpenAIBudget(OPENAI_RPM, OPENAI_TPM)
+openai_session = requests.Session()  # 不走 OriginPacer，改由 openai_budget 控速；keep-alive 連線數對齊 worker 數
+openai_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=TRANSLATE_WORKERS + 2))
+
+
+def openai_chat(payload, timeout=60):
+    """送 chat/completions：先向 openai_budget 取得額度再從連線池送出；
+    429 依 Retry-After（沒有就指數退避）暫停整個預算後重送，5xx / 連線錯誤退避重送，回傳最後一個 response"""
+    est = sum(len(m['content']) for m in payload['messages']) + payload.get('max_tokens', 1000)
+    headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
+    for attempt in range(OPENAI_RETRIES + 1):
+        openai_budget.acquire(est)
+        try:
+            r = openai_session.post(OPENAI_URL, headers=headers, json=payload, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            openai_budget.settle(est, 0)
+            if attempt >= OPENAI_RETRIES: raise
+            wait = backoff_delay(attempt, base=1.0, cap=60.0); reason = type(e).__name__
+        else:
+            if r.status_code == 200:
+                try: used = r.json().get('usage', {}).get('total_tokens', est)
+                except ValueError: used = est
+                openai_budget.settle(est, used); return r
+            openai_budget.settle(est, 0)
+            if r.status_code not in RETRY_STATUSES or attempt >= OPENAI_RETRIES: return r
+            wait = backoff_delay(attempt, retry_after_of(r), base=1.0, cap=60.0); reason = r.status_code
+            if r.status_code == 429:
+                openai_budget.pause(wait)
+                print(f"[OpenAI] 429，全部翻譯暫停 {wait:.1f}s（第 {attempt + 1} 次）"); continue
+        print(f"[OpenAI] {reason}，第 {attempt + 1} 次，{wait:.1f}s 後重送")
+        time.sleep(wait)
+
+
+# ========== 翻譯快取（來源內容 hash） ==========
+TRANSLATION_CACHE_FILE = os.environ.get("TRANSLATION_CACHE_FILE", "translation_cache.json")
+TRANSLATION_CACHE_MAX = int(os.environ.get("TRANSLATION_CACHE_MAX", "3000"))
+TRANSLATION_PROMPT_VERSION = os.environ.get("TRANSLATION_PROMPT_VERSION", "1")  # 改這個值可讓舊快取全部失效
+
+
+class TranslationCache:
+    """翻譯結果以 sha256(prompt 指紋 + 標題 + 清理後說明 + 其他參數) 為 key 存成 JSON 檔，重啟後沿用；
+    LRU：超過 max_entries 淘汰最久沒用到的。只存成功且標題已無日文的結果"""
+    def __init__(self, path, max_entries=3000):
+        self.path = path; self.max_entries = max_entries; self.lock = threading.Lock()
+        self.hits = 0; self.misses = 0; self.evicted = 0; self.dirty = 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f: self.entries = OrderedDict(json.load(f))
+        except (OSError, ValueError):
+            self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1; return None
+            self.entries.move_to_end(key); self.hits += 1
+            return dict(self.entries[key])
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value; self.entries.move_to_end(key); self.dirty += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False); self.evicted += 1
+            if self.dirty >= 5: self._save()
+
+    def has(self, key):
+        with self.lock: return key in self.entries
+
+    def save(self):
+        with self.lock:
+            if self.dirty: self._save()
+
+    def _save(self):
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f: json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp, self.path); self.dirty = 0
+        except OSError as e:
+            print(f"[翻譯快取] 儲存失敗: {e}")
 
-商品名稱：{title}
-商品說明：{description[:1500] if description else ""}
+    def snapshot(self):
+        total = self.hits + self.misses
+        return {'entries': len(self.entries), 'max': self.max_entries, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0, 'evicted': self.evicted}
+
+
+translation_cache = TranslationCache(TRANSLATION_CACHE_FILE, TRANSLATION_CACHE_MAX)
+atexit.register(translation_cache.save)
+
+
+def translation_source(description):
+    """快取 key 用的說明文字：去掉 script / style / 標籤與多餘空白"""
+    text = re.sub(r'<(script|style)[^>]*>.*?</\1>', ' ', description or '', flags=re.S | re.I)
+    return re.sub(r'\s+', ' ', re.sub(r'<[^>]+>', ' ', text)).strip()
 
-只回傳此 JSON 格式，不加 markdown、不加任何其他文字：
-{"title":"翻譯後的商品名稱","description":"翻譯後的商品說明（HTML格式）","page_title":"SEO標題50字以內","meta_description":"SEO描述100字以內"}
 
-規則：
+def cached_translation(fn):
+    """translate_with_chatgpt 的快取層；prompt 指紋取自 TRANSLATION_* 常數與翻譯函式內的字串常數，
+    規則 / 詞彙表一改，舊快取自動失效"""
+    consts = [c for f in (fn, translation_input, translation_result) for c in f.__code__.co_consts if isinstance(c, str)]
+    fingerprint = hashlib.sha256(json.dumps([TRANSLATION_PROMPT_VERSION, TRANSLATION_SYSTEM, TRANSLATION_FORMAT,
+                                             TRANSLATION_RULES, consts], ensure_ascii=False)
+                                 .encode('utf-8')).hexdigest()[:16]
+
+    @wraps(fn)
+    def wrapper(title, description, *args, **kwargs):
+        key = translation_key(title, description, *args, **kwargs)
+        hit = translation_cache.get(key)
+        if hit: return hit
+        result = fn(title, description, *args, **kwargs)
+        if result.get('success') and not is_japanese_text(result.get('title', '')): translation_cache.put(key, result)
+        return result
+    wrapper.fingerprint = fingerprint
+    return wrapper
+
+
+def translation_key(title, description, *args, **kwargs):
+    """快取 key：prompt 指紋 + 標題 + 清理後說明 + 其他參數（批次翻譯也用同一個 key）"""
+    return hashlib.sha256(json.dumps([translate_with_chatgpt.fingerprint, title, translation_source(description), args, kwargs],
+                                     ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+# ========== 翻譯 prompt ==========
+TRANSLATION_SYSTEM = "你是專業的日本商品翻譯和 SEO 專家。你的輸出必須完全使用繁體中文和英文，絕對禁止出現任何日文字元。"
+TRANSLATION_FORMAT = '{"title":"翻譯後的商品名稱","description":"翻譯後的商品說明（HTML格式）","page_title":"SEO標題50字以內","meta_description":"SEO描述100字以內"}'
+TRANSLATION_RULES = """規則：
 1. 品牌背景：日本高崎知名西式甜點品牌，主打法式脆餅
 2. 標題開頭必須是「Gateau Festa Harada」，後接繁體中文商品名，不得省略
 3. 【強制禁止日文】所有輸出必須是繁體中文或英文，不可出現任何平假名或片假名
@@ -130,14 +539,38 @@ def translate_with_chatgpt(title, description):
 5. SEO 關鍵字必須自然融入，包含：Gateau Festa Harada、日本、法式脆餅、伴手禮、送禮
 6. 只回傳 JSON，不得有任何其他文字"""
 
+
+def translation_input(description):
+    """送進 prompt 的商品說明"""
+    return (description or '')[:1500]
+
+
+def translation_result(t, title, description):
+    """模型回傳的 JSON → 上架用的翻譯結果（單筆 / 批次共用）"""
+    tt = t.get('title', title)
+    if not tt.startswith('Gateau Festa Harada'): tt = f"Gateau Festa Harada {tt}"
+    return {'success': True, 'title': tt, 'description': t.get('description', description),
+            'page_title': t.get('page_title', ''), 'meta_description': t.get('meta_description', '')}
+
+
+@cached_translation
+def translate_with_chatgpt(title, description):
+    prompt = f"""你是專業的日本商品翻譯和 SEO 專家。將以下日本商品資訊翻譯成繁體中文並優化 SEO。
+
+商品名稱：{title}
+商品說明：{translation_input(description)}
+
+只回傳此 JSON 格式，不加 markdown、不加任何其他文字：
+{TRANSLATION_FORMAT}
+
+{TRANSLATION_RULES}"""
+
     try:
-        response = requests.post(
-            "https://api.openai.com/v1/chat/completions",
-            headers={"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"},
-            json={
+        response = openai_chat(
+            {
                 "model": "gpt-4o-mini",
                 "messages": [
-                    {"role": "system", "content": "你是專業的日本商品翻譯和 SEO 專家。你的輸出必須完全使用繁體中文和英文，絕對禁止出現任何日文字元。"},
+                    {"role": "system", "content": TRANSLATION_SYSTEM},
                     {"role": "user", "content": prompt}
                 ],
                 "temperature": 0, "max_tokens": 1000
@@ -147,11 +580,7 @@ def translate_with_chatgpt(title, description):
             if content.startswith('```'): content = content.split('\n', 1)[1]
             if content.endswith('```'): content = content.rsplit('```', 1)[0]
             translated = json.loads(content.strip())
-            trans_title = translated.get('title', title)
-            if not trans_title.startswith('Gateau Festa Harada'):
-                trans_title = f"Gateau Festa Harada {trans_title}"
-            return {'success': True, 'title': trans_title, 'description': translated.get('description', description),
-                    'page_title': translated.get('page_title', ''), 'meta_description': translated.get('meta_description', '')}
+            return translation_result(translated, title, description)
         else:
             return {'success': False, 'error': f"HTTP {response.status_code}: {response.text[:200]}",
                     'title': f"Gateau Festa Harada {title}", 'description': description, 'page_title': '', 'meta_description': ''}
@@ -160,18 +589,118 @@ def translate_with_chatgpt(title, description):
                 'description': description, 'page_title': '', 'meta_description': ''}
 
 
+# ========== 批次翻譯 ==========
+TRANSLATE_BATCH_SIZE = int(os.environ.get("TRANSLATE_BATCH_SIZE", "5"))  # 1 = 不打包，一筆一個請求（仍並行）
+
+
+def translate_batch(items):
+    """items: [(sku, title, description)] → 一次請求翻譯多個商品，回傳 {sku: 翻譯結果}；
+    每筆各自驗證（標題 / 說明齊全、標題無日文），沒過的不放進結果，由呼叫端退回單筆翻譯"""
+    blocks = "\n\n".join(f"SKU：{sku}\n商品名稱：{title}\n商品說明：{translation_input(description)}"
+                         for sku, title, description in items)
+    prompt = f"""你是專業的日本商品翻譯和 SEO 專家。將以下 {len(items)} 個日本商品資訊各自翻譯成繁體中文並優化 SEO。
+
+{blocks}
+
+只回傳一個 JSON 物件，key 為各商品的 SKU，value 為該商品的翻譯結果，不加 markdown、不加任何其他文字：
+{{"SKU":{TRANSLATION_FORMAT}}}
+
+{TRANSLATION_RULES}
+7. 每個 SKU 各自翻譯，不可合併或混用其他商品的內容"""
+    r = openai_chat({"model": "gpt-4o-mini", "messages": [
+            {"role": "system", "content": TRANSLATION_SYSTEM},
+            {"role": "user", "content": prompt}], "temperature": 0, "max_tokens": min(16000, 1000 * len(items)),
+            "response_format": {"type": "json_object"}}, timeout=60 + 20 * len(items))
+    if r.status_code != 200:
+        print(f"[批次翻譯] HTTP {r.status_code}: {r.text[:200]}"); return {}
+    c = r.json()['choices'][0]['message']['content'].strip()
+    if c.startswith('```'): c = c.split('\n', 1)[1]
+    if c.endswith('```'): c = c.rsplit('```', 1)[0]
+    data = json.loads(c.strip())
+    out = {}
+    for sku, title, description in items:
+        t = data.get(sku) if isinstance(data, dict) else None
+        if not isinstance(t, dict) or not t.get('title') or not t.get('description'): continue
+        res = translation_result(t, title, description)
+        if not is_japanese_text(res['title']): out[sku] = res
+    return out
+
+
+class TranslationBatcher:
+    """待上架商品先 submit 排隊，湊滿 size 個就打包成一次請求，交給 workers 條執行緒並行翻譯（size=1 時一筆一個請求）；
+    upload_to_shopify 以 result() 取自己那筆，還在排隊的會先提早送出。批次結果寫進翻譯快取，沒過驗證的商品個別退回單筆翻譯"""
+    def __init__(self, size, workers=1):
+        self.size = max(1, size); self.workers = workers; self.lock = threading.Lock()
+        self.queue = []; self.futures = {}
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='translate')
+        self.batches = 0; self.batched = 0; self.fallbacks = 0
+
+    def submit(self, sku, title, description):
+        if not title: return
+        key = translation_key(title, description)
+        with self.lock:
+            if key in self.futures or translation_cache.has(key): return
+            fu = self.futures[key] = Future()
+            self.queue.append((key, str(sku or len(self.queue)), title, description, fu))
+            if len(self.queue) >= self.size: self._flush()
+
+    def _flush(self):  # 呼叫端持有 lock
+        if self.queue: self.pool.submit(self._run, self.queue); self.queue = []
+
+    def _run(self, chunk):
+        ids = {}
+        for i, entry in enumerate(chunk):
+            ids[entry[1] if entry[1] not in ids else f"{entry[1]}-{i}"] = entry
+        done = {}; single = None
+        if scrape_status.get('translation_stopped'): pass  # 已因翻譯連續失敗停止 → 不再打 API
+        elif len(ids) == 1:
+            sid, (_, _, title, description, _) = next(iter(ids.items()))
+            # 單筆自己會寫快取；沒過驗證也原樣交回，由 upload_to_shopify 判斷，不在 result() 再打一次
+            single = translate_with_chatgpt(title, description)
+            if single.get('success') and not is_japanese_text(single['title']): done[sid] = single
+        else:
+            try: done = translate_batch([(sid, e[2], e[3]) for sid, e in ids.items()])
+            except Exception as e: print(f"[批次翻譯] {e}")
+        with self.lock:
+            self.batches += 1; self.batched += len(done); self.fallbacks += len(ids) - len(done) if single is None else 0
+        for sid, (key, _, _, _, fu) in ids.items():
+            if sid in done: translation_cache.put(key, done[sid])
+            fu.set_result(done.get(sid) or single)
+
+    def result(self, title, description):
+        """有排隊 / 進行中的批次就等它；沒有，或這筆在多筆批次裡沒過驗證，照常單筆翻譯（單筆請求的結果不論成敗直接回傳）"""
+        key = translation_key(title, description)
+        with self.lock:
+            fu = self.futures.pop(key, None)
+            if fu and any(e[0] == key for e in self.queue): self._flush()
+        return (fu.result() if fu else None) or translate_with_chatgpt(title, description)
+
+    def snapshot(self):
+        with self.lock:
+            return {'size': self.size, 'workers': self.workers, 'batches': self.batches, 'batched': self.batched,
+                    'fallbacks': self.fallbacks, 'queued': len(self.queue), 'pending': len(self.futures)}
+
+
+translation_batcher = TranslationBatcher(TRANSLATE_BATCH_SIZE, TRANSLATE_WORKERS)
+
+
+def queue_translation(product, min_price=0):
+    """詳情已到手、之後應該會上架的商品（有庫存、價格達標）先排進批次翻譯；回傳 product，方便接在 fetch 後面"""
+    if product and product.get('title') and product.get('in_stock', True) and product.get('price', 0) >= min_price:
+        translation_batcher.submit(product.get('sku'), product['title'], product.get('description', ''))
+    return product
+
+
 def download_image_to_base64(img_url, max_retries=3):
     headers = {'User-Agent': 'Mozilla/5.0', 'Accept': 'image/*', 'Referer': BASE_URL + '/'}
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(img_url, headers=headers, timeout=30)
-            if response.status_code == 200:
-                ct = response.headers.get('Content-Type', 'image/jpeg')
-                fmt = 'image/png' if 'png' in ct else 'image/gif' if 'gif' in ct else 'image/jpeg'
-                return {'success': True, 'base64': base64.b64encode(response.content).decode('utf-8'), 'content_type': fmt}
-        except Exception as e:
-            print(f"[圖片下載] 第 {attempt+1} 次異常: {e}")
-        time.sleep(1)
+    try:
+        response = client.get(img_url, headers=headers, timeout=30, retries=max_retries)
+        if response.status_code == 200:
+            ct = response.headers.get('Content-Type', 'image/jpeg')
+            fmt = 'image/png' if 'png' in ct else 'image/gif' if 'gif' in ct else 'image/jpeg'
+            return {'success': True, 'base64': base64.b64encode(response.content).decode('utf-8'), 'content_type': fmt}
+    except Exception as e:
+        print(f"[圖片下載] 下載異常: {e}")
     return {'success': False}
 
 
@@ -179,7 +708,7 @@ def get_existing_products_map():
     products_map = {}
     url = shopify_api_url("products.json?limit=250")
     while url:
-        response = requests.get(url, headers=get_shopify_headers())
+        response = client.get(url, headers=get_shopify_headers())
         if response.status_code != 200: break
         for product in response.json().get('products', []):
             pid = product.get('id')
@@ -192,110 +721,196 @@ def get_existing_products_map():
     return products_map
 
 
-def get_collection_products_map(collection_id):
+def get_collection_products_map(collection_id, variants=False):
+    """collection 內 SKU → product_id；variants=True 時改為 {product_id, variant_id, 目前售價}（售價同步用）"""
     products_map = {}
     if not collection_id: return products_map
     url = shopify_api_url(f"collections/{collection_id}/products.json?limit=250")
     while url:
-        response = requests.get(url, headers=get_shopify_headers())
+        response = client.get(url, headers=get_shopify_headers())
         if response.status_code != 200: break
         for product in response.json().get('products', []):
             pid = product.get('id')
             for v in product.get('variants', []):
                 sku = v.get('sku')
-                if sku and pid: products_map[sku] = pid
+                if sku and pid:
+                    products_map[sku] = pid if not variants else {
+                        'product_id': pid, 'variant_id': v.get('id'), 'price': float(v.get('price') or 0)}
         lh = response.headers.get('Link', '')
         m = re.search(r'<([^>]+)>; rel="next"', lh)
         url = m.group(1) if m and 'rel="next"' in lh else None
     return products_map
 
 
+
 def delete_product(product_id):
-    return requests.delete(shopify_api_url(f"products/{product_id}.json"), headers=get_shopify_headers()).status_code == 200
+    return client.delete(shopify_api_url(f"products/{product_id}.json"), headers=get_shopify_headers()).status_code == 200
 
 
 def update_product(product_id, data):
-    r = requests.put(shopify_api_url(f"products/{product_id}.json"), headers=get_shopify_headers(),
+    r = client.put(shopify_api_url(f"products/{product_id}.json"), headers=get_shopify_headers(),
                      json={"product": {"id": product_id, **data}})
     return r.status_code == 200, r
 
 
 def get_or_create_collection(collection_title="Gateau Festa Harada"):
-    response = requests.get(shopify_api_url(f'custom_collections.json?title={collection_title}'), headers=get_shopify_headers())
+    response = client.get(shopify_api_url(f'custom_collections.json?title={collection_title}'), headers=get_shopify_headers())
     if response.status_code == 200:
         for col in response.json().get('custom_collections', []):
             if col['title'] == collection_title: return col['id']
-    response = requests.post(shopify_api_url('custom_collections.json'), headers=get_shopify_headers(),
+    response = client.post(shopify_api_url('custom_collections.json'), headers=get_shopify_headers(),
                              json={'custom_collection': {'title': collection_title, 'published': True}})
     if response.status_code == 201: return response.json()['custom_collection']['id']
     return None
 
 
 def add_product_to_collection(product_id, collection_id):
-    return requests.post(shopify_api_url('collects.json'), headers=get_shopify_headers(),
+    return client.post(shopify_api_url('collects.json'), headers=get_shopify_headers(),
                          json={'collect': {'product_id': product_id, 'collection_id': collection_id}}).status_code == 201
 
 
 def publish_to_all_channels(product_id):
     gu = f"https://{SHOPIFY_SHOP}.myshopify.com/admin/api/2024-01/graphql.json"
     hd = {'X-Shopify-Access-Token': SHOPIFY_ACCESS_TOKEN, 'Content-Type': 'application/json'}
-    r = requests.post(gu, headers=hd, json={'query': '{ publications(first:20){ edges{ node{ id name }}}}'})
+    r = client.post(gu, headers=hd, json={'query': '{ publications(first:20){ edges{ node{ id name }}}}'})
     if r.status_code != 200: return False
     pubs = r.json().get('data', {}).get('publications', {}).get('edges', [])
     seen = set(); uq = []
     for p in pubs:
         if p['node']['name'] not in seen: seen.add(p['node']['name']); uq.append(p['node'])
     mut = """mutation publishablePublish($id:ID!,$input:[PublicationInput!]!){publishablePublish(id:$id,input:$input){userErrors{field message}}}"""
-    requests.post(gu, headers=hd, json={'query': mut, 'variables': {"id": f"gid://shopify/Product/{product_id}", "input": [{"publicationId": p['id']} for p in uq]}})
+    client.post(gu, headers=hd, json={'query': mut, 'variables': {"id": f"gid://shopify/Product/{product_id}", "input": [{"publicationId": p['id']} for p in uq]}})
     return True
 
 
+# ========== 尺寸 / 重量抽取引擎 ==========
+SIZE_TRANS = str.maketrans({'×': 'x', '✕': 'x', 'Φ': '', 'φ': '', ',': ''})
+SIZE_NUM = r'(\d+(?:\.\d+)?)'
+SIZE_LABEL = r'(?:[WDHL]|縦|横|高さ|タテ|ヨコ|奥行き?|幅)?'
+
+
+class SizeWeightRule:
+    """尺寸 + 重量單次抽取：NFKC 正規化（全形數字 / ｍｍ / ㎏ 等）後，一條編譯好的 regex
+    finditer 一遍同時收尺寸與重量，單位統一成 cm / kg。
+    dim_unit：尺寸沒寫單位時當作的單位（None = 必須寫單位）；weight_units：接受的重量單位，順序即優先序；
+    weight_end：g 之後不可接的字元；cylinder：允許「直徑 x 高 mm」兩維"""
+    def __init__(self, dim_prefix='', weight_prefix='', dim_unit=None, weight_units=('kg', 'g'),
+                 weight_end=r'(?![a-z0-9])', cylinder=False, dims=True, ndigits=2):
+        dim = (rf'{dim_prefix}{SIZE_LABEL}\s*(?P<a>\d+(?:\.\d+)?)\s*(?P<ua>mm|cm)?\s*x\s*'
+               rf'{SIZE_LABEL}\s*(?P<b>\d+(?:\.\d+)?)\s*(?P<ub>mm|cm)?'
+               rf'(?:\s*x\s*{SIZE_LABEL}\s*(?P<c>\d+(?:\.\d+)?))?(?:\s*\(?\s*(?P<u>mm|cm)(?:\s*\))?)?')
+        wt = rf'{weight_prefix}(?P<w>\d+(?:\.\d+)?)\s*(?P<wu>kg|g{weight_end})'
+        parts = ([f'(?P<dim>{dim})'] if dims else []) + ([f'(?P<wt>{wt})'] if weight_units else [])
+        self.rx = re.compile('|'.join(parts), re.I)
+        self.dim_unit = dim_unit; self.weight_units = weight_units
+        self.cylinder = cylinder; self.dims = dims; self.ndigits = ndigits
+
+    def __call__(self, text):
+        box = cyl = None; weights = {}
+        for m in self.rx.finditer(unicodedata.normalize('NFKC', text or '').translate(SIZE_TRANS)):
+            if m.lastgroup == 'wt':
+                u = m['wu'].lower()
+                if u in self.weight_units and u not in weights:
+                    weights[u] = float(m['w']) / (1000 if u == 'g' else 1)
+            else:
+                units = [m['ua'] or m['u'] or self.dim_unit, m['ub'] or m['u'] or self.dim_unit, m['u'] or self.dim_unit]
+                nums = [n for n in (m['a'], m['b'], m['c']) if n is not None]
+                if not all(units[:len(nums)]): continue
+                vals = [float(n) / (10 if un.lower() == 'mm' else 1) for n, un in zip(nums, units)]
+                if len(vals) == 3 and box is None: box = vals
+                elif len(vals) == 2 and self.cylinder and cyl is None and (m['u'] or m['ub']): cyl = vals
+            if (box or not self.dims) and len(weights) == len(self.weight_units): break
+        weight = next((weights[u] for u in self.weight_units if u in weights), None)
+        dimension = None
+        if box:
+            l, w, h = box
+            dimension = {'l': l, 'w': w, 'h': h, 'volume_weight': round(l * w * h / 6000, self.ndigits)}
+        elif cyl:
+            d, h = cyl
+            dimension = {'diameter': d, 'height': h, 'volume_weight': round(math.pi * (d / 2) ** 2 * h / 6000, self.ndigits)}
+        vw = dimension['volume_weight'] if dimension else 0
+        return {'dimension': dimension, 'actual_weight': round(weight, 3) if weight else None,
+                'volume_weight': vw, 'final_weight': round(max(vw, weight or 0), self.ndigits)}
+
+
+SIZE_RULE = SizeWeightRule(dim_unit='cm', weight_end='')  # サイズ / 重さ dd：沒寫單位視為 cm
+SIZE_FIXTURES = [  # (文字, actual_weight, final_weight)：改 SIZE_RULE 後打 /api/test-size 對一遍
+    ('200×150×60mm 450g', 0.45, 0.45),
+    ('200×150×60mm\u3000450g', 0.45, 0.45),
+    ('200×150×60mm\n450g', 0.45, 0.45),
+    ('120mm×80mm×40mm 250g', 0.25, 0.25),
+    ('タテ20×ヨコ15×高さ6cm', None, 0.3),
+    ('約450g', 0.45, 0.45),
+]
+
+
 def parse_size_cm(size_text):
-    if not size_text: return None
-    pattern = r'タテ\s*(\d+(?:\.\d+)?)\s*[×xX]\s*ヨコ\s*(\d+(?:\.\d+)?)\s*[×xX]\s*高さ\s*(\d+(?:\.\d+)?)\s*cm'
-    match = re.search(pattern, size_text)
-    if match:
-        h, w, d = float(match.group(1)), float(match.group(2)), float(match.group(3))
-        return {"height": h, "width": w, "depth": d, "volume_weight": round((h * w * d) / 6000, 2)}
-    simple = re.search(r'(\d+(?:\.\d+)?)\s*[×xX]\s*(\d+(?:\.\d+)?)\s*[×xX]\s*(\d+(?:\.\d+)?)', size_text)
-    if simple:
-        a, b, c = float(simple.group(1)), float(simple.group(2)), float(simple.group(3))
-        return {"volume_weight": round((a * b * c) / 6000, 2)}
-    return None
+    return SIZE_RULE(size_text)['dimension'] if size_text else None
 
 
 def parse_weight(weight_text):
-    if not weight_text: return 0
-    kg = re.search(r'(\d+(?:\.\d+)?)\s*kg', weight_text, re.IGNORECASE)
-    if kg: return float(kg.group(1))
-    g = re.search(r'(\d+(?:\.\d+)?)\s*g', weight_text, re.IGNORECASE)
-    if g: return float(g.group(1)) / 1000
-    return 0
+    return SIZE_RULE(weight_text)['actual_weight'] or 0 if weight_text else 0
+
+
+SOLD_OUT_KEYWORDS = ['品切れ', '在庫なし', 'SOLD OUT', '在庫がありません']
+STOCK_REGION = ('class', 'block-goods-detail')  # 商品主區塊；推薦商品等區塊的「品切れ」不列入
 
 
 def check_product_in_stock(sku):
-    """★ v2.2: 爬商品頁確認庫存狀態"""
+    """★ v2.2: 爬商品頁確認庫存狀態
+    ★ v2.3: 串流讀取，命中缺貨字或商品主區塊結束就停止下載"""
     url = f"{BASE_URL}/shop/g/g{sku}/"
     try:
-        response = requests.get(url, headers=HEADERS, timeout=30)
-        if response.status_code != 200:
+        status, sn = sniff_page(client, url, PageSniffer(region=STOCK_REGION, keywords=SOLD_OUT_KEYWORDS),
+                                headers=HEADERS, timeout=30)
+        if status != 200:
             return False  # 頁面不存在，視為缺貨
-        page_text = response.text
-        if any(kw in page_text for kw in ['品切れ', '在庫なし', 'SOLD OUT', '在庫がありません']):
-            return False
-        return True
+        return sn.in_stock
     except:
         return True  # 網路錯誤不判定為缺貨
 
 
-def scrape_product_list():
+# ========== 列表頁庫存（庫存快掃模式） ==========
+GOODS_HREF = re.compile(r'/shop/g/g([^/?#]+)')
+LIST_SOLD_OUT = re.compile(r'品切れ|在庫なし|在庫切れ|SOLD\s*OUT|販売終了|入荷待ち', re.I)
+LIST_CART = re.compile(r'カートに入れる|カートへ入れる|買い物かごに入れる')
+LIST_SOLD_OUT_CSS = '[class*="soldout"], [class*="sold-out"], [class*="nostock"], img[alt*="品切"]'
+LIST_CART_CSS = 'form[action*="cart"], a[href*="cart.aspx"], button[class*="cart"], input[class*="cart"], input[alt*="カート"]'
+STOCK_SWEEP_MINUTES = int(os.environ.get("STOCK_SWEEP_MINUTES", "0"))  # >0：背景每 N 分鐘快掃一次
+
+
+def card_goods(card):
+    """商品卡連到的商品代碼；超過一個代表抓到整個列表那一層"""
+    return {m.group(1) for a in card.find_all('a', href=True) for m in [GOODS_HREF.search(a['href'])] if m}
+
+
+def card_stock(card):
+    """列表商品卡的庫存：缺貨徽章 / 缺貨 class → False，購物車按鈕 → True，其餘 None（交給詳情頁）。
+    卡片連到不只一個商品一律 None，免得別的商品的「品切れ」誤判"""
+    if card is None or len(card_goods(card)) > 1: return None
+    text = card.get_text(' ')
+    if LIST_SOLD_OUT.search(text) or card.select_one(LIST_SOLD_OUT_CSS): return False
+    if LIST_CART.search(text) or card.select_one(LIST_CART_CSS): return True
+    return None
+
+
+def listed_in_stock(item):
+    """列表頁判斷得出來就直接用，判斷不了才抓詳情頁"""
+    if item.get('list_stock') is not None:
+        scrape_status['list_hits'] = scrape_status.get('list_hits', 0) + 1; return item['list_stock']
+    scrape_status['detail_checks'] = scrape_status.get('detail_checks', 0) + 1
+    return check_product_in_stock(item['sku'])
+
+
+def scrape_product_list(with_images=True):
+    """with_images=False：庫存快掃用，不逐張 HEAD 圖片"""
     products = []
     seen_skus = set()
 
     for category_path in CATEGORY_PATHS:
         url = BASE_URL + category_path
         try:
-            response = requests.get(url, headers=HEADERS, timeout=30)
+            response = client.get(url, headers=HEADERS, timeout=30)
             if response.status_code != 200: continue
             soup = BeautifulSoup(response.text, 'html.parser')
             product_blocks = soup.find_all('div', class_='block-goods-list-d--item-body')
@@ -338,10 +953,10 @@ def scrape_product_list():
                     final_weight = max(actual_weight, volume_weight)
 
                     images = []
-                    for prefix in ['L', '2', '3', '4', '5', '6', '7', '8']:
+                    for prefix in (['L', '2', '3', '4', '5', '6', '7', '8'] if with_images else []):
                         img_url = f"{BASE_URL}/img/goods/{prefix}/{sku}.jpg"
                         try:
-                            if requests.head(img_url, headers=HEADERS, timeout=5).status_code == 200: images.append(img_url)
+                            if client.head(img_url, headers=HEADERS, timeout=5).status_code == 200: images.append(img_url)
                         except: pass
                     if not images: images.append(f"{BASE_URL}/img/goods/L/{sku}.jpg")
 
@@ -356,10 +971,10 @@ def scrape_product_list():
                         'url': f"{BASE_URL}/shop/g/g{sku}/",
                         'images': images, 'weight': round(final_weight, 2),
                         'description': '<br>'.join(desc_parts),
+                        'list_stock': card_stock(block),
                     })
                 except Exception as e:
                     print(f"[ERROR] 解析商品區塊失敗: {e}"); continue
-            time.sleep(0.5)
         except Exception as e:
             print(f"[ERROR] 爬取分類失敗: {e}"); continue
 
@@ -368,7 +983,7 @@ def scrape_product_list():
 
 
 def upload_to_shopify(product, collection_id=None):
-    translated = translate_with_chatgpt(product['title'], product.get('description', ''))
+    translated = translation_batcher.result(product['title'], product.get('description', ''))
     if not translated['success']:
         return {'success': False, 'error': 'translation_failed', 'translated': translated}
 
@@ -381,7 +996,6 @@ def upload_to_shopify(product, collection_id=None):
         result = download_image_to_base64(img_url)
         if result['success']:
             images_base64.append({'attachment': result['base64'], 'position': idx + 1, 'filename': f"harada_{product['sku']}_{idx+1}.jpg"})
-        time.sleep(0.3)
 
     sp = {'product': {
         'title': translated['title'], 'body_html': translated['description'] + SHIPPING_HTML,
@@ -396,10 +1010,10 @@ def upload_to_shopify(product, collection_id=None):
         'metafields': [{'namespace': 'custom', 'key': 'link', 'value': product['url'], 'type': 'url'}]
     }}
 
-    response = requests.post(shopify_api_url('products.json'), headers=get_shopify_headers(), json=sp)
+    response = client.post(shopify_api_url('products.json'), headers=get_shopify_headers(), json=sp)
     if response.status_code == 201:
         created = response.json()['product']; pid = created['id']; vid = created['variants'][0]['id']
-        requests.put(shopify_api_url(f'variants/{vid}.json'), headers=get_shopify_headers(),
+        client.put(shopify_api_url(f'variants/{vid}.json'), headers=get_shopify_headers(),
                      json={'variant': {'id': vid, 'cost': f"{cost:.2f}"}})
         if collection_id: add_product_to_collection(pid, collection_id)
         publish_to_all_channels(pid)
@@ -416,7 +1030,7 @@ def get_harada_duplicate_groups():
     products = []
     url = shopify_api_url("products.json?limit=250&vendor=Gateau+Festa+Harada&fields=id,title,variants,created_at,image")
     while url:
-        r = requests.get(url, headers=get_shopify_headers())
+        r = client.get(url, headers=get_shopify_headers())
         if r.status_code != 200: break
         for p in r.json().get('products', []):
             sku = ''
@@ -454,7 +1068,6 @@ def run_dedup():
                     dedup_status["deleted"] += 1
                 else:
                     dedup_status["errors"].append(f"刪除失敗 ID:{p['id']} SKU:{group['sku']}")
-                time.sleep(0.3)
     except Exception as e:
         dedup_status["errors"].append(str(e))
     finally:
@@ -533,7 +1146,7 @@ def run_update_shipping():
         pids = []
         url = shopify_api_url("products.json?limit=250&vendor=Gateau Festa Harada&fields=id,body_html")
         while url:
-            r = requests.get(url, headers=get_shopify_headers())
+            r = client.get(url, headers=get_shopify_headers())
             if r.status_code != 200:
                 update_shipping_status["errors"].append(f"取得商品列表失敗: {r.status_code}")
                 break
@@ -549,7 +1162,7 @@ def run_update_shipping():
                 if "國際運費" in body:
                     update_shipping_status["skipped"] += 1
                     continue
-                ru = requests.put(
+                ru = client.put(
                     shopify_api_url(f"products/{pid}.json"),
                     headers=get_shopify_headers(),
                     json={"product": {"id": pid, "body_html": body + SHIPPING_HTML}}
@@ -677,7 +1290,10 @@ def japanese_scan_page():
 
 @app.route('/api/status')
 def get_status():
-    return jsonify(scrape_status)
+    return jsonify({**scrape_status, 'pacing': pacer_snapshot(), 'retries': retry_budget.snapshot(),
+                    'translation_cache': translation_cache.snapshot(),
+                    'translation_batch': translation_batcher.snapshot(),
+                    'openai': openai_budget.snapshot()})
 
 
 @app.route('/api/start', methods=['GET', 'POST'])
@@ -694,6 +1310,7 @@ def api_start():
 
 def run_scrape():
     global scrape_status
+    retry_budget.reset()
     try:
         scrape_status = {
             "running": True, "progress": 0, "total": 0,
@@ -725,16 +1342,19 @@ def run_scrape():
 
         consecutive_translation_failures = 0
 
+        # === v2.7: 列表頁已有說明 → 新商品先全部排進批次翻譯 ===
+        for p in product_list:
+            if p['sku'] not in existing_skus and p.get('list_stock') is not False: queue_translation(p, MIN_PRICE)
+
         for idx, product in enumerate(product_list):
             scrape_status['progress'] = idx + 1
             scrape_status['current_product'] = f"處理中: {product['sku']}"
 
             if product['sku'] in existing_skus:
-                # === v2.2: 已存在商品檢查庫存 ===
-                if not check_product_in_stock(product['sku']):
+                # === v2.2: 已存在商品檢查庫存（v2.4: 列表頁判斷得出來就不抓商品頁）===
+                if not listed_in_stock(product):
                     out_of_stock_skus.add(product['sku'])
                     print(f"[缺貨偵測] {product['sku']} 官網缺貨，稍後刪除")
-                time.sleep(0.5)
                 scrape_status['skipped_exists'] += 1
                 scrape_status['skipped'] += 1
                 continue
@@ -747,7 +1367,7 @@ def run_scrape():
                 scrape_status['errors'].append({'sku': product['sku'], 'error': '資訊不完整'}); continue
 
             # === v2.2: 新商品也檢查庫存 ===
-            if not check_product_in_stock(product['sku']):
+            if not listed_in_stock(product):
                 out_of_stock_skus.add(product['sku'])
                 scrape_status['skipped'] += 1
                 continue
@@ -768,7 +1388,6 @@ def run_scrape():
                 scrape_status['errors'].append({'sku': product['sku'], 'error': result['error']})
                 consecutive_translation_failures = 0
 
-            time.sleep(1)
 
         if not scrape_status['translation_stopped']:
             scrape_status['current_product'] = "清理缺貨/下架商品..."
@@ -789,7 +1408,6 @@ def run_scrape():
                             print(f"[已刪除] SKU: {sku}, Product ID: {pid}")
                         else:
                             scrape_status['errors'].append({'sku': sku, 'error': '刪除失敗'})
-                    time.sleep(0.3)
 
         scrape_status['current_product'] = "完成！" if not scrape_status['translation_stopped'] else "翻譯異常停止"
 
@@ -805,7 +1423,7 @@ def api_scan_japanese():
     products = []
     url = shopify_api_url("products.json?limit=250&vendor=Gateau+Festa+Harada")
     while url:
-        r = requests.get(url, headers=get_shopify_headers())
+        r = client.get(url, headers=get_shopify_headers())
         if r.status_code != 200: break
         for p in r.json().get('products', []):
             sku = ''; price = ''
@@ -825,7 +1443,7 @@ def api_retranslate_product():
     if not load_shopify_token(): return jsonify({'error': '未設定 Token'}), 400
     data = request.get_json(); pid = data.get('product_id')
     if not pid: return jsonify({'error': '缺少 product_id'}), 400
-    resp = requests.get(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers())
+    resp = client.get(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers())
     if resp.status_code != 200: return jsonify({'error': f'無法取得: {resp.status_code}'}), 400
     product = resp.json().get('product', {})
     translated = translate_with_chatgpt(product.get('title', ''), product.get('body_html', ''))
@@ -858,14 +1476,132 @@ def api_test_translate():
 @app.route('/api/test-shopify')
 def test_shopify():
     if not load_shopify_token(): return jsonify({'success': False, 'error': '環境變數未設定'})
-    response = requests.get(shopify_api_url('shop.json'), headers=get_shopify_headers())
+    response = client.get(shopify_api_url('shop.json'), headers=get_shopify_headers())
     if response.status_code == 200: return jsonify({'success': True, 'shop': response.json()['shop']})
     return jsonify({'success': False, 'error': response.text}), 400
 
 
+@app.route('/api/test-size')
+def test_size():
+    rows = [{'text': t, 'expected': [aw, fw], 'got': [r['actual_weight'], r['final_weight']]}
+            for t, aw, fw in SIZE_FIXTURES for r in [SIZE_RULE(t)]]
+    failed = [r for r in rows if r['expected'] != r['got']]
+    return jsonify({'success': not failed, 'total': len(rows), 'failed': failed})
+
+
+# ========== 售價快速同步（只看列表價） ==========
+def run_price_sync():
+    """列表頁的價格一次收齊，和 collection 的 SKU 索引比對，只 PUT 售價有差的 variant。
+    不抓詳情頁、不翻譯、不碰圖片；列表上找不到價格或低於門檻的 SKU 不動"""
+    global scrape_status
+    retry_budget.reset()
+    try:
+        scrape_status = {
+            "running": True, "mode": "prices", "progress": 0, "total": 0,
+            "current_product": "", "products": [], "errors": [],
+            "uploaded": 0, "skipped": 0, "skipped_exists": 0,
+            "filtered_by_price": 0, "out_of_stock": 0, "deleted": 0,
+            "price_checked": 0, "price_updated": 0,
+            "translation_failed": 0, "translation_stopped": False
+        }
+        scrape_status['current_product'] = "取得 Collection 售價..."
+        variants = get_collection_products_map(get_or_create_collection("Gateau Festa Harada"), variants=True)
+        scrape_status['total'] = len(variants)
+        for item in scrape_product_list(with_images=False):
+            info = variants.get(item['sku']); cost = item.get('price', 0)
+            if not info or item.get('is_points') or cost < MIN_PRICE: continue
+            scrape_status['progress'] += 1; scrape_status['price_checked'] += 1
+            scrape_status['current_product'] = f"售價: {item['sku']}"
+            new_price = calculate_selling_price(cost)
+            if abs(new_price - info['price']) < 1: continue
+            r = client.put(shopify_api_url(f"variants/{info['variant_id']}.json"), headers=get_shopify_headers(),
+                           json={'variant': {'id': info['variant_id'], 'price': f"{new_price:.2f}", 'cost': f"{cost:.2f}"}})
+            if r.status_code == 200:
+                scrape_status['price_updated'] += 1
+                print(f"[售價] {item['sku']}: {info['price']:.0f} → {new_price:.0f}")
+            else:
+                scrape_status['errors'].append({'sku': item['sku'], 'error': f'售價更新失敗 {r.status_code}'})
+        print(f"[售價] 比對 {scrape_status['price_checked']} 筆、更新 {scrape_status['price_updated']} 筆")
+        scrape_status['current_product'] = "完成"
+    except Exception as e:
+        scrape_status['errors'].append({'error': str(e)})
+    finally:
+        scrape_status['running'] = False
+
+
+@app.route('/api/sync-prices', methods=['POST'])
+def api_sync_prices():
+    if scrape_status['running']: return jsonify({'success': False, 'error': '爬取正在進行中'})
+    if not load_shopify_token(): return jsonify({'success': False, 'error': '找不到 Token'})
+    threading.Thread(target=run_price_sync).start()
+    return jsonify({'success': True, 'message': '售價同步已啟動'})
+
+# ========== 庫存快掃 ==========
+def run_stock_sweep():
+    """只看已上架（collection 內）商品的庫存：列表頁判斷得出來的直接採用，判斷不了的才抓詳情頁，缺貨即刪除。
+    不上架、不翻譯、不處理官網消失的商品（留給完整爬取）"""
+    global scrape_status
+    retry_budget.reset()
+    try:
+        scrape_status = {
+            "running": True, "mode": "stock", "progress": 0, "total": 0,
+            "current_product": "", "products": [], "errors": [],
+            "uploaded": 0, "skipped": 0, "skipped_exists": 0,
+            "filtered_by_price": 0, "out_of_stock": 0, "deleted": 0,
+            "list_hits": 0, "detail_checks": 0,
+            "translation_failed": 0, "translation_stopped": False
+        }
+        scrape_status['current_product'] = "取得 Collection 商品..."
+        cpm = get_collection_products_map(get_or_create_collection("Gateau Festa Harada"))
+        scrape_status['total'] = len(cpm)
+        for item in scrape_product_list(with_images=False):
+            pid = cpm.get(item['sku'])
+            if not pid: continue
+            scrape_status['progress'] += 1
+            scrape_status['current_product'] = f"庫存: {item['sku']}"
+            if listed_in_stock(item): continue
+            scrape_status['out_of_stock'] += 1
+            if delete_product(pid):
+                scrape_status['deleted'] += 1
+                print(f"[快掃-已刪除] SKU: {item['sku']}, Product ID: {pid}")
+            else:
+                scrape_status['errors'].append({'sku': item['sku'], 'error': '刪除失敗'})
+        print(f"[快掃] 列表判定 {scrape_status['list_hits']} 筆、詳情頁 {scrape_status['detail_checks']} 筆、刪除 {scrape_status['deleted']} 筆")
+        scrape_status['current_product'] = "完成"
+    except Exception as e:
+        scrape_status['errors'].append({'error': str(e)})
+    finally:
+        scrape_status['running'] = False
+
+
+@app.route('/api/stock-sweep', methods=['POST'])
+def api_stock_sweep():
+    if scrape_status['running']: return jsonify({'success': False, 'error': '爬取正在進行中'})
+    if not load_shopify_token(): return jsonify({'success': False, 'error': '找不到 Token'})
+    threading.Thread(target=run_stock_sweep).start()
+    return jsonify({'success': True, 'message': '庫存快掃已啟動'})
+
+
+def start_stock_sweep_scheduler():
+    """每 STOCK_SWEEP_MINUTES 分鐘快掃一次；完整爬取進行中就跳過這一輪"""
+    def loop():
+        while True:
+            time.sleep(STOCK_SWEEP_MINUTES * 60)
+            try:
+                if not scrape_status['running'] and load_shopify_token(): run_stock_sweep()
+            except Exception as e:
+                print(f"[快掃排程] 錯誤: {e}")
+    threading.Thread(target=loop, daemon=True).start()
+    print(f"[快掃排程] 已啟動（每 {STOCK_SWEEP_MINUTES} 分鐘）")
+
+
+if STOCK_SWEEP_MINUTES > 0:
+    start_stock_sweep_scheduler()
+
+
 if __name__ == '__main__':
     print("=" * 50)
-    print("Gateau Festa Harada 爬蟲工具 v2.2")
+    print("Gateau Festa Harada 爬蟲工具 v2.8")
     print("新增: 缺貨商品自動刪除")
     print("=" * 50)
     port = int(os.environ.get('PORT', 8080))
@@ -1,5 +1,5 @@
 """
-本高砂屋商品爬蟲 + Shopify 上架工具 v2.3
+本高砂屋商品爬蟲 + Shopify 上架工具 v2.8
 v2.1: 翻譯保護機制、日文商品掃描、測試翻譯
 v2.2: 缺貨商品自動刪除 - 官網消失或缺貨皆直接刪除
 v2.3: 修復同步 Bug
@@ -9,19 +9,33 @@ v2.3: 修復同步 Bug
   - 新增: /api/sync-status 輪詢同步進度
   - 新增: 每日自動同步排程（預設 JST 10:00）
   - 新增: 安全閾值防爬蟲異常誤刪
+v2.4: 分頁列表平行預抓（stream_listing），邊列表邊處理詳情
+v2.5: MakeShop 共用爬蟲（與 kobe-fugetsudo 同一份）：EUC-JP bytes 直接交給 lxml，/api/bench-parse 比較新舊解析
+v2.6: 翻譯快取 - 依 prompt 指紋 + 標題 + 清理後說明的 hash 存檔（translation_cache.json），LRU 上限，/api/status 回報命中率
+v2.7: 翻譯 prompt 拆成 TRANSLATION_* 常數與 translation_result()；修正 prompt JSON 範例大括號造成的 f-string 錯誤
+v2.8: OpenAI 請求改走獨立 keep-alive 連線池（TRANSLATE_WORKERS + 2 條連線），受 OPENAI_RPM / OPENAI_TPM 預算控管，429 依 Retry-After 全部暫停後重送
 """
 
 from flask import Flask, jsonify, request
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import re
+import unicodedata
 import json
 import os
 import time
-from urllib.parse import urljoin
+import random
+from urllib.parse import urljoin, urlparse
 import math
 import threading
+import importlib.util
+import hashlib
+import atexit
+from collections import OrderedDict
+from functools import wraps
 import base64
+from concurrent.futures import ThreadPoolExecutor
 
 app = Flask(__name__)
 
@@ -49,6 +63,173 @@ HEADERS = {
     'Accept-Charset': 'EUC-JP,utf-8;q=0.7,*;q=0.3',
 }
 
+# ========== 每個 origin 的自適應節流（AIMD） ==========
+
+class OriginPacer:
+    """依回應延遲、429/503 與錯誤率調整請求間隔與併發：
+    順利時間隔線性遞減、併發逐步 +1；被限流 / 出錯時間隔加倍、併發減半"""
+    MIN_DELAY, MAX_DELAY, MAX_LIMIT = 0.05, 30.0, 8
+
+    def __init__(self, host, delay=0.5, limit=2):
+        self.host = host; self.delay = delay; self.limit = limit
+        self.active = 0; self.next_at = 0.0; self.streak = 0
+        self.latency = 0.0; self.ok = 0; self.throttled = 0; self.errors = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.active >= self.limit: self.cond.wait()
+            self.active += 1
+            now = time.time(); start = max(now, self.next_at)
+            self.next_at = start + self.delay
+        if start > now: time.sleep(start - now)
+
+    def release(self, status, elapsed, retry_after=None):
+        with self.cond:
+            self.active -= 1
+            slow = self.latency > 0 and elapsed > self.latency * 3
+            self.latency = elapsed if not self.latency else self.latency * 0.8 + elapsed * 0.2
+            if status is None or status in (429, 503) or status >= 500:
+                if status in (429, 503): self.throttled += 1
+                else: self.errors += 1
+                self.delay = min(self.MAX_DELAY, max(self.delay * 2, retry_after or 0, 0.5))
+                self.limit = max(1, self.limit // 2); self.streak = 0
+                self.next_at = max(self.next_at, time.time() + self.delay)
+            elif slow:
+                self.ok += 1; self.streak = 0
+                self.delay = min(self.MAX_DELAY, self.delay * 1.5)
+            else:
+                self.ok += 1; self.streak += 1
+                self.delay = max(self.MIN_DELAY, self.delay - 0.05)
+                if self.streak >= self.limit * 4 and self.limit < self.MAX_LIMIT:
+                    self.limit += 1; self.streak = 0
+            self.cond.notify_all()
+
+    def snapshot(self):
+        return {'delay': round(self.delay, 2), 'rate_per_sec': round(1 / self.delay, 2),
+                'concurrency': self.limit, 'active': self.active, 'latency': round(self.latency, 2),
+                'ok': self.ok, 'throttled': self.throttled, 'errors': self.errors}
+
+
+origin_pacers = {}
+origin_pacers_lock = threading.Lock()
+
+
+def pacer_for(url):
+    host = urlparse(url).netloc
+    with origin_pacers_lock:
+        if host not in origin_pacers: origin_pacers[host] = OriginPacer(host)
+        return origin_pacers[host]
+
+
+def pacer_snapshot():
+    return {h: p.snapshot() for h, p in list(origin_pacers.items())}
+
+
+# ========== 重試（指數退避 + jitter、每輪預算）與 hedged request ==========
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'}
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "true").lower() == "true"
+
+
+class RetryBudget:
+    """每輪爬取可用的重試 / hedge 次數上限，避免官網故障時重試把流量放大"""
+    def __init__(self, limit=200):
+        self.limit = limit; self.used = 0; self.hedged = 0; self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock: self.used = 0; self.hedged = 0
+
+    def take(self):
+        with self.lock:
+            if self.used >= self.limit: return False
+            self.used += 1; return True
+
+    def snapshot(self):
+        return {'used': self.used, 'limit': self.limit, 'hedged': self.hedged}
+
+
+retry_budget = RetryBudget()
+hedge_pool = ThreadPoolExecutor(max_workers=4)
+
+
+def retry_after_of(r):
+    ra = r.headers.get('Retry-After', '')
+    return float(ra) if ra.isdigit() else None
+
+
+def backoff_delay(attempt, retry_after=None, base=0.5, cap=20.0):
+    """指數退避 + full jitter；有 Retry-After 時不低於它"""
+    return max(random.uniform(0, min(cap, base * (2 ** attempt))), retry_after or 0)
+
+
+class PacedSession(requests.Session):
+    """所有請求先經過該 origin 的 OriginPacer，回應再回饋給它；
+    冪等請求遇到連線錯誤 / 429 / 5xx 時退避重試（POST 一律不重試）"""
+    def send_paced(self, method, url, *args, on_send=None, **kwargs):
+        pacer = pacer_for(url); pacer.acquire()
+        if on_send: on_send()
+        t = time.time(); status = None; retry_after = None
+        try:
+            r = super().request(method, url, *args, **kwargs)
+            status = r.status_code; retry_after = retry_after_of(r)
+            return r
+        finally:
+            pacer.release(status, time.time() - t, retry_after)
+
+    def request(self, method, url, *args, retries=3, **kwargs):
+        retryable = method.upper() in IDEMPOTENT_METHODS; attempt = 0
+        while True:
+            try:
+                r = self.send_paced(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not (retryable and attempt < retries and retry_budget.take()): raise
+                wait = backoff_delay(attempt); reason = type(e).__name__
+            else:
+                if r.status_code not in RETRY_STATUSES: return r
+                if not (retryable and attempt < retries and retry_budget.take()): return r
+                wait = backoff_delay(attempt, retry_after_of(r)); reason = r.status_code
+            print(f"[重試] {method} {url} ({reason}) 第 {attempt + 1} 次，{wait:.1f}s 後重送")
+            time.sleep(wait); attempt += 1
+
+    def get_hedged(self, url, hedge_after=None, **kwargs):
+        """慢速詳情頁：主請求在呼叫端執行緒直接送出，真正送出（通過 pacer）後超過 hedge_after 秒
+        （預設為該 origin 平均延遲 2 倍）仍未回應，才把備援請求丟進 hedge_pool；主請求失敗時改用備援的結果。
+        主請求不進 pool，pool 滿載時排隊的時間不會被算成慢回應而多送一份"""
+        if not HEDGE_ENABLED or hedge_pool is None: return self.get(url, **kwargs)
+        pacer = pacer_for(url)
+        hedge_after = hedge_after or max(2.0, pacer.latency * 2)
+        lock = threading.Lock(); state = {'done': False, 'timer': None, 'hedge': None}
+
+        def fire():
+            with lock:
+                if state['done'] or not retry_budget.take(): return
+                with retry_budget.lock: retry_budget.hedged += 1
+                state['hedge'] = hedge_pool.submit(self.get, url, **kwargs)
+
+        def on_send():  # 主請求重試時會再經過 pacer，計時只從第一次送出開始
+            with lock:
+                if state['timer'] or state['done']: return
+                state['timer'] = threading.Timer(hedge_after, fire); state['timer'].daemon = True
+                state['timer'].start()
+
+        error = None
+        try: r = self.get(url, on_send=on_send, **kwargs)
+        except Exception as e: r = None; error = e
+        with lock:
+            state['done'] = True
+            if state['timer']: state['timer'].cancel()
+        hedge = state['hedge']
+        if hedge and (error or r.status_code in RETRY_STATUSES):
+            try: return hedge.result()
+            except Exception: pass
+        if error: raise error
+        return r
+
+
+client = PacedSession()  # 所有對外請求（官網 / Shopify / OpenAI / 圖片）
+
 scrape_status = {
     "running": False, "progress": 0, "total": 0, "current_product": "",
     "products": [], "errors": [], "uploaded": 0, "skipped": 0,
@@ -133,38 +314,223 @@ def clean_html_for_translation(html_text):
     return text.strip()
 
 
-def translate_with_chatgpt(title, description, retry=False):
-    clean_desc = clean_html_for_translation(description)
-    prompt = f"""你是專業的日本商品翻譯和 SEO 專家。將以下日本商品資訊翻譯成繁體中文並優化 SEO。
+# ========== OpenAI 連線池與 RPM / TPM 預算 ==========
+OPENAI_URL = "https://api.openai.com/v1/chat/completions"
+OPENAI_RPM = int(os.environ.get("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.environ.get("OPENAI_TPM", "200000"))
+OPENAI_RETRIES = int(os.environ.get("OPENAI_RETRIES", "4"))
+TRANSLATE_WORKERS = int(os.environ.get("TRANSLATE_WORKERS", "4"))
+
+
+class OpenAIBudget:
+    """每分鐘請求數 / token 數兩個 token bucket：送出前先扣預估 token（prompt 字數 + max_tokens），
+    回應後依 usage 多退少補；遇到 429 整個預算暫停，所有 worker 一起等"""
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm; self.tpm = tpm
+        self.requests = float(rpm); self.tokens = float(tpm); self.updated = time.time()
+        self.paused_until = 0.0; self.cond = threading.Condition()
+        self.sent = 0; self.throttled = 0; self.waited = 0.0; self.used_tokens = 0
+
+    def _refill(self):
+        now = time.time(); dt = now - self.updated; self.updated = now
+        self.requests = min(self.rpm, self.requests + dt * self.rpm / 60)
+        self.tokens = min(self.tpm, self.tokens + dt * self.tpm / 60)
+
+    def acquire(self, tokens):
+        tokens = min(tokens, self.tpm); t0 = time.time()
+        with self.cond:
+            while True:
+                self._refill(); now = time.time()
+                if now >= self.paused_until and self.requests >= 1 and self.tokens >= tokens:
+                    self.requests -= 1; self.tokens -= tokens; self.sent += 1; self.waited += now - t0
+                    return
+                self.cond.wait(max(0.05, self.paused_until - now, (1 - self.requests) * 60 / self.rpm,
+                                   (tokens - self.tokens) * 60 / self.tpm))
+
+    def settle(self, estimated, actual):
+        with self.cond:
+            self.tokens += estimated - actual; self.used_tokens += actual
+            self.cond.notify_all()
+
+    def pause(self, seconds):
+        with self.cond:
+            self.throttled += 1; self.paused_until = max(self.paused_until, time.time() + seconds)
+
+    def snapshot(self):
+        with self.cond:
+            self._refill()
+            return {'rpm': self.rpm, 'tpm': self.tpm, 'requests_left': int(self.requests), 'tokens_left': int(self.tokens),
+                    'sent': self.sent, 'throttled': self.throttled, 'waited_sec': round(self.waited, 1),
+                    'used_tokens': self.used_tokens, 'paused': max(0, round(self.paused_until - time.time(), 1))}
+
+
+openai_budget = OpenAIBudget(OPENAI_RPM, OPENAI_TPM)
+openai_session = requests.Session()  # 不走 OriginPacer，改由 openai_budget 控速；keep-alive 連線數對齊 worker 數
+openai_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=TRANSLATE_WORKERS + 2))
+
+
+def openai_chat(payload, timeout=60):
+    """送 chat/completions：先向 openai_budget 取得額度再從連線池送出；
+    429 依 Retry-After（沒有就指數退避）暫停整個預算後重送，5xx / 連線錯誤退避重送，回傳最後一個 response"""
+    est = sum(len(m['content']) for m in payload['messages']) + payload.get('max_tokens', 1000)
+    headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
+    for attempt in range(OPENAI_RETRIES + 1):
+        openai_budget.acquire(est)
+        try:
+            r = openai_session.post(OPENAI_URL, headers=headers, json=payload, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            openai_budget.settle(est, 0)
+            if attempt >= OPENAI_RETRIES: raise
+            wait = backoff_delay(attempt, base=1.0, cap=60.0); reason = type(e).__name__
+        else:
+            if r.status_code == 200:
+                try: used = r.json().get('usage', {}).get('total_tokens', est)
+                except ValueError: used = est
+                openai_budget.settle(est, used); return r
+            openai_budget.settle(est, 0)
+            if r.status_code not in RETRY_STATUSES or attempt >= OPENAI_RETRIES: return r
+            wait = backoff_delay(attempt, retry_after_of(r), base=1.0, cap=60.0); reason = r.status_code
+            if r.status_code == 429:
+                openai_budget.pause(wait)
+                print(f"[OpenAI] 429，全部翻譯暫停 {wait:.1f}s（第 {attempt + 1} 次）"); continue
+        print(f"[OpenAI] {reason}，第 {attempt + 1} 次，{wait:.1f}s 後重送")
+        time.sleep(wait)
+
+
+# ========== 翻譯快取（來源內容 hash） ==========
+TRANSLATION_CACHE_FILE = os.environ.get("TRANSLATION_CACHE_FILE", "translation_cache.json")
+TRANSLATION_CACHE_MAX = int(os.environ.get("TRANSLATION_CACHE_MAX", "3000"))
+TRANSLATION_PROMPT_VERSION = os.environ.get("TRANSLATION_PROMPT_VERSION", "1")  # 改這個值可讓舊快取全部失效
+
+
+class TranslationCache:
+    """翻譯結果以 sha256(prompt 指紋 + 標題 + 清理後說明 + 其他參數) 為 key 存成 JSON 檔，重啟後沿用；
+    LRU：超過 max_entries 淘汰最久沒用到的。只存成功且標題已無日文的結果"""
+    def __init__(self, path, max_entries=3000):
+        self.path = path; self.max_entries = max_entries; self.lock = threading.Lock()
+        self.hits = 0; self.misses = 0; self.evicted = 0; self.dirty = 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f: self.entries = OrderedDict(json.load(f))
+        except (OSError, ValueError):
+            self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1; return None
+            self.entries.move_to_end(key); self.hits += 1
+            return dict(self.entries[key])
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value; self.entries.move_to_end(key); self.dirty += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False); self.evicted += 1
+            if self.dirty >= 5: self._save()
+
+    def has(self, key):
+        with self.lock: return key in self.entries
+
+    def save(self):
+        with self.lock:
+            if self.dirty: self._save()
+
+    def _save(self):
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f: json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp, self.path); self.dirty = 0
+        except OSError as e:
+            print(f"[翻譯快取] 儲存失敗: {e}")
 
-商品名稱：{title}
-商品說明：{clean_desc[:1500]}
+    def snapshot(self):
+        total = self.hits + self.misses
+        return {'entries': len(self.entries), 'max': self.max_entries, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0, 'evicted': self.evicted}
+
+
+translation_cache = TranslationCache(TRANSLATION_CACHE_FILE, TRANSLATION_CACHE_MAX)
+atexit.register(translation_cache.save)
+
+
+def translation_source(description):
+    """快取 key 用的說明文字：去掉 script / style / 標籤與多餘空白"""
+    text = re.sub(r'<(script|style)[^>]*>.*?</\1>', ' ', description or '', flags=re.S | re.I)
+    return re.sub(r'\s+', ' ', re.sub(r'<[^>]+>', ' ', text)).strip()
+
+
+def cached_translation(fn):
+    """translate_with_chatgpt 的快取層；prompt 指紋取自 TRANSLATION_* 常數與翻譯函式內的字串常數，
+    規則 / 詞彙表一改，舊快取自動失效"""
+    consts = [c for f in (fn, translation_input, translation_result) for c in f.__code__.co_consts if isinstance(c, str)]
+    fingerprint = hashlib.sha256(json.dumps([TRANSLATION_PROMPT_VERSION, TRANSLATION_SYSTEM, TRANSLATION_FORMAT,
+                                             TRANSLATION_RULES, consts], ensure_ascii=False)
+                                 .encode('utf-8')).hexdigest()[:16]
+
+    @wraps(fn)
+    def wrapper(title, description, *args, **kwargs):
+        key = translation_key(title, description, *args, **kwargs)
+        hit = translation_cache.get(key)
+        if hit: return hit
+        result = fn(title, description, *args, **kwargs)
+        if result.get('success') and not is_japanese_text(result.get('title', '')): translation_cache.put(key, result)
+        return result
+    wrapper.fingerprint = fingerprint
+    return wrapper
+
+
+def translation_key(title, description, *args, **kwargs):
+    """快取 key：prompt 指紋 + 標題 + 清理後說明 + 其他參數"""
+    return hashlib.sha256(json.dumps([translate_with_chatgpt.fingerprint, title, translation_source(description), args, kwargs],
+                                     ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
 
-只回傳此 JSON 格式，不加 markdown、不加任何其他文字：
-{"title":"翻譯後的商品名稱","description":"翻譯後的商品說明（HTML格式）","page_title":"SEO標題50字以內","meta_description":"SEO描述100字以內"}
 
-規則：
+# ========== 翻譯 prompt ==========
+TRANSLATION_SYSTEM = "你是專業的日本商品翻譯和 SEO 專家。禁止輸出日文。"
+TRANSLATION_FORMAT = '{"title":"翻譯後的商品名稱","description":"翻譯後的商品說明（HTML格式）","page_title":"SEO標題50字以內","meta_description":"SEO描述100字以內"}'
+TRANSLATION_RULES = """規則：
 1. 品牌背景：日本神戶創業百年的高級西式甜點老舖
 2. 標題開頭必須是「本高砂屋」，後接繁體中文商品名，不得省略
 3. 【強制禁止日文】所有輸出必須是繁體中文或英文，不可出現任何平假名或片假名
 4. 詞彙對照：エコルセ→薄餅捲；マンデルチーゲル→杏仁瓦片餅；うす皮→薄皮；金鍔→金鍔餅；詰合せ→綜合禮盒
 5. SEO 關鍵字必須自然融入，包含：本高砂屋、日本、神戶、伴手禮、西式甜點
 6. 只回傳 JSON，不得有任何其他文字"""
+
+
+def translation_input(description):
+    """送進 prompt 的商品說明"""
+    return clean_html_for_translation(description)[:1500]
+
+
+def translation_result(t, title, description):
+    """模型回傳的 JSON → 上架用的翻譯結果"""
+    tt = t.get('title', title)
+    if not tt.startswith('本高砂屋'): tt = f"本高砂屋 {tt}"
+    return {'success': True, 'title': tt, 'description': t.get('description', description),
+            'page_title': t.get('page_title', ''), 'meta_description': t.get('meta_description', '')}
+
+
+@cached_translation
+def translate_with_chatgpt(title, description, retry=False):
+    prompt = f"""你是專業的日本商品翻譯和 SEO 專家。將以下日本商品資訊翻譯成繁體中文並優化 SEO。
+
+商品名稱：{title}
+商品說明：{translation_input(description)}
+
+只回傳此 JSON 格式，不加 markdown、不加任何其他文字：
+{TRANSLATION_FORMAT}
+
+{TRANSLATION_RULES}"""
     try:
-        r = requests.post("https://api.openai.com/v1/chat/completions",
-            headers={"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"},
-            json={"model": "gpt-4o-mini", "messages": [
-                {"role": "system", "content": "你是專業的日本商品翻譯和 SEO 專家。禁止輸出日文。"},
+        r = openai_chat({"model": "gpt-4o-mini", "messages": [
+                {"role": "system", "content": TRANSLATION_SYSTEM},
                 {"role": "user", "content": prompt}], "temperature": 0, "max_tokens": 1000}, timeout=60)
         if r.status_code == 200:
             c = r.json()['choices'][0]['message']['content'].strip()
             if c.startswith('```'): c = c.split('\n', 1)[1]
             if c.endswith('```'): c = c.rsplit('```', 1)[0]
             t = json.loads(c.strip())
-            tt = t.get('title', title)
-            if not tt.startswith('本高砂屋'): tt = f"本高砂屋 {tt}"
-            return {'success': True, 'title': tt, 'description': t.get('description', description),
-                    'page_title': t.get('page_title', ''), 'meta_description': t.get('meta_description', '')}
+            return translation_result(t, title, description)
         else:
             return {'success': False, 'error': f"HTTP {r.status_code}: {r.text[:200]}",
                     'title': f"本高砂屋 {title}", 'description': description, 'page_title': '', 'meta_description': ''}
@@ -175,15 +541,13 @@ def translate_with_chatgpt(title, description, retry=False):
 
 def download_image_to_base64(img_url, max_retries=3):
     headers = {'User-Agent': 'Mozilla/5.0', 'Accept': 'image/*', 'Referer': 'https://www.hontaka-shop.com/'}
-    for attempt in range(max_retries):
-        try:
-            r = requests.get(img_url, headers=headers, timeout=30)
-            if r.status_code == 200:
-                ct = r.headers.get('Content-Type', 'image/jpeg')
-                fmt = 'image/png' if 'png' in ct else 'image/gif' if 'gif' in ct else 'image/jpeg'
-                return {'success': True, 'base64': base64.b64encode(r.content).decode('utf-8'), 'content_type': fmt}
-        except: pass
-        time.sleep(1)
+    try:
+        r = client.get(img_url, headers=headers, timeout=30, retries=max_retries)
+        if r.status_code == 200:
+            ct = r.headers.get('Content-Type', 'image/jpeg')
+            fmt = 'image/png' if 'png' in ct else 'image/gif' if 'gif' in ct else 'image/jpeg'
+            return {'success': True, 'base64': base64.b64encode(r.content).decode('utf-8'), 'content_type': fmt}
+    except: pass
     return {'success': False}
 
 
@@ -191,7 +555,7 @@ def get_existing_products_map():
     pm = {}
     url = shopify_api_url("products.json?limit=250")
     while url:
-        r = requests.get(url, headers=get_shopify_headers())
+        r = client.get(url, headers=get_shopify_headers())
         if r.status_code != 200: break
         for p in r.json().get('products', []):
             pid = p.get('id')
@@ -214,7 +578,7 @@ def get_collection_products_map(collection_id):
     if not collection_id: return pm
     url = shopify_api_url(f"collections/{collection_id}/products.json?limit=250")
     while url:
-        r = requests.get(url, headers=get_shopify_headers())
+        r = client.get(url, headers=get_shopify_headers())
         if r.status_code != 200: break
         for p in r.json().get('products', []):
             pid = p.get('id')
@@ -238,7 +602,7 @@ def get_hontaka_products_map():
     pm = {}
     url = shopify_api_url("products.json?limit=250&vendor=本高砂屋")
     while url:
-        r = requests.get(url, headers=get_shopify_headers())
+        r = client.get(url, headers=get_shopify_headers())
         if r.status_code != 200: break
         for p in r.json().get('products', []):
             pid = p.get('id')
@@ -258,88 +622,258 @@ def get_hontaka_products_map():
 
 
 def delete_product(pid):
-    return requests.delete(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers()).status_code == 200
+    return client.delete(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers()).status_code == 200
 
 
 def update_product(pid, data):
-    r = requests.put(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers(),
+    r = client.put(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers(),
         json={"product": {"id": pid, **data}})
     return r.status_code == 200, r
 
 
 def get_or_create_collection(ct="本高砂屋"):
-    r = requests.get(shopify_api_url(f'custom_collections.json?title={ct}'), headers=get_shopify_headers())
+    r = client.get(shopify_api_url(f'custom_collections.json?title={ct}'), headers=get_shopify_headers())
     if r.status_code == 200:
         for c in r.json().get('custom_collections', []):
             if c['title'] == ct: return c['id']
-    r = requests.post(shopify_api_url('custom_collections.json'), headers=get_shopify_headers(),
+    r = client.post(shopify_api_url('custom_collections.json'), headers=get_shopify_headers(),
         json={'custom_collection': {'title': ct, 'published': True}})
     if r.status_code == 201: return r.json()['custom_collection']['id']
     return None
 
 
 def add_product_to_collection(pid, cid):
-    return requests.post(shopify_api_url('collects.json'), headers=get_shopify_headers(),
+    return client.post(shopify_api_url('collects.json'), headers=get_shopify_headers(),
         json={'collect': {'product_id': pid, 'collection_id': cid}}).status_code == 201
 
 
 def publish_to_all_channels(pid):
     gu = f"https://{SHOPIFY_SHOP}.myshopify.com/admin/api/2024-01/graphql.json"
     hd = {'X-Shopify-Access-Token': SHOPIFY_ACCESS_TOKEN, 'Content-Type': 'application/json'}
-    r = requests.post(gu, headers=hd, json={'query': '{ publications(first:20){ edges{ node{ id name }}}}'})
+    r = client.post(gu, headers=hd, json={'query': '{ publications(first:20){ edges{ node{ id name }}}}'})
     if r.status_code != 200: return False
     pubs = r.json().get('data', {}).get('publications', {}).get('edges', [])
     seen = set(); uq = []
     for p in pubs:
         if p['node']['name'] not in seen: seen.add(p['node']['name']); uq.append(p['node'])
     mut = """mutation publishablePublish($id:ID!,$input:[PublicationInput!]!){publishablePublish(id:$id,input:$input){userErrors{field message}}}"""
-    requests.post(gu, headers=hd, json={'query': mut, 'variables': {"id": f"gid://shopify/Product/{pid}", "input": [{"publicationId": p['id']} for p in uq]}})
+    client.post(gu, headers=hd, json={'query': mut, 'variables': {"id": f"gid://shopify/Product/{pid}", "input": [{"publicationId": p['id']} for p in uq]}})
     return True
 
 
+# ========== 尺寸 / 重量抽取引擎 ==========
+SIZE_TRANS = str.maketrans({'×': 'x', '✕': 'x', 'Φ': '', 'φ': '', ',': ''})
+SIZE_NUM = r'(\d+(?:\.\d+)?)'
+SIZE_LABEL = r'(?:[WDHL]|縦|横|高さ|タテ|ヨコ|奥行き?|幅)?'
+
+
+class SizeWeightRule:
+    """尺寸 + 重量單次抽取：NFKC 正規化（全形數字 / ｍｍ / ㎏ 等）後，一條編譯好的 regex
+    finditer 一遍同時收尺寸與重量，單位統一成 cm / kg。
+    dim_unit：尺寸沒寫單位時當作的單位（None = 必須寫單位）；weight_units：接受的重量單位，順序即優先序；
+    weight_end：g 之後不可接的字元；cylinder：允許「直徑 x 高 mm」兩維"""
+    def __init__(self, dim_prefix='', weight_prefix='', dim_unit=None, weight_units=('kg', 'g'),
+                 weight_end=r'(?![a-z0-9])', cylinder=False, dims=True, ndigits=2):
+        dim = (rf'{dim_prefix}{SIZE_LABEL}\s*(?P<a>\d+(?:\.\d+)?)\s*(?P<ua>mm|cm)?\s*x\s*'
+               rf'{SIZE_LABEL}\s*(?P<b>\d+(?:\.\d+)?)\s*(?P<ub>mm|cm)?'
+               rf'(?:\s*x\s*{SIZE_LABEL}\s*(?P<c>\d+(?:\.\d+)?))?(?:\s*\(?\s*(?P<u>mm|cm)(?:\s*\))?)?')
+        wt = rf'{weight_prefix}(?P<w>\d+(?:\.\d+)?)\s*(?P<wu>kg|g{weight_end})'
+        parts = ([f'(?P<dim>{dim})'] if dims else []) + ([f'(?P<wt>{wt})'] if weight_units else [])
+        self.rx = re.compile('|'.join(parts), re.I)
+        self.dim_unit = dim_unit; self.weight_units = weight_units
+        self.cylinder = cylinder; self.dims = dims; self.ndigits = ndigits
+
+    def __call__(self, text):
+        box = cyl = None; weights = {}
+        for m in self.rx.finditer(unicodedata.normalize('NFKC', text or '').translate(SIZE_TRANS)):
+            if m.lastgroup == 'wt':
+                u = m['wu'].lower()
+                if u in self.weight_units and u not in weights:
+                    weights[u] = float(m['w']) / (1000 if u == 'g' else 1)
+            else:
+                units = [m['ua'] or m['u'] or self.dim_unit, m['ub'] or m['u'] or self.dim_unit, m['u'] or self.dim_unit]
+                nums = [n for n in (m['a'], m['b'], m['c']) if n is not None]
+                if not all(units[:len(nums)]): continue
+                vals = [float(n) / (10 if un.lower() == 'mm' else 1) for n, un in zip(nums, units)]
+                if len(vals) == 3 and box is None: box = vals
+                elif len(vals) == 2 and self.cylinder and cyl is None and (m['u'] or m['ub']): cyl = vals
+            if (box or not self.dims) and len(weights) == len(self.weight_units): break
+        weight = next((weights[u] for u in self.weight_units if u in weights), None)
+        dimension = None
+        if box:
+            l, w, h = box
+            dimension = {'l': l, 'w': w, 'h': h, 'volume_weight': round(l * w * h / 6000, self.ndigits)}
+        elif cyl:
+            d, h = cyl
+            dimension = {'diameter': d, 'height': h, 'volume_weight': round(math.pi * (d / 2) ** 2 * h / 6000, self.ndigits)}
+        vw = dimension['volume_weight'] if dimension else 0
+        return {'dimension': dimension, 'actual_weight': round(weight, 3) if weight else None,
+                'volume_weight': vw, 'final_weight': round(max(vw, weight or 0), self.ndigits)}
+
+
+SIZE_RULE = SizeWeightRule(weight_prefix=r'重量[:\s]*')
+SIZE_FIXTURES = [  # (文字, actual_weight, final_weight)：改 SIZE_RULE 後打 /api/test-size 對一遍
+    ('200×150×60mm 450g', None, 0.3),
+    ('200×150×60mm\u3000450g', None, 0.3),
+    ('200×150×60mm\n450g', None, 0.3),
+    ('120mm×80mm×40mm 250g', None, 0.06),
+    ('200×150×60mm 重量：450g', 0.45, 0.45),
+    ('200×150×60mm\n重量 1.2kg', 1.2, 1.2),
+]
+
+
 def parse_dimension_weight(text):
-    result = {'dimension': None, 'actual_weight': None, 'volume_weight': 0, 'final_weight': 0}
-    text = text.replace('×', 'x').replace('Ｘ', 'x').replace('ｘ', 'x')
-    text = text.replace('ｍｍ', 'mm').replace('ｇ', 'g').replace('ｋｇ', 'kg').replace(',', '')
-    dm = re.search(r'(\d+(?:\.\d+)?)\s*[xX×]\s*(\d+(?:\.\d+)?)\s*[xX×]?\s*(\d+(?:\.\d+)?)\s*mm', text, re.IGNORECASE)
-    if dm:
-        l, w, h = float(dm.group(1)), float(dm.group(2)), float(dm.group(3))
-        result['volume_weight'] = round((l * w * h) / 6000000, 2)
-        result['dimension'] = {'length': l, 'width': w, 'height': h}
-    wm = re.search(r'重量[：:\s]*(\d+(?:\.\d+)?)\s*(g|kg)', text, re.IGNORECASE)
-    if wm:
-        wv = float(wm.group(1))
-        result['actual_weight'] = round(wv / 1000 if wm.group(2).lower() == 'g' else wv, 3)
-    if result['volume_weight'] and result['actual_weight']:
-        result['final_weight'] = max(result['volume_weight'], result['actual_weight'])
-    elif result['volume_weight']: result['final_weight'] = result['volume_weight']
-    elif result['actual_weight']: result['final_weight'] = result['actual_weight']
-    return result
+    return SIZE_RULE(text)
 
 
-def scrape_product_list():
-    products = []; page_num = 1
-    while page_num <= 20:
-        url = LIST_BASE_URL if page_num == 1 else LIST_PAGE_URL_TEMPLATE.format(page=page_num)
+# ========== MakeShop 共用爬蟲 ==========
+# hontaka / kobe-fugetsudo 共用同一份實作，只差 MAKESHOP_LIST_HREF 與各店的標題 / 圖片範圍
+MAKESHOP_PARSER = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+MAKESHOP_ENCODING = 'euc-jp'
+MAKESHOP_FALLBACK_ENCODING = 'euc_jis_2004'  # 涵蓋 NEC 特殊文字 13 區（① ㎝ №…），euc-jp 解不出來
+MAKESHOP_LIST_HREF = re.compile(r'/shopdetail/(\d{12})/')
+MAKESHOP_THUMB = re.compile(r'/s(\d)_')
+
+
+def makeshop_text(raw):
+    """EUC-JP 解碼；頁面含 NEC 特殊文字時 euc-jp 會失敗，改用 euc_jis_2004（仍解不出的字換成 �）"""
+    try: return raw.decode(MAKESHOP_ENCODING)
+    except UnicodeDecodeError: return raw.decode(MAKESHOP_FALLBACK_ENCODING, 'replace')
+
+
+def makeshop_soup(raw):
+    """先在 Python 解碼再交給 parser：bytes 直接給 lxml 時，遇到 NEC 特殊文字會整份解析成空文件。
+    lxml 仍解出空文件時退回 html.parser"""
+    text = makeshop_text(raw); soup = BeautifulSoup(text, MAKESHOP_PARSER)
+    if MAKESHOP_PARSER != 'html.parser' and soup.body is None and text.strip():
+        soup = BeautifulSoup(text, 'html.parser')
+    return soup
+
+
+def makeshop_page(sess, url, hedged=False, **kwargs):
+    r = (sess.get_hedged if hedged else sess.get)(url, timeout=30, **kwargs)
+    if r.status_code != 200: return None
+    return makeshop_soup(r.content)
+
+
+def makeshop_list_codes(soup):
+    """列表頁的商品代碼（12 碼 brandcode），依出現順序去重"""
+    codes = []
+    for a in soup.find_all('a', href=MAKESHOP_LIST_HREF):
+        code = MAKESHOP_LIST_HREF.search(a['href']).group(1)
+        if code not in codes: codes.append(code)
+    return codes
+
+
+def makeshop_price(soup, page_text):
+    """カートフォームの price1 / M_price2 → product:price:amount meta → 「税込 N円」→ 頁面第一個 ≥100 的「N円」"""
+    for el, attr in ((soup.find('input', {'name': 'price1'}), 'value'), (soup.find('input', {'id': 'M_price2'}), 'value'),
+                     (soup.find('meta', property='product:price:amount'), 'content')):
         try:
-            r = requests.get(url, headers=HEADERS, timeout=30); r.encoding = 'euc-jp'
-            if r.status_code != 200: break
-            soup = BeautifulSoup(r.text, 'html.parser')
-            pls = soup.find_all('a', href=re.compile(r'/shopdetail/\d{12}/'))
-            if not pls: break
-            seen = set(); pp = []
-            for l in pls:
-                sm = re.search(r'/shopdetail/(\d{12})/', l.get('href', ''))
-                if sm and sm.group(1) not in seen:
-                    seen.add(sm.group(1))
-                    pp.append({'url': f"{BASE_URL}/shopdetail/{sm.group(1)}/", 'sku': sm.group(1)})
-            if not pp: break
-            products.extend(pp); page_num += 1; time.sleep(0.5)
-        except: break
-    unique = []; us = set()
-    for p in products:
-        if p['sku'] not in us: us.add(p['sku']); unique.append(p)
-    return unique
+            if el and el.get(attr): return int(el.get(attr).replace(',', ''))
+        except ValueError: pass
+    m = re.search(r'税込\s*([\d,]+)\s*円', page_text)
+    if m: return int(m.group(1).replace(',', ''))
+    for pm in re.findall(r'(\d{1,3}(?:,\d{3})*)\s*円', page_text):
+        pv = int(pm.replace(',', ''))
+        if pv >= 100: return pv
+    return 0
+
+
+def makeshop_images(soup, selectors, keep=None, thumbs=True, limit=10):
+    """商品圖：selectors 依序收集，去掉 query 後去重、略過 noimage。
+    縮圖（s1_xxx）thumbs=True 換成原圖 1_xxx，False 直接略過（範圍含推薦商品縮圖時）"""
+    images = []; seen = set()
+    for sel in selectors:
+        for img in soup.select(sel):
+            src = img.get('src', '')
+            if not src or 'noimage' in src.lower() or (keep and not keep(src)): continue
+            if MAKESHOP_THUMB.search(src):
+                if not thumbs: continue
+                src = MAKESHOP_THUMB.sub(r'/\1_', src)
+            key = src.split('?')[0]
+            if key not in seen: seen.add(key); images.append(src)
+    return images[:limit]
+
+
+# ========== 分頁列表引擎 ==========
+
+LISTING_WINDOW = 4
+
+
+def stream_listing(load_page, seen=None, max_pages=20, window=LISTING_WINDOW):
+    """一次平行預抓 window 頁、依頁序輸出；load_page(n) 回傳 (records, has_more)。
+    None / 空頁 / 整頁都是已見過的 SKU（被導回第一頁）/ has_more=False 皆視為到底。
+    seen 可跨分類共用，逐筆 yield 讓呼叫端邊列表邊抓詳情。"""
+    seen = set() if seen is None else seen
+    page = 1
+    with ThreadPoolExecutor(max_workers=window) as pool:
+        while page <= max_pages:
+            batch = range(page, min(page + window, max_pages + 1))
+            futures = [pool.submit(load_page, n) for n in batch]
+            for n, fu in zip(batch, futures):
+                try: res = fu.result()
+                except Exception as e:
+                    print(f"[列表] 第 {n} 頁失敗: {e}"); return
+                if not res or not res[0]: return
+                records, has_more = res; new_count = 0
+                for rec in records:
+                    if rec['sku'] in seen: continue
+                    seen.add(rec['sku']); new_count += 1
+                    yield rec
+                if new_count == 0 or not has_more: return
+            page += window
+
+
+def fetch_list_page(page_num):
+    url = LIST_BASE_URL if page_num == 1 else LIST_PAGE_URL_TEMPLATE.format(page=page_num)
+    soup = makeshop_page(client, url, headers=HEADERS)
+    if soup is None: return None
+    return [{'url': f"{BASE_URL}/shopdetail/{c}/", 'sku': c} for c in makeshop_list_codes(soup)], True
+
+
+def stream_product_list():
+    return stream_listing(fetch_list_page, max_pages=20)
+
+
+def scrape_product_list():
+    return list(stream_product_list())
+
+
+# ========== 庫存判定（商品區塊內單次多關鍵字掃描） ==========
+class StockDetector:
+    """缺貨關鍵字編成一條 alternation regex，只在商品 / 購物車區塊內掃一次，
+    頁尾、推薦商品裡的「品切れ」不會誤判。region 依序嘗試，第一個命中的 selector 為準，
+    全部沒命中時退回整頁文字（舊行為）。
+    判定順序沿用小倉：缺貨字 → 在庫 ○△× → 購物車（正向訊號，看整頁）→ 缺貨 class"""
+    def __init__(self, sold_out, region=(), marker=r'在庫[：:]\s*([○△×])',
+                 cart=None, cart_text=None, sold_out_css=None):
+        self.sold_out = re.compile('|'.join(map(re.escape, sold_out)))
+        self.region = region; self.marker = re.compile(marker) if marker else None
+        self.cart = cart; self.cart_text = cart_text; self.sold_out_css = sold_out_css
+
+    def scope(self, soup):
+        for sel in self.region:
+            nodes = soup.select(sel)
+            if nodes: return nodes
+        return None
+
+    def __call__(self, soup, page_text=None):
+        nodes = self.scope(soup)
+        if page_text is None and (not nodes or self.cart_text): page_text = soup.get_text()
+        text = '\n'.join(n.get_text() for n in nodes) if nodes else page_text
+        if self.sold_out.search(text): return False
+        if self.marker:
+            m = self.marker.search(text)
+            if m: return m.group(1) != '×'
+        if (self.cart or self.cart_text) and not (
+                (self.cart and soup.select_one(self.cart)) or (self.cart_text and self.cart_text in page_text)):
+            return False
+        if self.sold_out_css and any(n.select_one(self.sold_out_css) for n in (nodes or [soup])): return False
+        return True
+
+
+STOCK_RULE = StockDetector(['売切れ', '在庫なし', 'SOLD OUT'], ('#itemInfo', 'form[name="form1"]'))  # MakeShop 商品 / カートフォーム
 
 
 def scrape_product_detail(url):
@@ -348,9 +882,9 @@ def scrape_product_detail(url):
     sm = re.search(r'/shopdetail/(\d{12})/', url)
     if sm: product['sku'] = sm.group(1)
     try:
-        r = requests.get(url, headers=HEADERS, timeout=30); r.encoding = 'euc-jp'
-        if r.status_code != 200: return product
-        soup = BeautifulSoup(r.text, 'html.parser'); pt = soup.get_text()
+        soup = makeshop_page(client, url, hedged=True, headers=HEADERS)
+        if soup is None: return product
+        pt = soup.get_text()
         tt = soup.find('title')
         if tt:
             tp = tt.get_text(strip=True).split('-')
@@ -360,22 +894,8 @@ def scrape_product_detail(url):
             if h2: product['title'] = h2.get_text(strip=True)
         cm = re.search(r'〔(\d+)〕', product['title'])
         if cm: product['product_code'] = cm.group(1)
-        pi = soup.find('input', {'name': 'price1'})
-        if pi and pi.get('value'):
-            try: product['price'] = int(pi.get('value').replace(',', ''))
-            except: pass
-        if not product['price']:
-            pi2 = soup.find('input', {'id': 'M_price2'})
-            if pi2 and pi2.get('value'):
-                try: product['price'] = int(pi2.get('value').replace(',', ''))
-                except: pass
-        if not product['price']:
-            for pm in re.findall(r'(\d{1,3}(?:,\d{3})*)\s*円', pt):
-                try:
-                    pv = int(pm.replace(',', ''))
-                    if pv >= 100: product['price'] = pv; break
-                except: pass
-        if any(kw in pt for kw in ['売切れ', '在庫なし', 'SOLD OUT']): product['in_stock'] = False
+        product['price'] = makeshop_price(soup, pt)
+        product['in_stock'] = STOCK_RULE(soup, pt)
         desc_parts = []
         dm = re.search(r'商品[説說]明[：:]\s*(.+?)(?=---|\n\n|内容量|賞味期限)', pt, re.DOTALL)
         if dm: desc_parts.append(dm.group(1).strip())
@@ -390,15 +910,10 @@ def scrape_product_detail(url):
         product['description'] = '\n\n'.join(desc_parts) if desc_parts else ''
         wi = parse_dimension_weight(f"サイズ：{product['size_text']} 重量：{product['weight_text']}")
         product['weight'] = wi['final_weight']
-        images = []; seen_img = set()
-        for img in soup.find_all('img', src=re.compile(r'makeshop-multi-images\.akamaized\.net')):
-            src = img.get('src', '')
-            if src and 'shophontaka' in src and '/shopimages/' in src and '/itemimages/' not in src:
-                fn = src.split('/')[-1].split('?')[0]
-                if not (fn.startswith('s') and len(fn) > 1 and fn[1].isdigit()):
-                    cs = src.split('?')[0]
-                    if cs not in seen_img: seen_img.add(cs); images.append(src)
+        images = makeshop_images(soup, ('img[src*="makeshop-multi-images.akamaized.net"]',), thumbs=False,
+                                 keep=lambda s: 'shophontaka' in s and '/shopimages/' in s and '/itemimages/' not in s)
         if not images:
+            seen_img = set()
             for iu in re.findall(r'(https://makeshop-multi-images\.akamaized\.net/shophontaka/shopimages/[^"\']+\.(?:jpg|jpeg|png|gif))', str(soup), re.IGNORECASE):
                 fn = iu.split('/')[-1].split('?')[0]
                 if not (fn.startswith('s') and len(fn) > 1 and fn[1].isdigit()):
@@ -428,7 +943,6 @@ def upload_to_shopify(product, collection_id=None):
         result = download_image_to_base64(iu)
         if result['success']:
             images_b64.append({'attachment': result['base64'], 'position': idx+1, 'filename': f"hontaka_{product['sku']}_{idx+1}.jpg"})
-        time.sleep(0.3)
     sku = product.get('product_code') or product['sku']
     sp = {'product': {
         'title': translated['title'], 'body_html': translated['description'] + SHIPPING_HTML,
@@ -440,10 +954,10 @@ def upload_to_shopify(product, collection_id=None):
         'metafields_global_description_tag': translated['meta_description'],
         'metafields': [{'namespace': 'custom', 'key': 'link', 'value': product['url'], 'type': 'url'}]
     }}
-    r = requests.post(shopify_api_url('products.json'), headers=get_shopify_headers(), json=sp)
+    r = client.post(shopify_api_url('products.json'), headers=get_shopify_headers(), json=sp)
     if r.status_code == 201:
         cp = r.json()['product']; pid = cp['id']; vid = cp['variants'][0]['id']
-        requests.put(shopify_api_url(f'variants/{vid}.json'), headers=get_shopify_headers(),
+        client.put(shopify_api_url(f'variants/{vid}.json'), headers=get_shopify_headers(),
             json={'variant': {'id': vid, 'cost': f"{cost:.2f}"}})
         if collection_id: add_product_to_collection(pid, collection_id)
         publish_to_all_channels(pid)
@@ -500,7 +1014,6 @@ def sync_delete_stale_products():
                     print(f"[v2.3 sync] ✓ 已刪除 {sku} (ID: {pid})")
                 else:
                     log["errors"].append(f"刪除失敗: {sku}")
-            time.sleep(0.3)
 
         print(f"[v2.3 sync] 完成，共刪除 {len(log['deleted_skus'])} 筆")
         sync_status['current_step'] = f"完成，刪除 {len(log['deleted_skus'])} 筆"
@@ -536,6 +1049,7 @@ def start_auto_sync_scheduler():
 
 def run_scrape():
     global scrape_status
+    retry_budget.reset()
     try:
         scrape_status.update({"running": True, "progress": 0, "total": 0, "current_product": "",
             "products": [], "errors": [], "uploaded": 0, "skipped": 0, "skipped_exists": 0,
@@ -555,15 +1069,13 @@ def run_scrape():
         hontaka_skus = set(hontaka_pm.keys())
 
         scrape_status['current_product'] = "爬取商品列表..."
-        product_list = scrape_product_list()
-        scrape_status['total'] = len(product_list)
-
         website_skus = set()
         # === v2.2: 記錄缺貨的 SKU ===
         out_of_stock_skus = set()
         ctf = 0
 
-        for idx, item in enumerate(product_list):
+        for idx, item in enumerate(stream_product_list()):
+            scrape_status['total'] = idx + 1
             scrape_status['progress'] = idx + 1
             scrape_status['current_product'] = f"處理: {item['sku']}"
 
@@ -596,7 +1108,6 @@ def run_scrape():
                     scrape_status['errors'].append({'error': f'翻譯連續失敗 {ctf} 次，自動停止'}); break
             else:
                 scrape_status['errors'].append({'sku': actual_sku, 'error': result.get('error','')}); ctf = 0
-            time.sleep(1)
 
         if not scrape_status['translation_stopped']:
             scrape_status['current_product'] = "清理缺貨/下架商品..."
@@ -630,7 +1141,6 @@ def run_scrape():
                                 print(f"[已刪除] SKU: {sku}, Product ID: {pid}")
                             else:
                                 scrape_status['errors'].append({'sku': sku, 'error': '刪除失敗'})
-                        time.sleep(0.3)
             else:
                 msg = f"⚠️ 官網只爬到 {len(website_skus)} 筆（安全閾值 {MIN_SCRAPED_PRODUCTS_FOR_DELETE}），跳過刪除"
                 scrape_status['errors'].append({'error': msg})
@@ -652,7 +1162,7 @@ def get_hontaka_duplicate_groups():
     products = []
     url = shopify_api_url("products.json?limit=250&vendor=本高砂屋&fields=id,title,variants,created_at,image")
     while url:
-        r = requests.get(url, headers=get_shopify_headers())
+        r = client.get(url, headers=get_shopify_headers())
         if r.status_code != 200: break
         for p in r.json().get('products', []):
             sku = ''
@@ -690,7 +1200,6 @@ def run_dedup():
                     dedup_status["deleted"] += 1
                 else:
                     dedup_status["errors"].append(f"刪除失敗 ID:{p['id']} SKU:{group['sku']}")
-                time.sleep(0.3)
     except Exception as e:
         dedup_status["errors"].append(str(e))
     finally:
@@ -829,7 +1338,7 @@ def run_update_shipping():
         pids = []
         url = shopify_api_url("products.json?limit=250&vendor=本高砂屋&fields=id,body_html")
         while url:
-            r = requests.get(url, headers=get_shopify_headers())
+            r = client.get(url, headers=get_shopify_headers())
             if r.status_code != 200:
                 update_shipping_status["errors"].append(f"取得商品列表失敗: {r.status_code}")
                 break
@@ -845,7 +1354,7 @@ def run_update_shipping():
                 if "國際運費" in body:
                     update_shipping_status["skipped"] += 1
                     continue
-                ru = requests.put(
+                ru = client.put(
                     shopify_api_url(f"products/{pid}.json"),
                     headers=get_shopify_headers(),
                     json={"product": {"id": pid, "body_html": body + SHIPPING_HTML}}
@@ -961,7 +1470,7 @@ def api_scan_japanese():
     products = []
     url = shopify_api_url("products.json?limit=250&vendor=本高砂屋")
     while url:
-        r = requests.get(url, headers=get_shopify_headers())
+        r = client.get(url, headers=get_shopify_headers())
         if r.status_code != 200: break
         for p in r.json().get('products', []):
             sku = ''; price = ''
@@ -984,7 +1493,7 @@ def api_retranslate_product():
     pid = data.get('product_id')
     if not pid:
         return jsonify({'error': '缺少 product_id'}), 400
-    resp = requests.get(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers())
+    resp = client.get(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers())
     if resp.status_code != 200:
         return jsonify({'error': f'無法取得: {resp.status_code}'}), 400
     product = resp.json().get('product', {})
@@ -1049,9 +1558,34 @@ def api_test_translate():
     return jsonify(result)
 
 
+@app.route('/api/bench-parse')
+def api_bench_parse():
+    """MakeShop 解析比較：同一份解碼後的頁面，html.parser vs MAKESHOP_PARSER（含解碼）。
+    只收 ?code=商品代碼 或 ?page=列表頁碼，網址一律由 BASE_URL 組出（不接受任意網址）；n 最多 50 次"""
+    code = request.args.get('code', ''); page = request.args.get('page', '1'); n = request.args.get('n', '10')
+    if code and not code.isdecimal(): return jsonify({'error': 'code 必須是商品代碼（數字）'}), 400
+    if not page.isdecimal() or int(page) < 1: return jsonify({'error': 'page 必須是正整數'}), 400
+    n = max(1, min(int(n), 50)) if n.isdecimal() else 10
+    url = (f"{BASE_URL}/shopdetail/{code}/" if code else
+           LIST_BASE_URL if int(page) == 1 else LIST_PAGE_URL_TEMPLATE.format(page=int(page)))
+    r = client.get(url, timeout=30, headers=HEADERS)
+    if r.status_code != 200: return jsonify({'error': f'HTTP {r.status_code}', 'url': url}), 502
+    raw = r.content
+    runs = {'html.parser': lambda: BeautifulSoup(makeshop_text(raw), 'html.parser').get_text(),
+            MAKESHOP_PARSER: lambda: makeshop_soup(raw).get_text()}
+    result = {}
+    for name, fn in runs.items():
+        t0 = time.perf_counter()
+        for _ in range(n): fn()
+        result[name] = round((time.perf_counter() - t0) / n * 1000, 2)
+    return jsonify({'url': url, 'bytes': len(raw), 'runs': n, 'parser': MAKESHOP_PARSER, 'ms_per_page': result})
+
+
 @app.route('/api/status')
 def get_status():
-    return jsonify(scrape_status)
+    return jsonify({**scrape_status, 'pacing': pacer_snapshot(), 'retries': retry_budget.snapshot(),
+                    'translation_cache': translation_cache.snapshot(),
+                    'openai': openai_budget.snapshot()})
 
 
 @app.route('/api/start', methods=['POST', 'GET'])
@@ -1070,14 +1604,22 @@ def api_start():
 @app.route('/api/test-shopify')
 def test_shopify():
     if not load_shopify_token(): return jsonify({'success': False, 'error': '未設定 Token'})
-    r = requests.get(shopify_api_url('shop.json'), headers=get_shopify_headers())
+    r = client.get(shopify_api_url('shop.json'), headers=get_shopify_headers())
     if r.status_code == 200: return jsonify({'success': True, 'shop': r.json()['shop']})
     return jsonify({'success': False, 'error': r.text}), 400
 
 
+@app.route('/api/test-size')
+def test_size():
+    rows = [{'text': t, 'expected': [aw, fw], 'got': [r['actual_weight'], r['final_weight']]}
+            for t, aw, fw in SIZE_FIXTURES for r in [SIZE_RULE(t)]]
+    failed = [r for r in rows if r['expected'] != r['got']]
+    return jsonify({'success': not failed, 'total': len(rows), 'failed': failed})
+
+
 if __name__ == '__main__':
     print("=" * 50)
-    print("本高砂屋 爬蟲工具 v2.3")
+    print("本高砂屋 爬蟲工具 v2.8")
     print("修復: 重複上架 / 安全檢查 / 自動排程")
     print("=" * 50)
     port = int(os.environ.get('PORT', 8080))
@@ -1,20 +1,34 @@
 """
-砂糖奶油樹（シュガーバターの木）商品爬蟲 + Shopify 上架工具 v2.2
+砂糖奶油樹（シュガーバターの木）商品爬蟲 + Shopify 上架工具 v2.7
 v2.1: 翻譯保護機制、日文商品掃描、測試翻譯
 v2.2: 缺貨商品自動刪除 - 官網消失或缺貨皆直接刪除
+v2.3: 分頁列表平行預抓（stream_listing），邊列表邊處理詳情
+v2.4: sitemap lastmod 增量（SITEMAP_INCREMENTAL）：lastmod 未變的商品沿用上次價格 / 庫存，不抓詳情頁
+v2.5: 翻譯快取 - 依 prompt 指紋 + 標題 + 清理後說明的 hash 存檔（translation_cache.json），LRU 上限，/api/status 回報命中率
+v2.6: 翻譯 prompt 拆成 TRANSLATION_* 常數與 translation_result()；修正 prompt JSON 範例大括號造成的 f-string 錯誤
+v2.7: OpenAI 請求改走獨立 keep-alive 連線池（TRANSLATE_WORKERS + 2 條連線），受 OPENAI_RPM / OPENAI_TPM 預算控管，429 依 Retry-After 全部暫停後重送
 """
 
 from flask import Flask, jsonify, request
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import re
+import unicodedata
 import json
+import xml.etree.ElementTree as ET
 import os
 import sys
 import time
-from urllib.parse import urljoin
+import random
+from urllib.parse import urljoin, urlparse
 import math
 import threading
+import hashlib
+import atexit
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
 
 if getattr(sys, 'frozen', False):
     BASE_DIR = sys._MEIPASS
@@ -37,8 +51,174 @@ BROWSER_HEADERS = {
     'Accept-Language': 'ja,en-US;q=0.9,en;q=0.8,zh-TW;q=0.7',
     'Referer': 'https://www.paqtomog.com/',
 }
-session = requests.Session()
+# ========== 每個 origin 的自適應節流（AIMD） ==========
+
+class OriginPacer:
+    """依回應延遲、429/503 與錯誤率調整請求間隔與併發：
+    順利時間隔線性遞減、併發逐步 +1；被限流 / 出錯時間隔加倍、併發減半"""
+    MIN_DELAY, MAX_DELAY, MAX_LIMIT = 0.05, 30.0, 8
+
+    def __init__(self, host, delay=0.5, limit=2):
+        self.host = host; self.delay = delay; self.limit = limit
+        self.active = 0; self.next_at = 0.0; self.streak = 0
+        self.latency = 0.0; self.ok = 0; self.throttled = 0; self.errors = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.active >= self.limit: self.cond.wait()
+            self.active += 1
+            now = time.time(); start = max(now, self.next_at)
+            self.next_at = start + self.delay
+        if start > now: time.sleep(start - now)
+
+    def release(self, status, elapsed, retry_after=None):
+        with self.cond:
+            self.active -= 1
+            slow = self.latency > 0 and elapsed > self.latency * 3
+            self.latency = elapsed if not self.latency else self.latency * 0.8 + elapsed * 0.2
+            if status is None or status in (429, 503) or status >= 500:
+                if status in (429, 503): self.throttled += 1
+                else: self.errors += 1
+                self.delay = min(self.MAX_DELAY, max(self.delay * 2, retry_after or 0, 0.5))
+                self.limit = max(1, self.limit // 2); self.streak = 0
+                self.next_at = max(self.next_at, time.time() + self.delay)
+            elif slow:
+                self.ok += 1; self.streak = 0
+                self.delay = min(self.MAX_DELAY, self.delay * 1.5)
+            else:
+                self.ok += 1; self.streak += 1
+                self.delay = max(self.MIN_DELAY, self.delay - 0.05)
+                if self.streak >= self.limit * 4 and self.limit < self.MAX_LIMIT:
+                    self.limit += 1; self.streak = 0
+            self.cond.notify_all()
+
+    def snapshot(self):
+        return {'delay': round(self.delay, 2), 'rate_per_sec': round(1 / self.delay, 2),
+                'concurrency': self.limit, 'active': self.active, 'latency': round(self.latency, 2),
+                'ok': self.ok, 'throttled': self.throttled, 'errors': self.errors}
+
+
+origin_pacers = {}
+origin_pacers_lock = threading.Lock()
+
+
+def pacer_for(url):
+    host = urlparse(url).netloc
+    with origin_pacers_lock:
+        if host not in origin_pacers: origin_pacers[host] = OriginPacer(host)
+        return origin_pacers[host]
+
+
+def pacer_snapshot():
+    return {h: p.snapshot() for h, p in list(origin_pacers.items())}
+
+
+# ========== 重試（指數退避 + jitter、每輪預算）與 hedged request ==========
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'}
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "true").lower() == "true"
+
+
+class RetryBudget:
+    """每輪爬取可用的重試 / hedge 次數上限，避免官網故障時重試把流量放大"""
+    def __init__(self, limit=200):
+        self.limit = limit; self.used = 0; self.hedged = 0; self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock: self.used = 0; self.hedged = 0
+
+    def take(self):
+        with self.lock:
+            if self.used >= self.limit: return False
+            self.used += 1; return True
+
+    def snapshot(self):
+        return {'used': self.used, 'limit': self.limit, 'hedged': self.hedged}
+
+
+retry_budget = RetryBudget()
+hedge_pool = ThreadPoolExecutor(max_workers=4)
+
+
+def retry_after_of(r):
+    ra = r.headers.get('Retry-After', '')
+    return float(ra) if ra.isdigit() else None
+
+
+def backoff_delay(attempt, retry_after=None, base=0.5, cap=20.0):
+    """指數退避 + full jitter；有 Retry-After 時不低於它"""
+    return max(random.uniform(0, min(cap, base * (2 ** attempt))), retry_after or 0)
+
+
+class PacedSession(requests.Session):
+    """所有請求先經過該 origin 的 OriginPacer，回應再回饋給它；
+    冪等請求遇到連線錯誤 / 429 / 5xx 時退避重試（POST 一律不重試）"""
+    def send_paced(self, method, url, *args, on_send=None, **kwargs):
+        pacer = pacer_for(url); pacer.acquire()
+        if on_send: on_send()
+        t = time.time(); status = None; retry_after = None
+        try:
+            r = super().request(method, url, *args, **kwargs)
+            status = r.status_code; retry_after = retry_after_of(r)
+            return r
+        finally:
+            pacer.release(status, time.time() - t, retry_after)
+
+    def request(self, method, url, *args, retries=3, **kwargs):
+        retryable = method.upper() in IDEMPOTENT_METHODS; attempt = 0
+        while True:
+            try:
+                r = self.send_paced(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not (retryable and attempt < retries and retry_budget.take()): raise
+                wait = backoff_delay(attempt); reason = type(e).__name__
+            else:
+                if r.status_code not in RETRY_STATUSES: return r
+                if not (retryable and attempt < retries and retry_budget.take()): return r
+                wait = backoff_delay(attempt, retry_after_of(r)); reason = r.status_code
+            print(f"[重試] {method} {url} ({reason}) 第 {attempt + 1} 次，{wait:.1f}s 後重送")
+            time.sleep(wait); attempt += 1
+
+    def get_hedged(self, url, hedge_after=None, **kwargs):
+        """慢速詳情頁：主請求在呼叫端執行緒直接送出，真正送出（通過 pacer）後超過 hedge_after 秒
+        （預設為該 origin 平均延遲 2 倍）仍未回應，才把備援請求丟進 hedge_pool；主請求失敗時改用備援的結果。
+        主請求不進 pool，pool 滿載時排隊的時間不會被算成慢回應而多送一份"""
+        if not HEDGE_ENABLED or hedge_pool is None: return self.get(url, **kwargs)
+        pacer = pacer_for(url)
+        hedge_after = hedge_after or max(2.0, pacer.latency * 2)
+        lock = threading.Lock(); state = {'done': False, 'timer': None, 'hedge': None}
+
+        def fire():
+            with lock:
+                if state['done'] or not retry_budget.take(): return
+                with retry_budget.lock: retry_budget.hedged += 1
+                state['hedge'] = hedge_pool.submit(self.get, url, **kwargs)
+
+        def on_send():  # 主請求重試時會再經過 pacer，計時只從第一次送出開始
+            with lock:
+                if state['timer'] or state['done']: return
+                state['timer'] = threading.Timer(hedge_after, fire); state['timer'].daemon = True
+                state['timer'].start()
+
+        error = None
+        try: r = self.get(url, on_send=on_send, **kwargs)
+        except Exception as e: r = None; error = e
+        with lock:
+            state['done'] = True
+            if state['timer']: state['timer'].cancel()
+        hedge = state['hedge']
+        if hedge and (error or r.status_code in RETRY_STATUSES):
+            try: return hedge.result()
+            except Exception: pass
+        if error: raise error
+        return r
+
+
+session = PacedSession()
 session.headers.update(BROWSER_HEADERS)
+client = PacedSession()  # Shopify / OpenAI / 圖片等不帶瀏覽器標頭的請求
 
 scrape_status = {
     "running": False, "progress": 0, "total": 0, "current_product": "",
@@ -104,35 +284,221 @@ def calculate_selling_price(cost):
     return round(cost + fee)
 
 
-def translate_with_chatgpt(title, description):
-    prompt = f"""你是專業的日本商品翻譯和 SEO 專家。將以下日本商品資訊翻譯成繁體中文並優化 SEO。
+# ========== OpenAI 連線池與 RPM / TPM 預算 ==========
+OPENAI_URL = "https://api.openai.com/v1/chat/completions"
+OPENAI_RPM = int(os.environ.get("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.environ.get("OPENAI_TPM", "200000"))
+OPENAI_RETRIES = int(os.environ.get("OPENAI_RETRIES", "4"))
+TRANSLATE_WORKERS = int(os.environ.get("TRANSLATE_WORKERS", "4"))
+
+
+class OpenAIBudget:
+    """每分鐘請求數 / token 數兩個 token bucket：送出前先扣預估 token（prompt 字數 + max_tokens），
+    回應後依 usage 多退少補；遇到 429 整個預算暫停，所有 worker 一起等"""
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm; self.tpm = tpm
+        self.requests = float(rpm); self.tokens = float(tpm); self.updated = time.time()
+        self.paused_until = 0.0; self.cond = threading.Condition()
+        self.sent = 0; self.throttled = 0; self.waited = 0.0; self.used_tokens = 0
+
+    def _refill(self):
+        now = time.time(); dt = now - self.updated; self.updated = now
+        self.requests = min(self.rpm, self.requests + dt * self.rpm / 60)
+        self.tokens = min(self.tpm, self.tokens + dt * self.tpm / 60)
+
+    def acquire(self, tokens):
+        tokens = min(tokens, self.tpm); t0 = time.time()
+        with self.cond:
+            while True:
+                self._refill(); now = time.time()
+                if now >= self.paused_until and self.requests >= 1 and self.tokens >= tokens:
+                    self.requests -= 1; self.tokens -= tokens; self.sent += 1; self.waited += now - t0
+                    return
+                self.cond.wait(max(0.05, self.paused_until - now, (1 - self.requests) * 60 / self.rpm,
+                                   (tokens - self.tokens) * 60 / self.tpm))
+
+    def settle(self, estimated, actual):
+        with self.cond:
+            self.tokens += estimated - actual; self.used_tokens += actual
+            self.cond.notify_all()
+
+    def pause(self, seconds):
+        with self.cond:
+            self.throttled += 1; self.paused_until = max(self.paused_until, time.time() + seconds)
+
+    def snapshot(self):
+        with self.cond:
+            self._refill()
+            return {'rpm': self.rpm, 'tpm': self.tpm, 'requests_left': int(self.requests), 'tokens_left': int(self.tokens),
+                    'sent': self.sent, 'throttled': self.throttled, 'waited_sec': round(self.waited, 1),
+                    'used_tokens': self.used_tokens, 'paused': max(0, round(self.paused_until - time.time(), 1))}
+
+
+openai_budget = OpenAIBudget(OPENAI_RPM, OPENAI_TPM)
+openai_session = requests.Session()  # 不走 OriginPacer，改由 openai_budget 控速；keep-alive 連線數對齊 worker 數
+openai_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=TRANSLATE_WORKERS + 2))
+
+
+def openai_chat(payload, timeout=60):
+    """送 chat/completions：先向 openai_budget 取得額度再從連線池送出；
+    429 依 Retry-After（沒有就指數退避）暫停整個預算後重送，5xx / 連線錯誤退避重送，回傳最後一個 response"""
+    est = sum(len(m['content']) for m in payload['messages']) + payload.get('max_tokens', 1000)
+    headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
+    for attempt in range(OPENAI_RETRIES + 1):
+        openai_budget.acquire(est)
+        try:
+            r = openai_session.post(OPENAI_URL, headers=headers, json=payload, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            openai_budget.settle(est, 0)
+            if attempt >= OPENAI_RETRIES: raise
+            wait = backoff_delay(attempt, base=1.0, cap=60.0); reason = type(e).__name__
+        else:
+            if r.status_code == 200:
+                try: used = r.json().get('usage', {}).get('total_tokens', est)
+                except ValueError: used = est
+                openai_budget.settle(est, used); return r
+            openai_budget.settle(est, 0)
+            if r.status_code not in RETRY_STATUSES or attempt >= OPENAI_RETRIES: return r
+            wait = backoff_delay(attempt, retry_after_of(r), base=1.0, cap=60.0); reason = r.status_code
+            if r.status_code == 429:
+                openai_budget.pause(wait)
+                print(f"[OpenAI] 429，全部翻譯暫停 {wait:.1f}s（第 {attempt + 1} 次）"); continue
+        print(f"[OpenAI] {reason}，第 {attempt + 1} 次，{wait:.1f}s 後重送")
+        time.sleep(wait)
+
+
+# ========== 翻譯快取（來源內容 hash） ==========
+TRANSLATION_CACHE_FILE = os.environ.get("TRANSLATION_CACHE_FILE", "translation_cache.json")
+TRANSLATION_CACHE_MAX = int(os.environ.get("TRANSLATION_CACHE_MAX", "3000"))
+TRANSLATION_PROMPT_VERSION = os.environ.get("TRANSLATION_PROMPT_VERSION", "1")  # 改這個值可讓舊快取全部失效
+
+
+class TranslationCache:
+    """翻譯結果以 sha256(prompt 指紋 + 標題 + 清理後說明 + 其他參數) 為 key 存成 JSON 檔，重啟後沿用；
+    LRU：超過 max_entries 淘汰最久沒用到的。只存成功且標題已無日文的結果"""
+    def __init__(self, path, max_entries=3000):
+        self.path = path; self.max_entries = max_entries; self.lock = threading.Lock()
+        self.hits = 0; self.misses = 0; self.evicted = 0; self.dirty = 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f: self.entries = OrderedDict(json.load(f))
+        except (OSError, ValueError):
+            self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1; return None
+            self.entries.move_to_end(key); self.hits += 1
+            return dict(self.entries[key])
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value; self.entries.move_to_end(key); self.dirty += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False); self.evicted += 1
+            if self.dirty >= 5: self._save()
+
+    def has(self, key):
+        with self.lock: return key in self.entries
+
+    def save(self):
+        with self.lock:
+            if self.dirty: self._save()
+
+    def _save(self):
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f: json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp, self.path); self.dirty = 0
+        except OSError as e:
+            print(f"[翻譯快取] 儲存失敗: {e}")
 
-商品名稱：{title}
-商品說明：{description[:1500]}
+    def snapshot(self):
+        total = self.hits + self.misses
+        return {'entries': len(self.entries), 'max': self.max_entries, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0, 'evicted': self.evicted}
+
+
+translation_cache = TranslationCache(TRANSLATION_CACHE_FILE, TRANSLATION_CACHE_MAX)
+atexit.register(translation_cache.save)
+
+
+def translation_source(description):
+    """快取 key 用的說明文字：去掉 script / style / 標籤與多餘空白"""
+    text = re.sub(r'<(script|style)[^>]*>.*?</\1>', ' ', description or '', flags=re.S | re.I)
+    return re.sub(r'\s+', ' ', re.sub(r'<[^>]+>', ' ', text)).strip()
+
+
+def cached_translation(fn):
+    """translate_with_chatgpt 的快取層；prompt 指紋取自 TRANSLATION_* 常數與翻譯函式內的字串常數，
+    規則 / 詞彙表一改，舊快取自動失效"""
+    consts = [c for f in (fn, translation_input, translation_result) for c in f.__code__.co_consts if isinstance(c, str)]
+    fingerprint = hashlib.sha256(json.dumps([TRANSLATION_PROMPT_VERSION, TRANSLATION_SYSTEM, TRANSLATION_FORMAT,
+                                             TRANSLATION_RULES, consts], ensure_ascii=False)
+                                 .encode('utf-8')).hexdigest()[:16]
+
+    @wraps(fn)
+    def wrapper(title, description, *args, **kwargs):
+        key = translation_key(title, description, *args, **kwargs)
+        hit = translation_cache.get(key)
+        if hit: return hit
+        result = fn(title, description, *args, **kwargs)
+        if result.get('success') and not is_japanese_text(result.get('title', '')): translation_cache.put(key, result)
+        return result
+    wrapper.fingerprint = fingerprint
+    return wrapper
+
+
+def translation_key(title, description, *args, **kwargs):
+    """快取 key：prompt 指紋 + 標題 + 清理後說明 + 其他參數"""
+    return hashlib.sha256(json.dumps([translate_with_chatgpt.fingerprint, title, translation_source(description), args, kwargs],
+                                     ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
 
-只回傳此 JSON 格式，不加 markdown、不加任何其他文字：
-{"title":"翻譯後的商品名稱","description":"翻譯後的商品說明（HTML格式）","page_title":"SEO標題50字以內","meta_description":"SEO描述100字以內"}
 
-規則：
+# ========== 翻譯 prompt ==========
+TRANSLATION_SYSTEM = "你是專業的日本商品翻譯和 SEO 專家。"
+TRANSLATION_FORMAT = '{"title":"翻譯後的商品名稱","description":"翻譯後的商品說明（HTML格式）","page_title":"SEO標題50字以內","meta_description":"SEO描述100字以內"}'
+TRANSLATION_RULES = """規則：
 1. 品牌背景：日本東京人氣甜點品牌，以砂糖奶油夾心餅乾聞名
 2. 標題開頭必須是「砂糖奶油樹」，後接繁體中文商品名，不得省略
 3. 【強制禁止日文】所有輸出必須是繁體中文或英文，不可出現任何平假名或片假名
 4. 詞彙對照：シュガーバターサンドの木→砂糖奶油夾心餅乾；銀のぶどう→銀葡萄（母品牌名稱保留）；シリアル→穀物；詰合せ→綜合禮盒
 5. SEO 關鍵字必須自然融入，包含：砂糖奶油樹、日本、東京、伴手禮
 6. 只回傳 JSON，不得有任何其他文字"""
+
+
+def translation_input(description):
+    """送進 prompt 的商品說明"""
+    return (description or '')[:1500]
+
+
+def translation_result(t, title, description):
+    """模型回傳的 JSON → 上架用的翻譯結果"""
+    return {'success': True, 'title': t.get('title', title), 'description': t.get('description', description),
+            'page_title': t.get('page_title', ''), 'meta_description': t.get('meta_description', '')}
+
+
+@cached_translation
+def translate_with_chatgpt(title, description):
+    prompt = f"""你是專業的日本商品翻譯和 SEO 專家。將以下日本商品資訊翻譯成繁體中文並優化 SEO。
+
+商品名稱：{title}
+商品說明：{translation_input(description)}
+
+只回傳此 JSON 格式，不加 markdown、不加任何其他文字：
+{TRANSLATION_FORMAT}
+
+{TRANSLATION_RULES}"""
     try:
-        r = requests.post("https://api.openai.com/v1/chat/completions",
-            headers={"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"},
-            json={"model": "gpt-4o-mini", "messages": [
-                {"role": "system", "content": "你是專業的日本商品翻譯和 SEO 專家。"},
+        r = openai_chat({"model": "gpt-4o-mini", "messages": [
+                {"role": "system", "content": TRANSLATION_SYSTEM},
                 {"role": "user", "content": prompt}], "temperature": 0, "max_tokens": 1000}, timeout=60)
         if r.status_code == 200:
             c = r.json()['choices'][0]['message']['content'].strip()
             if c.startswith('```'): c = c.split('\n', 1)[1]
             if c.endswith('```'): c = c.rsplit('```', 1)[0]
             t = json.loads(c.strip())
-            return {'success': True, 'title': t.get('title', title), 'description': t.get('description', description),
-                    'page_title': t.get('page_title', ''), 'meta_description': t.get('meta_description', '')}
+            return translation_result(t, title, description)
         else:
             return {'success': False, 'error': f"HTTP {r.status_code}: {r.text[:200]}",
                     'title': title, 'description': description, 'page_title': '', 'meta_description': ''}
@@ -145,7 +511,7 @@ def get_existing_products_map():
     pm = {}
     url = shopify_api_url("products.json?limit=250")
     while url:
-        r = requests.get(url, headers=get_shopify_headers())
+        r = client.get(url, headers=get_shopify_headers())
         if r.status_code != 200: break
         for p in r.json().get('products', []):
             pid = p.get('id')
@@ -168,7 +534,7 @@ def get_collection_products_map(collection_id):
     if not collection_id: return pm
     url = shopify_api_url(f"collections/{collection_id}/products.json?limit=250")
     while url:
-        r = requests.get(url, headers=get_shopify_headers())
+        r = client.get(url, headers=get_shopify_headers())
         if r.status_code != 200: break
         for p in r.json().get('products', []):
             pid = p.get('id')
@@ -187,88 +553,199 @@ def get_collection_products_map(collection_id):
 
 
 def delete_product(pid):
-    return requests.delete(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers()).status_code == 200
+    return client.delete(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers()).status_code == 200
 
 
 def update_product(pid, data):
-    r = requests.put(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers(),
+    r = client.put(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers(),
         json={"product": {"id": pid, **data}})
     return r.status_code == 200, r
 
 
 def get_or_create_collection(ct="砂糖奶油樹"):
-    r = requests.get(shopify_api_url(f'custom_collections.json?title={ct}'), headers=get_shopify_headers())
+    r = client.get(shopify_api_url(f'custom_collections.json?title={ct}'), headers=get_shopify_headers())
     if r.status_code == 200:
         for c in r.json().get('custom_collections', []):
             if c['title'] == ct: return c['id']
-    r = requests.post(shopify_api_url('custom_collections.json'), headers=get_shopify_headers(),
+    r = client.post(shopify_api_url('custom_collections.json'), headers=get_shopify_headers(),
         json={'custom_collection': {'title': ct, 'published': True}})
     if r.status_code == 201: return r.json()['custom_collection']['id']
     return None
 
 
 def add_product_to_collection(pid, cid):
-    return requests.post(shopify_api_url('collects.json'), headers=get_shopify_headers(),
+    return client.post(shopify_api_url('collects.json'), headers=get_shopify_headers(),
         json={'collect': {'product_id': pid, 'collection_id': cid}}).status_code == 201
 
 
 def publish_to_all_channels(pid):
     gu = f"https://{SHOPIFY_SHOP}.myshopify.com/admin/api/2024-01/graphql.json"
     hd = {'X-Shopify-Access-Token': SHOPIFY_ACCESS_TOKEN, 'Content-Type': 'application/json'}
-    r = requests.post(gu, headers=hd, json={'query': '{ publications(first:20){ edges{ node{ id name }}}}'})
+    r = client.post(gu, headers=hd, json={'query': '{ publications(first:20){ edges{ node{ id name }}}}'})
     if r.status_code != 200: return False
     pubs = r.json().get('data', {}).get('publications', {}).get('edges', [])
     seen = set(); uq = []
     for p in pubs:
         if p['node']['name'] not in seen: seen.add(p['node']['name']); uq.append(p['node'])
     mut = """mutation publishablePublish($id:ID!,$input:[PublicationInput!]!){publishablePublish(id:$id,input:$input){userErrors{field message}}}"""
-    requests.post(gu, headers=hd, json={'query': mut, 'variables': {"id": f"gid://shopify/Product/{pid}", "input": [{"publicationId": p['id']} for p in uq]}})
+    client.post(gu, headers=hd, json={'query': mut, 'variables': {"id": f"gid://shopify/Product/{pid}", "input": [{"publicationId": p['id']} for p in uq]}})
     return True
 
 
+# ========== 尺寸 / 重量抽取引擎 ==========
+SIZE_TRANS = str.maketrans({'×': 'x', '✕': 'x', 'Φ': '', 'φ': '', ',': ''})
+SIZE_NUM = r'(\d+(?:\.\d+)?)'
+SIZE_LABEL = r'(?:[WDHL]|縦|横|高さ|タテ|ヨコ|奥行き?|幅)?'
+
+
+class SizeWeightRule:
+    """尺寸 + 重量單次抽取：NFKC 正規化（全形數字 / ｍｍ / ㎏ 等）後，一條編譯好的 regex
+    finditer 一遍同時收尺寸與重量，單位統一成 cm / kg。
+    dim_unit：尺寸沒寫單位時當作的單位（None = 必須寫單位）；weight_units：接受的重量單位，順序即優先序；
+    weight_end：g 之後不可接的字元；cylinder：允許「直徑 x 高 mm」兩維"""
+    def __init__(self, dim_prefix='', weight_prefix='', dim_unit=None, weight_units=('kg', 'g'),
+                 weight_end=r'(?![a-z0-9])', cylinder=False, dims=True, ndigits=2):
+        dim = (rf'{dim_prefix}{SIZE_LABEL}\s*(?P<a>\d+(?:\.\d+)?)\s*(?P<ua>mm|cm)?\s*x\s*'
+               rf'{SIZE_LABEL}\s*(?P<b>\d+(?:\.\d+)?)\s*(?P<ub>mm|cm)?'
+               rf'(?:\s*x\s*{SIZE_LABEL}\s*(?P<c>\d+(?:\.\d+)?))?(?:\s*\(?\s*(?P<u>mm|cm)(?:\s*\))?)?')
+        wt = rf'{weight_prefix}(?P<w>\d+(?:\.\d+)?)\s*(?P<wu>kg|g{weight_end})'
+        parts = ([f'(?P<dim>{dim})'] if dims else []) + ([f'(?P<wt>{wt})'] if weight_units else [])
+        self.rx = re.compile('|'.join(parts), re.I)
+        self.dim_unit = dim_unit; self.weight_units = weight_units
+        self.cylinder = cylinder; self.dims = dims; self.ndigits = ndigits
+
+    def __call__(self, text):
+        box = cyl = None; weights = {}
+        for m in self.rx.finditer(unicodedata.normalize('NFKC', text or '').translate(SIZE_TRANS)):
+            if m.lastgroup == 'wt':
+                u = m['wu'].lower()
+                if u in self.weight_units and u not in weights:
+                    weights[u] = float(m['w']) / (1000 if u == 'g' else 1)
+            else:
+                units = [m['ua'] or m['u'] or self.dim_unit, m['ub'] or m['u'] or self.dim_unit, m['u'] or self.dim_unit]
+                nums = [n for n in (m['a'], m['b'], m['c']) if n is not None]
+                if not all(units[:len(nums)]): continue
+                vals = [float(n) / (10 if un.lower() == 'mm' else 1) for n, un in zip(nums, units)]
+                if len(vals) == 3 and box is None: box = vals
+                elif len(vals) == 2 and self.cylinder and cyl is None and (m['u'] or m['ub']): cyl = vals
+            if (box or not self.dims) and len(weights) == len(self.weight_units): break
+        weight = next((weights[u] for u in self.weight_units if u in weights), None)
+        dimension = None
+        if box:
+            l, w, h = box
+            dimension = {'l': l, 'w': w, 'h': h, 'volume_weight': round(l * w * h / 6000, self.ndigits)}
+        elif cyl:
+            d, h = cyl
+            dimension = {'diameter': d, 'height': h, 'volume_weight': round(math.pi * (d / 2) ** 2 * h / 6000, self.ndigits)}
+        vw = dimension['volume_weight'] if dimension else 0
+        return {'dimension': dimension, 'actual_weight': round(weight, 3) if weight else None,
+                'volume_weight': vw, 'final_weight': round(max(vw, weight or 0), self.ndigits)}
+
+
+SIZE_RULE = SizeWeightRule()
+SIZE_FIXTURES = [  # (文字, actual_weight, final_weight)：改 SIZE_RULE 後打 /api/test-size 對一遍
+    ('200×150×60mm 450g', 0.45, 0.45),
+    ('200×150×60mm\u3000450g', 0.45, 0.45),
+    ('200×150×60mm\n450g', 0.45, 0.45),
+    ('120mm×80mm×40mm 250g', 0.25, 0.25),
+    ('20×15×6cm 450g※', 0.45, 0.45),
+]
+
+
 def parse_dimension_weight(text):
-    dimension = None; weight = None
-    dm = re.search(r'(\d+(?:\.\d+)?)[×xX](\d+(?:\.\d+)?)[×xX](\d+(?:\.\d+)?)\s*cm', text)
-    if dm:
-        w, d, h = float(dm.group(1)), float(dm.group(2)), float(dm.group(3))
-        dimension = {"w": w, "d": d, "h": h, "volume_weight": round((w*d*h)/6000, 2)}
-    wm = re.search(r'(\d+(?:\.\d+)?)\s*g(?:※|$|\s)', text)
-    if wm: weight = float(wm.group(1))/1000
-    final = 0
-    if dimension and weight: final = max(dimension['volume_weight'], weight)
-    elif dimension: final = dimension['volume_weight']
-    elif weight: final = weight
-    return {"dimension": dimension, "actual_weight": weight, "final_weight": round(final, 2)}
+    return SIZE_RULE(text)
+
+
+# ========== 分頁列表引擎 ==========
+
+LISTING_WINDOW = 4
+
+
+def stream_listing(load_page, seen=None, max_pages=20, window=LISTING_WINDOW):
+    """一次平行預抓 window 頁、依頁序輸出；load_page(n) 回傳 (records, has_more)。
+    None / 空頁 / 整頁都是已見過的 SKU（被導回第一頁）/ has_more=False 皆視為到底。
+    seen 可跨分類共用，逐筆 yield 讓呼叫端邊列表邊抓詳情。"""
+    seen = set() if seen is None else seen
+    page = 1
+    with ThreadPoolExecutor(max_workers=window) as pool:
+        while page <= max_pages:
+            batch = range(page, min(page + window, max_pages + 1))
+            futures = [pool.submit(load_page, n) for n in batch]
+            for n, fu in zip(batch, futures):
+                try: res = fu.result()
+                except Exception as e:
+                    print(f"[列表] 第 {n} 頁失敗: {e}"); return
+                if not res or not res[0]: return
+                records, has_more = res; new_count = 0
+                for rec in records:
+                    if rec['sku'] in seen: continue
+                    seen.add(rec['sku']); new_count += 1
+                    yield rec
+                if new_count == 0 or not has_more: return
+            page += window
+
+
+def fetch_list_page(category_url, page):
+    url = category_url if page == 1 else f"{category_url.rstrip('/')}_p{page}/"
+    r = session.get(url, timeout=30)
+    if r.status_code != 200: return None
+    if page > 1 and '_p' not in r.url: return None
+    soup = BeautifulSoup(r.text, 'html.parser'); records = []
+    for link in soup.find_all('a', href=re.compile(r'/shop/g/g\d+/')):
+        sm = re.search(r'/g/g(\d+)/', link.get('href',''))
+        if sm: records.append({'url': urljoin(BASE_URL, link.get('href','')), 'sku': sm.group(1)})
+    return records, True
+
+
+def stream_product_list(category_url):
+    session.get(BASE_URL, timeout=30)
+    yield from stream_listing(partial(fetch_list_page, category_url), max_pages=20)
 
 
 def scrape_product_list(category_url):
-    products = []; page = 1
-    session.get(BASE_URL, timeout=30); time.sleep(0.5)
-    while page <= 20:
-        url = category_url if page == 1 else f"{category_url.rstrip('/')}_p{page}/"
-        try:
-            r = session.get(url, timeout=30)
-            if r.status_code != 200: break
-            if page > 1 and '_p' not in r.url: break
-            soup = BeautifulSoup(r.text, 'html.parser')
-            seen = set(); new_count = 0
-            for link in soup.find_all('a', href=re.compile(r'/shop/g/g\d+/')):
-                sm = re.search(r'/g/g(\d+)/', link.get('href',''))
-                if sm:
-                    sku = sm.group(1)
-                    if sku in seen: continue
-                    seen.add(sku)
-                    if sku not in [p['sku'] for p in products]:
-                        products.append({'url': urljoin(BASE_URL, link.get('href','')), 'sku': sku}); new_count += 1
-            if new_count == 0: break
-            page += 1; time.sleep(0.5)
-        except: break
-    return products
+    return list(stream_product_list(category_url))
+
+
+# ========== 庫存判定（商品區塊內單次多關鍵字掃描） ==========
+class StockDetector:
+    """缺貨關鍵字編成一條 alternation regex，只在商品 / 購物車區塊內掃一次，
+    頁尾、推薦商品裡的「品切れ」不會誤判。region 依序嘗試，第一個命中的 selector 為準，
+    全部沒命中時退回整頁文字（舊行為）。
+    判定順序沿用小倉：缺貨字 → 在庫 ○△× → 購物車（正向訊號，看整頁）→ 缺貨 class"""
+    def __init__(self, sold_out, region=(), marker=r'在庫[：:]\s*([○△×])',
+                 cart=None, cart_text=None, sold_out_css=None):
+        self.sold_out = re.compile('|'.join(map(re.escape, sold_out)))
+        self.region = region; self.marker = re.compile(marker) if marker else None
+        self.cart = cart; self.cart_text = cart_text; self.sold_out_css = sold_out_css
+
+    def scope(self, soup):
+        for sel in self.region:
+            nodes = soup.select(sel)
+            if nodes: return nodes
+        return None
+
+    def __call__(self, soup, page_text=None):
+        nodes = self.scope(soup)
+        if page_text is None and (not nodes or self.cart_text): page_text = soup.get_text()
+        text = '\n'.join(n.get_text() for n in nodes) if nodes else page_text
+        if self.sold_out.search(text): return False
+        if self.marker:
+            m = self.marker.search(text)
+            if m: return m.group(1) != '×'
+        if (self.cart or self.cart_text) and not (
+                (self.cart and soup.select_one(self.cart)) or (self.cart_text and self.cart_text in page_text)):
+            return False
+        if self.sold_out_css and any(n.select_one(self.sold_out_css) for n in (nodes or [soup])): return False
+        return True
+
+
+ECBEING_REGION = ('.pane-goods-right-side', '.block-goods-detail')  # ecbeing 商品頁右欄（名稱 / 價格 / 在庫 / 購物車）
+STOCK_RULE = StockDetector(['在庫がありません','在庫切れ','入荷日未定','完売','品切れ','売り切れ','SOLD OUT','販売終了'], ECBEING_REGION)
 
 
 def scrape_product_detail(url):
     try:
-        r = session.get(url, timeout=30)
+        r = session.get_hedged(url, timeout=30)
         if r.status_code != 200: return None
         soup = BeautifulSoup(r.text, 'html.parser'); pt = soup.get_text()
         sku = ""; sm = re.search(r'/g/g(\d+)/', url)
@@ -295,14 +772,11 @@ def scrape_product_detail(url):
             if pm: price = int(pm.group(1).replace(',',''))
 
         # === v2.2: 缺貨偵測（擴充關鍵字）===
-        in_stock = not any(k in pt for k in ['在庫がありません','在庫切れ','入荷日未定','完売','品切れ','売り切れ','SOLD OUT','販売終了'])
+        in_stock = STOCK_RULE(soup, pt)
 
         wi = {'dimension': None, 'actual_weight': None, 'final_weight': 0}
-        szm = re.search(r'箱サイズ・重さ[^\d]*(\d+(?:\.\d+)?)[×xX](\d+(?:\.\d+)?)[×xX](\d+(?:\.\d+)?)\s*cm\s*(\d+(?:\.\d+)?)\s*g', pt)
-        if szm:
-            w,d,h = float(szm.group(1)),float(szm.group(2)),float(szm.group(3))
-            wg = float(szm.group(4))/1000; vw = (w*d*h)/6000
-            wi = {'dimension': {'w':w,'d':d,'h':h,'volume_weight':round(vw,2)}, 'actual_weight':round(wg,3), 'final_weight':round(max(vw,wg),2)}
+        si = pt.find('箱サイズ・重さ')
+        if si >= 0: wi = parse_dimension_weight(pt[si:si + 80])  # 只看標籤後的一小段
         images = []; seen = set()
         for img in soup.select('img[src*="/img/goods/"]'):
             src = img.get('src','')
@@ -315,6 +789,91 @@ def scrape_product_detail(url):
     except Exception as e:
         print(f"[錯誤] {url}: {e}"); return None
 
+# ========== sitemap lastmod 增量模式 ==========
+SITEMAP_URL = f"{BASE_URL}/sitemap.xml"
+SITEMAP_INCREMENTAL = os.environ.get("SITEMAP_INCREMENTAL", "false").lower() == "true"
+SITEMAP_SKU = re.compile(r'/shop/g/g(\d+)/')
+
+
+def fetch_sitemap_lastmods(url=SITEMAP_URL, depth=0):
+    """讀 sitemap（sitemapindex 會往下展開）→ {SKU: lastmod}；讀不到回傳 None"""
+    try:
+        r = session.get(url, timeout=30)
+        if r.status_code != 200: return None
+        root = ET.fromstring(r.content)
+    except Exception as e:
+        print(f"[sitemap] {url}: {e}"); return None
+    out = {}; is_index = root.tag.endswith('sitemapindex')
+    for node in root:
+        fields = {c.tag.rsplit('}', 1)[-1]: (c.text or '').strip() for c in node}
+        loc = fields.get('loc')
+        if not loc: continue
+        if is_index:
+            if depth < 2: out.update(fetch_sitemap_lastmods(loc, depth + 1) or {})
+            continue
+        sm = SITEMAP_SKU.search(loc)
+        if sm and fields.get('lastmod'): out[sm.group(1)] = fields['lastmod']
+    return out
+
+
+class SitemapDelta:
+    """商品集合仍以分類列表為準（刪除比對不變），sitemap 只提供「有沒有變動」：
+    lastmod 與上次相同、且結果已足以判斷（已上架 / 缺貨 / 低價）的商品沿用上次價格，不解析詳情頁。
+    官網改庫存常常不會更新 lastmod，所以庫存每輪都用 in_stock(item) 重新確認"""
+    def __init__(self, path, min_price):
+        self.path = path; self.min_price = min_price; self.lastmods = {}
+        try:
+            with open(path, 'r') as f: self.state = json.load(f)
+        except (OSError, ValueError): self.state = {}
+
+    def refresh(self):
+        self.lastmods = (fetch_sitemap_lastmods() or {}) if SITEMAP_INCREMENTAL else {}
+        return len(self.lastmods)
+
+    def cached(self, item, existing, in_stock):
+        memo = self.state.get(item['sku']); lm = self.lastmods.get(item['sku'])
+        if not (lm and memo and memo['lastmod'] == lm): return None
+        if not (existing or not memo['in_stock'] or memo['price'] < self.min_price): return None
+        stock = in_stock(item)
+        if stock is None: return None  # 確認不了 → 照常抓詳情
+        if not (existing or not stock or memo['price'] < self.min_price): return None  # 補貨的新商品要完整詳情才能上架
+        memo['in_stock'] = stock
+        return {'url': item['url'], 'sku': item['sku'], 'price': memo['price'], 'in_stock': stock, 'cached': True}
+
+    def record(self, sku, product):
+        lm = self.lastmods.get(sku)
+        if lm: self.state[sku] = {'lastmod': lm, 'price': product['price'], 'in_stock': product['in_stock']}
+
+    def save(self):
+        if not self.lastmods: return
+        try:
+            with open(self.path, 'w') as f: json.dump(self.state, f)
+        except OSError as e: print(f"[sitemap] 狀態寫入失敗: {e}")
+
+
+sitemap_delta = SitemapDelta("sitemap_state.json", MIN_PRICE)
+
+
+def recheck_stock(item):
+    """lastmod 沒變的商品只重新確認庫存：抓詳情頁只跑庫存判定；確認不了回傳 None"""
+    try:
+        r = session.get_hedged(item['url'], timeout=30)
+        if r.status_code != 200: return None
+    except Exception as e:
+        print(f"[錯誤] {item['url']}: {e}"); return None
+    soup = BeautifulSoup(r.text, 'html.parser'); return STOCK_RULE(soup, soup.get_text())
+
+
+def delta_detail(item, existing_skus):
+    """lastmod 沒變就沿用上次價格、只重新確認庫存，否則抓詳情頁並記下這次的價格 / 庫存"""
+    product = sitemap_delta.cached(item, item['sku'] in existing_skus, recheck_stock)
+    if product:
+        scrape_status['unchanged'] = scrape_status.get('unchanged', 0) + 1; return product
+    product = scrape_product_detail(item['url'])
+    if product: sitemap_delta.record(item['sku'], product)
+    return product
+
+
 
 def upload_to_shopify(product, collection_id=None):
     translated = translate_with_chatgpt(product['title'], product.get('description', ''))
@@ -335,10 +894,10 @@ def upload_to_shopify(product, collection_id=None):
         'metafields_global_description_tag': translated['meta_description'],
         'metafields': [{'namespace': 'custom', 'key': 'link', 'value': product['url'], 'type': 'url'}]
     }}
-    r = requests.post(shopify_api_url('products.json'), headers=get_shopify_headers(), json=sp)
+    r = client.post(shopify_api_url('products.json'), headers=get_shopify_headers(), json=sp)
     if r.status_code == 201:
         cp = r.json()['product']; pid = cp['id']; vid = cp['variants'][0]['id']
-        requests.put(shopify_api_url(f'variants/{vid}.json'), headers=get_shopify_headers(),
+        client.put(shopify_api_url(f'variants/{vid}.json'), headers=get_shopify_headers(),
             json={'variant': {'id': vid, 'cost': f"{cost:.2f}"}})
         if collection_id: add_product_to_collection(pid, collection_id)
         publish_to_all_channels(pid)
@@ -348,11 +907,16 @@ def upload_to_shopify(product, collection_id=None):
 
 def run_scrape():
     global scrape_status
+    retry_budget.reset()
     try:
         scrape_status.update({"running": True, "progress": 0, "total": 0, "current_product": "",
             "products": [], "errors": [], "uploaded": 0, "skipped": 0,
             "filtered_by_price": 0, "out_of_stock": 0, "deleted": 0,
             "translation_failed": 0, "translation_stopped": False})
+        scrape_status['unchanged'] = 0
+        if SITEMAP_INCREMENTAL:
+            scrape_status['current_product'] = "讀取 sitemap lastmod..."
+            print(f"[sitemap] {sitemap_delta.refresh()} 個商品有 lastmod")
 
         scrape_status['current_product'] = "檢查 Shopify 商品..."
         epm = get_existing_products_map(); existing_skus = set(epm.keys())
@@ -364,29 +928,26 @@ def run_scrape():
         cpm = get_collection_products_map(collection_id); collection_skus = set(cpm.keys())
 
         scrape_status['current_product'] = "爬取商品列表..."
-        product_list = scrape_product_list(CATEGORY_URL)
-        scrape_status['total'] = len(product_list)
-
-        website_skus = set(item['sku'] for item in product_list)
+        website_skus = set()
         # === v2.2: 記錄缺貨的 SKU ===
         out_of_stock_skus = set()
         ctf = 0
 
-        for idx, item in enumerate(product_list):
+        for idx, item in enumerate(stream_product_list(CATEGORY_URL)):
+            website_skus.add(item['sku']); scrape_status['total'] = len(website_skus)
             scrape_status['progress'] = idx + 1
             scrape_status['current_product'] = f"處理: {item['sku']}"
 
             # === v2.2: 已存在商品也爬詳情頁檢查庫存 ===
             if item['sku'] in existing_skus:
                 if item['sku'] in collection_skus:
-                    product = scrape_product_detail(item['url'])
+                    product = delta_detail(item, existing_skus)
                     if product and not product.get('in_stock', True):
                         out_of_stock_skus.add(item['sku'])
                         scrape_status['out_of_stock'] += 1
-                    time.sleep(0.5)
                 scrape_status['skipped'] += 1; continue
 
-            product = scrape_product_detail(item['url'])
+            product = delta_detail(item, existing_skus)
             if not product:
                 scrape_status['skipped'] += 1; continue
 
@@ -409,10 +970,10 @@ def run_scrape():
                     scrape_status['errors'].append(f'翻譯連續失敗 {ctf} 次，自動停止'); break
             else:
                 scrape_status['errors'].append(f"上傳失敗 {product['sku']}"); ctf = 0
-            time.sleep(1)
 
         # === v2.2: 合併需要刪除的 SKU ===
         if not scrape_status['translation_stopped']:
+            sitemap_delta.save()
             scrape_status['current_product'] = "清理缺貨/下架商品..."
 
             skus_to_delete = (collection_skus - website_skus) | (collection_skus & out_of_stock_skus)
@@ -428,7 +989,6 @@ def run_scrape():
                             print(f"[已刪除] SKU: {sku}, Product ID: {pid}")
                         else:
                             scrape_status['errors'].append(f"刪除失敗: {sku}")
-                    time.sleep(0.3)
 
         scrape_status['current_product'] = "完成" if not scrape_status['translation_stopped'] else "翻譯異常停止"
     except Exception as e:
@@ -453,7 +1013,7 @@ def run_update_shipping():
         pids = []
         url = shopify_api_url("products.json?limit=250&vendor=砂糖奶油樹&fields=id,body_html")
         while url:
-            r = requests.get(url, headers=get_shopify_headers())
+            r = client.get(url, headers=get_shopify_headers())
             if r.status_code != 200:
                 update_shipping_status["errors"].append(f"取得商品列表失敗: {r.status_code}")
                 break
@@ -469,7 +1029,7 @@ def run_update_shipping():
                 if "國際運費" in body:
                     update_shipping_status["skipped"] += 1
                     continue
-                ru = requests.put(
+                ru = client.put(
                     shopify_api_url(f"products/{pid}.json"),
                     headers=get_shopify_headers(),
                     json={"product": {"id": pid, "body_html": body + SHIPPING_HTML}}
@@ -580,7 +1140,7 @@ def api_scan_japanese():
     products = []
     url = shopify_api_url("products.json?limit=250&vendor=砂糖奶油樹")
     while url:
-        r = requests.get(url, headers=get_shopify_headers())
+        r = client.get(url, headers=get_shopify_headers())
         if r.status_code != 200: break
         for p in r.json().get('products', []):
             sku = ''; price = ''
@@ -600,7 +1160,7 @@ def api_retranslate_product():
     if not load_shopify_token(): return jsonify({'error': '未設定 Token'}), 400
     data = request.get_json(); pid = data.get('product_id')
     if not pid: return jsonify({'error': '缺少 product_id'}), 400
-    resp = requests.get(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers())
+    resp = client.get(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers())
     if resp.status_code != 200: return jsonify({'error': f'無法取得: {resp.status_code}'}), 400
     product = resp.json().get('product', {})
     translated = translate_with_chatgpt(product.get('title', ''), product.get('body_html', ''))
@@ -632,7 +1192,9 @@ def api_test_translate():
 
 @app.route('/api/status')
 def get_status():
-    return jsonify(scrape_status)
+    return jsonify({**scrape_status, 'pacing': pacer_snapshot(), 'retries': retry_budget.snapshot(),
+                    'translation_cache': translation_cache.snapshot(),
+                    'openai': openai_budget.snapshot()})
 
 
 @app.route('/api/start', methods=['POST'])
@@ -650,15 +1212,23 @@ def start_scrape():
 @app.route('/api/test-shopify')
 def test_shopify():
     if not load_shopify_token(): return jsonify({'error': '未設定 Token'}), 400
-    r = requests.get(shopify_api_url('shop.json'), headers=get_shopify_headers())
+    r = client.get(shopify_api_url('shop.json'), headers=get_shopify_headers())
     if r.status_code == 200: return jsonify({'success': True, 'shop': r.json()['shop']})
     return jsonify({'success': False, 'error': r.text}), 400
 
 
+@app.route('/api/test-size')
+def test_size():
+    rows = [{'text': t, 'expected': [aw, fw], 'got': [r['actual_weight'], r['final_weight']]}
+            for t, aw, fw in SIZE_FIXTURES for r in [SIZE_RULE(t)]]
+    failed = [r for r in rows if r['expected'] != r['got']]
+    return jsonify({'success': not failed, 'total': len(rows), 'failed': failed})
+
+
 @app.route('/api/test-scrape')
 def test_scrape():
     if not load_shopify_token(): return jsonify({'error': '未設定 Token'}), 400
-    session.get(BASE_URL, timeout=30); time.sleep(0.5)
+    session.get(BASE_URL, timeout=30)
     product = scrape_product_detail("https://www.paqtomog.com/shop/g/g2131/")
     if not product: return jsonify({'error': '爬取失敗'}), 400
     return jsonify({'success': True, 'product': product})
@@ -666,7 +1236,7 @@ def test_scrape():
 
 if __name__ == '__main__':
     print("=" * 50)
-    print("砂糖奶油樹 爬蟲工具 v2.2")
+    print(f"砂糖奶油樹 爬蟲工具 v2.7（sitemap 增量: {SITEMAP_INCREMENTAL}）")
     print("新增: 缺貨商品自動刪除")
     print("=" * 50)
     port = int(os.environ.get('PORT', 8080))
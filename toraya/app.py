@@ -1,5 +1,5 @@
 """
-虎屋羊羹商品爬蟲 + Shopify 上架工具 v2.3
+虎屋羊羹商品爬蟲 + Shopify 上架工具 v2.8
 v2.1: 翻譯保護機制、日文商品掃描、測試翻譯
 v2.2: 缺貨商品自動刪除 - 官網消失或缺貨皆直接刪除
 v2.3: 修復同步刪除 Bug
@@ -10,18 +10,33 @@ v2.3: 修復同步刪除 Bug
   - 新增: 每日自動同步排程（預設 JST 10:00）
   - 新增: /api/sync-delete 手動觸發僅刪除（不上架新品）
   - 移除: 無效的 HTML fallback 爬蟲（JS 渲染頁面 BeautifulSoup 無法解析）
+v2.4: 詳情改走 storefront JSON（/products/{handle}.js → .json），HTML 只解析詰め合わせ與尺寸區塊；
+  已上架商品庫存直接用 products.json 的 available
+v2.5: feed 增量模式（FEED_INCREMENTAL）— 記下每個 handle 的 updated_at / available，沒變的缺貨 / 低價新品不再抓詳情；
+  每日同步刪除沿用 FEED_SNAPSHOT_TTL 內的 feed 快照
+v2.6: 翻譯快取 - 依 prompt 指紋 + 標題 + 清理後說明的 hash 存檔（translation_cache.json），LRU 上限，/api/status 回報命中率
+v2.7: 批次翻譯：預抓到的新商品每 TRANSLATE_BATCH_SIZE 個打包成一次 gpt-4o-mini 請求（JSON 以 SKU 為 key），逐筆驗證、沒過的退回單筆；修正 prompt JSON 範例大括號造成的 f-string 錯誤
+v2.8: 翻譯 worker pool：TRANSLATE_WORKERS 條執行緒並行翻譯，OpenAI 請求改走獨立 keep-alive 連線池，受 OPENAI_RPM / OPENAI_TPM 預算控管，429 依 Retry-After 全部暫停後重送
 """
 
 from flask import Flask, jsonify, request
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import re
+import unicodedata
 import json
 import os
 import time
-from urllib.parse import urljoin
+import random
+from urllib.parse import urljoin, urlparse
 import math
 import threading
+import hashlib
+import atexit
+from collections import OrderedDict
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor, Future
 
 app = Flask(__name__)
 
@@ -51,8 +66,174 @@ BROWSER_HEADERS = {
     'Accept-Language': 'ja,en-US;q=0.9,en;q=0.8,zh-TW;q=0.7',
     'Referer': 'https://www.toraya-group.co.jp/',
 }
-session = requests.Session()
+# ========== 每個 origin 的自適應節流（AIMD） ==========
+
+class OriginPacer:
+    """依回應延遲、429/503 與錯誤率調整請求間隔與併發：
+    順利時間隔線性遞減、併發逐步 +1；被限流 / 出錯時間隔加倍、併發減半"""
+    MIN_DELAY, MAX_DELAY, MAX_LIMIT = 0.05, 30.0, 8
+
+    def __init__(self, host, delay=0.5, limit=2):
+        self.host = host; self.delay = delay; self.limit = limit
+        self.active = 0; self.next_at = 0.0; self.streak = 0
+        self.latency = 0.0; self.ok = 0; self.throttled = 0; self.errors = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.active >= self.limit: self.cond.wait()
+            self.active += 1
+            now = time.time(); start = max(now, self.next_at)
+            self.next_at = start + self.delay
+        if start > now: time.sleep(start - now)
+
+    def release(self, status, elapsed, retry_after=None):
+        with self.cond:
+            self.active -= 1
+            slow = self.latency > 0 and elapsed > self.latency * 3
+            self.latency = elapsed if not self.latency else self.latency * 0.8 + elapsed * 0.2
+            if status is None or status in (429, 503) or status >= 500:
+                if status in (429, 503): self.throttled += 1
+                else: self.errors += 1
+                self.delay = min(self.MAX_DELAY, max(self.delay * 2, retry_after or 0, 0.5))
+                self.limit = max(1, self.limit // 2); self.streak = 0
+                self.next_at = max(self.next_at, time.time() + self.delay)
+            elif slow:
+                self.ok += 1; self.streak = 0
+                self.delay = min(self.MAX_DELAY, self.delay * 1.5)
+            else:
+                self.ok += 1; self.streak += 1
+                self.delay = max(self.MIN_DELAY, self.delay - 0.05)
+                if self.streak >= self.limit * 4 and self.limit < self.MAX_LIMIT:
+                    self.limit += 1; self.streak = 0
+            self.cond.notify_all()
+
+    def snapshot(self):
+        return {'delay': round(self.delay, 2), 'rate_per_sec': round(1 / self.delay, 2),
+                'concurrency': self.limit, 'active': self.active, 'latency': round(self.latency, 2),
+                'ok': self.ok, 'throttled': self.throttled, 'errors': self.errors}
+
+
+origin_pacers = {}
+origin_pacers_lock = threading.Lock()
+
+
+def pacer_for(url):
+    host = urlparse(url).netloc
+    with origin_pacers_lock:
+        if host not in origin_pacers: origin_pacers[host] = OriginPacer(host)
+        return origin_pacers[host]
+
+
+def pacer_snapshot():
+    return {h: p.snapshot() for h, p in list(origin_pacers.items())}
+
+
+# ========== 重試（指數退避 + jitter、每輪預算）與 hedged request ==========
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'}
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "true").lower() == "true"
+
+
+class RetryBudget:
+    """每輪爬取可用的重試 / hedge 次數上限，避免官網故障時重試把流量放大"""
+    def __init__(self, limit=200):
+        self.limit = limit; self.used = 0; self.hedged = 0; self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock: self.used = 0; self.hedged = 0
+
+    def take(self):
+        with self.lock:
+            if self.used >= self.limit: return False
+            self.used += 1; return True
+
+    def snapshot(self):
+        return {'used': self.used, 'limit': self.limit, 'hedged': self.hedged}
+
+
+retry_budget = RetryBudget()
+hedge_pool = ThreadPoolExecutor(max_workers=4)
+
+
+def retry_after_of(r):
+    ra = r.headers.get('Retry-After', '')
+    return float(ra) if ra.isdigit() else None
+
+
+def backoff_delay(attempt, retry_after=None, base=0.5, cap=20.0):
+    """指數退避 + full jitter；有 Retry-After 時不低於它"""
+    return max(random.uniform(0, min(cap, base * (2 ** attempt))), retry_after or 0)
+
+
+class PacedSession(requests.Session):
+    """所有請求先經過該 origin 的 OriginPacer，回應再回饋給它；
+    冪等請求遇到連線錯誤 / 429 / 5xx 時退避重試（POST 一律不重試）"""
+    def send_paced(self, method, url, *args, on_send=None, **kwargs):
+        pacer = pacer_for(url); pacer.acquire()
+        if on_send: on_send()
+        t = time.time(); status = None; retry_after = None
+        try:
+            r = super().request(method, url, *args, **kwargs)
+            status = r.status_code; retry_after = retry_after_of(r)
+            return r
+        finally:
+            pacer.release(status, time.time() - t, retry_after)
+
+    def request(self, method, url, *args, retries=3, **kwargs):
+        retryable = method.upper() in IDEMPOTENT_METHODS; attempt = 0
+        while True:
+            try:
+                r = self.send_paced(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not (retryable and attempt < retries and retry_budget.take()): raise
+                wait = backoff_delay(attempt); reason = type(e).__name__
+            else:
+                if r.status_code not in RETRY_STATUSES: return r
+                if not (retryable and attempt < retries and retry_budget.take()): return r
+                wait = backoff_delay(attempt, retry_after_of(r)); reason = r.status_code
+            print(f"[重試] {method} {url} ({reason}) 第 {attempt + 1} 次，{wait:.1f}s 後重送")
+            time.sleep(wait); attempt += 1
+
+    def get_hedged(self, url, hedge_after=None, **kwargs):
+        """慢速詳情頁：主請求在呼叫端執行緒直接送出，真正送出（通過 pacer）後超過 hedge_after 秒
+        （預設為該 origin 平均延遲 2 倍）仍未回應，才把備援請求丟進 hedge_pool；主請求失敗時改用備援的結果。
+        主請求不進 pool，pool 滿載時排隊的時間不會被算成慢回應而多送一份"""
+        if not HEDGE_ENABLED or hedge_pool is None: return self.get(url, **kwargs)
+        pacer = pacer_for(url)
+        hedge_after = hedge_after or max(2.0, pacer.latency * 2)
+        lock = threading.Lock(); state = {'done': False, 'timer': None, 'hedge': None}
+
+        def fire():
+            with lock:
+                if state['done'] or not retry_budget.take(): return
+                with retry_budget.lock: retry_budget.hedged += 1
+                state['hedge'] = hedge_pool.submit(self.get, url, **kwargs)
+
+        def on_send():  # 主請求重試時會再經過 pacer，計時只從第一次送出開始
+            with lock:
+                if state['timer'] or state['done']: return
+                state['timer'] = threading.Timer(hedge_after, fire); state['timer'].daemon = True
+                state['timer'].start()
+
+        error = None
+        try: r = self.get(url, on_send=on_send, **kwargs)
+        except Exception as e: r = None; error = e
+        with lock:
+            state['done'] = True
+            if state['timer']: state['timer'].cancel()
+        hedge = state['hedge']
+        if hedge and (error or r.status_code in RETRY_STATUSES):
+            try: return hedge.result()
+            except Exception: pass
+        if error: raise error
+        return r
+
+
+session = PacedSession()
 session.headers.update(BROWSER_HEADERS)
+client = PacedSession()  # Shopify / OpenAI / 圖片等不帶瀏覽器標頭的請求
 
 scrape_status = {
     "running": False, "progress": 0, "total": 0, "current_product": "",
@@ -133,39 +314,224 @@ def calculate_selling_price(cost):
     return round(cost + fee)
 
 
+# ========== OpenAI 連線池與 RPM / TPM 預算 ==========
+OPENAI_URL = "https://api.openai.com/v1/chat/completions"
+OPENAI_RPM = int(os.environ.get("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.environ.get("OPENAI_TPM", "200000"))
+OPENAI_RETRIES = int(os.environ.get("OPENAI_RETRIES", "4"))
+TRANSLATE_WORKERS = int(os.environ.get("TRANSLATE_WORKERS", "4"))
+
+
+class OpenAIBudget:
+    """每分鐘請求數 / token 數兩個 token bucket：送出前先扣預估 token（prompt 字數 + max_tokens），
+    回應後依 usage 多退少補；遇到 429 整個預算暫停，所有 worker 一起等"""
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm; self.tpm = tpm
+        self.requests = float(rpm); self.tokens = float(tpm); self.updated = time.time()
+        self.paused_until = 0.0; self.cond = threading.Condition()
+        self.sent = 0; self.throttled = 0; self.waited = 0.0; self.used_tokens = 0
+
+    def _refill(self):
+        now = time.time(); dt = now - self.updated; self.updated = now
+        self.requests = min(self.rpm, self.requests + dt * self.rpm / 60)
+        self.tokens = min(self.tpm, self.tokens + dt * self.tpm / 60)
+
+    def acquire(self, tokens):
+        tokens = min(tokens, self.tpm); t0 = time.time()
+        with self.cond:
+            while True:
+                self._refill(); now = time.time()
+                if now >= self.paused_until and self.requests >= 1 and self.tokens >= tokens:
+                    self.requests -= 1; self.tokens -= tokens; self.sent += 1; self.waited += now - t0
+                    return
+                self.cond.wait(max(0.05, self.paused_until - now, (1 - self.requests) * 60 / self.rpm,
+                                   (tokens - self.tokens) * 60 / self.tpm))
+
+    def settle(self, estimated, actual):
+        with self.cond:
+            self.tokens += estimated - actual; self.used_tokens += actual
+            self.cond.notify_all()
+
+    def pause(self, seconds):
+        with self.cond:
+            self.throttled += 1; self.paused_until = max(self.paused_until, time.time() + seconds)
+
+    def snapshot(self):
+        with self.cond:
+            self._refill()
+            return {'rpm': self.rpm, 'tpm': self.tpm, 'requests_left': int(self.requests), 'tokens_left': int(self.tokens),
+                    'sent': self.sent, 'throttled': self.throttled, 'waited_sec': round(self.waited, 1),
+                    'used_tokens': self.used_tokens, 'paused': max(0, round(self.paused_until - time.time(), 1))}
+
+
+openai_budget = OpenAIBudget(OPENAI_RPM, OPENAI_TPM)
+openai_session = requests.Session()  # 不走 OriginPacer，改由 openai_budget 控速；keep-alive 連線數對齊 worker 數
+openai_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=TRANSLATE_WORKERS + 2))
+
+
+def openai_chat(payload, timeout=60):
+    """送 chat/completions：先向 openai_budget 取得額度再從連線池送出；
+    429 依 Retry-After（沒有就指數退避）暫停整個預算後重送，5xx / 連線錯誤退避重送，回傳最後一個 response"""
+    est = sum(len(m['content']) for m in payload['messages']) + payload.get('max_tokens', 1000)
+    headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
+    for attempt in range(OPENAI_RETRIES + 1):
+        openai_budget.acquire(est)
+        try:
+            r = openai_session.post(OPENAI_URL, headers=headers, json=payload, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            openai_budget.settle(est, 0)
+            if attempt >= OPENAI_RETRIES: raise
+            wait = backoff_delay(attempt, base=1.0, cap=60.0); reason = type(e).__name__
+        else:
+            if r.status_code == 200:
+                try: used = r.json().get('usage', {}).get('total_tokens', est)
+                except ValueError: used = est
+                openai_budget.settle(est, used); return r
+            openai_budget.settle(est, 0)
+            if r.status_code not in RETRY_STATUSES or attempt >= OPENAI_RETRIES: return r
+            wait = backoff_delay(attempt, retry_after_of(r), base=1.0, cap=60.0); reason = r.status_code
+            if r.status_code == 429:
+                openai_budget.pause(wait)
+                print(f"[OpenAI] 429，全部翻譯暫停 {wait:.1f}s（第 {attempt + 1} 次）"); continue
+        print(f"[OpenAI] {reason}，第 {attempt + 1} 次，{wait:.1f}s 後重送")
+        time.sleep(wait)
+
+
+# ========== 翻譯快取（來源內容 hash） ==========
+TRANSLATION_CACHE_FILE = os.environ.get("TRANSLATION_CACHE_FILE", "translation_cache.json")
+TRANSLATION_CACHE_MAX = int(os.environ.get("TRANSLATION_CACHE_MAX", "3000"))
+TRANSLATION_PROMPT_VERSION = os.environ.get("TRANSLATION_PROMPT_VERSION", "1")  # 改這個值可讓舊快取全部失效
+
+
+class TranslationCache:
+    """翻譯結果以 sha256(prompt 指紋 + 標題 + 清理後說明 + 其他參數) 為 key 存成 JSON 檔，重啟後沿用；
+    LRU：超過 max_entries 淘汰最久沒用到的。只存成功且標題已無日文的結果"""
+    def __init__(self, path, max_entries=3000):
+        self.path = path; self.max_entries = max_entries; self.lock = threading.Lock()
+        self.hits = 0; self.misses = 0; self.evicted = 0; self.dirty = 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f: self.entries = OrderedDict(json.load(f))
+        except (OSError, ValueError):
+            self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1; return None
+            self.entries.move_to_end(key); self.hits += 1
+            return dict(self.entries[key])
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value; self.entries.move_to_end(key); self.dirty += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False); self.evicted += 1
+            if self.dirty >= 5: self._save()
+
+    def has(self, key):
+        with self.lock: return key in self.entries
+
+    def save(self):
+        with self.lock:
+            if self.dirty: self._save()
+
+    def _save(self):
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f: json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp, self.path); self.dirty = 0
+        except OSError as e:
+            print(f"[翻譯快取] 儲存失敗: {e}")
+
+    def snapshot(self):
+        total = self.hits + self.misses
+        return {'entries': len(self.entries), 'max': self.max_entries, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0, 'evicted': self.evicted}
+
+
+translation_cache = TranslationCache(TRANSLATION_CACHE_FILE, TRANSLATION_CACHE_MAX)
+atexit.register(translation_cache.save)
+
+
+def translation_source(description):
+    """快取 key 用的說明文字：去掉 script / style / 標籤與多餘空白"""
+    text = re.sub(r'<(script|style)[^>]*>.*?</\1>', ' ', description or '', flags=re.S | re.I)
+    return re.sub(r'\s+', ' ', re.sub(r'<[^>]+>', ' ', text)).strip()
+
+
+def cached_translation(fn):
+    """translate_with_chatgpt 的快取層；prompt 指紋取自 TRANSLATION_* 常數與翻譯函式內的字串常數，
+    規則 / 詞彙表一改，舊快取自動失效"""
+    consts = [c for f in (fn, translation_input, translation_result) for c in f.__code__.co_consts if isinstance(c, str)]
+    fingerprint = hashlib.sha256(json.dumps([TRANSLATION_PROMPT_VERSION, TRANSLATION_SYSTEM, TRANSLATION_FORMAT,
+                                             TRANSLATION_RULES, consts], ensure_ascii=False)
+                                 .encode('utf-8')).hexdigest()[:16]
+
+    @wraps(fn)
+    def wrapper(title, description, *args, **kwargs):
+        key = translation_key(title, description, *args, **kwargs)
+        hit = translation_cache.get(key)
+        if hit: return hit
+        result = fn(title, description, *args, **kwargs)
+        if result.get('success') and not is_japanese_text(result.get('title', '')): translation_cache.put(key, result)
+        return result
+    wrapper.fingerprint = fingerprint
+    return wrapper
+
+
+def translation_key(title, description, *args, **kwargs):
+    """快取 key：prompt 指紋 + 標題 + 清理後說明 + 其他參數（批次翻譯也用同一個 key）"""
+    return hashlib.sha256(json.dumps([translate_with_chatgpt.fingerprint, title, translation_source(description), args, kwargs],
+                                     ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+# ========== 翻譯 prompt ==========
+TRANSLATION_SYSTEM = "你是專業的日本商品翻譯和 SEO 專家。所有日文必須完全翻譯成繁體中文。"
+TRANSLATION_FORMAT = '{"title":"翻譯後的商品名稱","description":"翻譯後的商品說明（HTML格式）","page_title":"SEO標題50字以內","meta_description":"SEO描述100字以內"}'
+TRANSLATION_RULES = """規則：
+1. 品牌背景：日本創業 500 年以上的京都老舖虎屋，以高級羊羹聞名全日本
+2. 標題格式必須是「虎屋羊羹｜商品名稱」，｜後接繁體中文商品名
+3. 【強制禁止日文】所有輸出必須是繁體中文或英文，不可出現任何平假名或片假名
+4. 詞彙對照：おもかげ→憶影；夜の梅→夜之梅；はちみつ→蜂蜜；詰合せ→禮盒；小形→小型
+5. SEO 關鍵字必須自然融入，包含：虎屋、日本、羊羹、和菓子、伴手禮、高級
+6. 只回傳 JSON，不得有任何其他文字"""
+
+
+def translation_input(description):
+    """送進 prompt 的商品說明"""
+    return (description or '')[:1500]
+
+
+def translation_result(t, title, description):
+    """模型回傳的 JSON → 上架用的翻譯結果（單筆 / 批次共用）"""
+    tt = t.get('title', title)
+    if not tt.startswith('虎屋羊羹｜'):
+        tt = PRODUCT_PREFIX + (tt[4:].lstrip() if tt.startswith('虎屋羊羹') else tt)
+    return {'success': True, 'title': tt, 'description': t.get('description', description),
+            'page_title': t.get('page_title', ''), 'meta_description': t.get('meta_description', '')}
+
+
+@cached_translation
 def translate_with_chatgpt(title, description):
     prompt = f"""你是專業的日本商品翻譯和 SEO 專家。將以下日本商品資訊翻譯成繁體中文並優化 SEO。
 
 商品名稱：{title}
-商品說明：{description[:1500]}
+商品說明：{translation_input(description)}
 
 只回傳此 JSON 格式，不加 markdown、不加任何其他文字：
-{"title":"翻譯後的商品名稱","description":"翻譯後的商品說明（HTML格式）","page_title":"SEO標題50字以內","meta_description":"SEO描述100字以內"}
+{TRANSLATION_FORMAT}
 
-規則：
-1. 品牌背景：日本創業 500 年以上的京都老舖虎屋，以高級羊羹聞名全日本
-2. 標題格式必須是「虎屋羊羹｜商品名稱」，｜後接繁體中文商品名
-3. 【強制禁止日文】所有輸出必須是繁體中文或英文，不可出現任何平假名或片假名
-4. 詞彙對照：おもかげ→憶影；夜の梅→夜之梅；はちみつ→蜂蜜；詰合せ→禮盒；小形→小型
-5. SEO 關鍵字必須自然融入，包含：虎屋、日本、羊羹、和菓子、伴手禮、高級
-6. 只回傳 JSON，不得有任何其他文字"""
+{TRANSLATION_RULES}"""
     try:
-        r = requests.post("https://api.openai.com/v1/chat/completions",
-            headers={"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"},
-            json={"model": "gpt-4o-mini", "messages": [
-                {"role": "system", "content": "你是專業的日本商品翻譯和 SEO 專家。所有日文必須完全翻譯成繁體中文。"},
+        r = openai_chat({"model": "gpt-4o-mini", "messages": [
+                {"role": "system", "content": TRANSLATION_SYSTEM},
                 {"role": "user", "content": prompt}], "temperature": 0, "max_tokens": 1000}, timeout=60)
         if r.status_code == 200:
             c = r.json()['choices'][0]['message']['content'].strip()
             if c.startswith('```'): c = c.split('\n', 1)[1]
             if c.endswith('```'): c = c.rsplit('```', 1)[0]
             t = json.loads(c.strip())
-            tt = t.get('title', title)
-            if not tt.startswith('虎屋羊羹｜'):
-                if tt.startswith('虎屋羊羹'): tt = PRODUCT_PREFIX + tt[4:].lstrip()
-                else: tt = PRODUCT_PREFIX + tt
-            return {'success': True, 'title': tt, 'description': t.get('description', description),
-                    'page_title': t.get('page_title', ''), 'meta_description': t.get('meta_description', '')}
+            return translation_result(t, title, description)
         else:
             return {'success': False, 'error': f"HTTP {r.status_code}: {r.text[:200]}",
                     'title': f"{PRODUCT_PREFIX}{title}", 'description': description, 'page_title': '', 'meta_description': ''}
@@ -174,11 +540,113 @@ def translate_with_chatgpt(title, description):
                 'title': f"{PRODUCT_PREFIX}{title}", 'description': description, 'page_title': '', 'meta_description': ''}
 
 
+# ========== 批次翻譯 ==========
+TRANSLATE_BATCH_SIZE = int(os.environ.get("TRANSLATE_BATCH_SIZE", "5"))  # 1 = 不打包，一筆一個請求（仍並行）
+
+
+def translate_batch(items):
+    """items: [(sku, title, description)] → 一次請求翻譯多個商品，回傳 {sku: 翻譯結果}；
+    每筆各自驗證（標題 / 說明齊全、標題無日文），沒過的不放進結果，由呼叫端退回單筆翻譯"""
+    blocks = "\n\n".join(f"SKU：{sku}\n商品名稱：{title}\n商品說明：{translation_input(description)}"
+                         for sku, title, description in items)
+    prompt = f"""你是專業的日本商品翻譯和 SEO 專家。將以下 {len(items)} 個日本商品資訊各自翻譯成繁體中文並優化 SEO。
+
+{blocks}
+
+只回傳一個 JSON 物件，key 為各商品的 SKU，value 為該商品的翻譯結果，不加 markdown、不加任何其他文字：
+{{"SKU":{TRANSLATION_FORMAT}}}
+
+{TRANSLATION_RULES}
+7. 每個 SKU 各自翻譯，不可合併或混用其他商品的內容"""
+    r = openai_chat({"model": "gpt-4o-mini", "messages": [
+            {"role": "system", "content": TRANSLATION_SYSTEM},
+            {"role": "user", "content": prompt}], "temperature": 0, "max_tokens": min(16000, 1000 * len(items)),
+            "response_format": {"type": "json_object"}}, timeout=60 + 20 * len(items))
+    if r.status_code != 200:
+        print(f"[批次翻譯] HTTP {r.status_code}: {r.text[:200]}"); return {}
+    c = r.json()['choices'][0]['message']['content'].strip()
+    if c.startswith('```'): c = c.split('\n', 1)[1]
+    if c.endswith('```'): c = c.rsplit('```', 1)[0]
+    data = json.loads(c.strip())
+    out = {}
+    for sku, title, description in items:
+        t = data.get(sku) if isinstance(data, dict) else None
+        if not isinstance(t, dict) or not t.get('title') or not t.get('description'): continue
+        res = translation_result(t, title, description)
+        if not is_japanese_text(res['title']): out[sku] = res
+    return out
+
+
+class TranslationBatcher:
+    """待上架商品先 submit 排隊，湊滿 size 個就打包成一次請求，交給 workers 條執行緒並行翻譯（size=1 時一筆一個請求）；
+    upload_to_shopify 以 result() 取自己那筆，還在排隊的會先提早送出。批次結果寫進翻譯快取，沒過驗證的商品個別退回單筆翻譯"""
+    def __init__(self, size, workers=1):
+        self.size = max(1, size); self.workers = workers; self.lock = threading.Lock()
+        self.queue = []; self.futures = {}
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='translate')
+        self.batches = 0; self.batched = 0; self.fallbacks = 0
+
+    def submit(self, sku, title, description):
+        if not title: return
+        key = translation_key(title, description)
+        with self.lock:
+            if key in self.futures or translation_cache.has(key): return
+            fu = self.futures[key] = Future()
+            self.queue.append((key, str(sku or len(self.queue)), title, description, fu))
+            if len(self.queue) >= self.size: self._flush()
+
+    def _flush(self):  # 呼叫端持有 lock
+        if self.queue: self.pool.submit(self._run, self.queue); self.queue = []
+
+    def _run(self, chunk):
+        ids = {}
+        for i, entry in enumerate(chunk):
+            ids[entry[1] if entry[1] not in ids else f"{entry[1]}-{i}"] = entry
+        done = {}; single = None
+        if scrape_status.get('translation_stopped'): pass  # 已因翻譯連續失敗停止 → 不再打 API
+        elif len(ids) == 1:
+            sid, (_, _, title, description, _) = next(iter(ids.items()))
+            # 單筆自己會寫快取；沒過驗證也原樣交回，由 upload_to_shopify 判斷，不在 result() 再打一次
+            single = translate_with_chatgpt(title, description)
+            if single.get('success') and not is_japanese_text(single['title']): done[sid] = single
+        else:
+            try: done = translate_batch([(sid, e[2], e[3]) for sid, e in ids.items()])
+            except Exception as e: print(f"[批次翻譯] {e}")
+        with self.lock:
+            self.batches += 1; self.batched += len(done); self.fallbacks += len(ids) - len(done) if single is None else 0
+        for sid, (key, _, _, _, fu) in ids.items():
+            if sid in done: translation_cache.put(key, done[sid])
+            fu.set_result(done.get(sid) or single)
+
+    def result(self, title, description):
+        """有排隊 / 進行中的批次就等它；沒有，或這筆在多筆批次裡沒過驗證，照常單筆翻譯（單筆請求的結果不論成敗直接回傳）"""
+        key = translation_key(title, description)
+        with self.lock:
+            fu = self.futures.pop(key, None)
+            if fu and any(e[0] == key for e in self.queue): self._flush()
+        return (fu.result() if fu else None) or translate_with_chatgpt(title, description)
+
+    def snapshot(self):
+        with self.lock:
+            return {'size': self.size, 'workers': self.workers, 'batches': self.batches, 'batched': self.batched,
+                    'fallbacks': self.fallbacks, 'queued': len(self.queue), 'pending': len(self.futures)}
+
+
+translation_batcher = TranslationBatcher(TRANSLATE_BATCH_SIZE, TRANSLATE_WORKERS)
+
+
+def queue_translation(product, min_price=0):
+    """詳情已到手、之後應該會上架的商品（有庫存、價格達標）先排進批次翻譯；回傳 product，方便接在 fetch 後面"""
+    if product and product.get('title') and product.get('in_stock', True) and product.get('price', 0) >= min_price:
+        translation_batcher.submit(product.get('sku'), product['title'], product.get('description', ''))
+    return product
+
+
 def get_existing_products_map():
     pm = {}
     url = shopify_api_url("products.json?limit=250")
     while url:
-        r = requests.get(url, headers=get_shopify_headers())
+        r = client.get(url, headers=get_shopify_headers())
         if r.status_code != 200: break
         for p in r.json().get('products', []):
             pid = p.get('id')
@@ -201,7 +669,7 @@ def get_collection_products_map(collection_id):
     if not collection_id: return pm
     url = shopify_api_url(f"collections/{collection_id}/products.json?limit=250")
     while url:
-        r = requests.get(url, headers=get_shopify_headers())
+        r = client.get(url, headers=get_shopify_headers())
         if r.status_code != 200: break
         for p in r.json().get('products', []):
             pid = p.get('id')
@@ -224,7 +692,7 @@ def get_toraya_products_map():
     pm = {}
     url = shopify_api_url("products.json?limit=250&vendor=虎屋")
     while url:
-        r = requests.get(url, headers=get_shopify_headers())
+        r = client.get(url, headers=get_shopify_headers())
         if r.status_code != 200: break
         for p in r.json().get('products', []):
             pid = p.get('id')
@@ -239,7 +707,7 @@ def get_toraya_products_map():
     if not pm:
         url = shopify_api_url("products.json?limit=250")
         while url:
-            r = requests.get(url, headers=get_shopify_headers())
+            r = client.get(url, headers=get_shopify_headers())
             if r.status_code != 200: break
             for p in r.json().get('products', []):
                 pid = p.get('id')
@@ -255,45 +723,106 @@ def get_toraya_products_map():
 
 
 def delete_product(pid):
-    return requests.delete(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers()).status_code == 200
+    return client.delete(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers()).status_code == 200
 
 
 def update_product(pid, data):
-    r = requests.put(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers(),
+    r = client.put(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers(),
         json={"product": {"id": pid, **data}})
     return r.status_code == 200, r
 
 
 def get_or_create_collection(ct="虎屋羊羹"):
-    r = requests.get(shopify_api_url('custom_collections.json?limit=250'), headers=get_shopify_headers())
+    r = client.get(shopify_api_url('custom_collections.json?limit=250'), headers=get_shopify_headers())
     if r.status_code == 200:
         for c in r.json().get('custom_collections', []):
             if c['title'] == ct: return c['id']
-    r = requests.post(shopify_api_url('custom_collections.json'), headers=get_shopify_headers(),
+    r = client.post(shopify_api_url('custom_collections.json'), headers=get_shopify_headers(),
         json={'custom_collection': {'title': ct, 'published': True}})
     if r.status_code == 201: return r.json()['custom_collection']['id']
     return None
 
 
 def add_product_to_collection(pid, cid):
-    return requests.post(shopify_api_url('collects.json'), headers=get_shopify_headers(),
+    return client.post(shopify_api_url('collects.json'), headers=get_shopify_headers(),
         json={'collect': {'product_id': pid, 'collection_id': cid}}).status_code == 201
 
 
 def publish_to_all_channels(pid):
     gu = f"https://{SHOPIFY_SHOP}.myshopify.com/admin/api/2024-01/graphql.json"
     hd = {'X-Shopify-Access-Token': SHOPIFY_ACCESS_TOKEN, 'Content-Type': 'application/json'}
-    r = requests.post(gu, headers=hd, json={'query': '{ publications(first:20){ edges{ node{ id name }}}}'})
+    r = client.post(gu, headers=hd, json={'query': '{ publications(first:20){ edges{ node{ id name }}}}'})
     if r.status_code != 200: return False
     pubs = r.json().get('data', {}).get('publications', {}).get('edges', [])
     seen = set(); uq = []
     for p in pubs:
         if p['node']['name'] not in seen: seen.add(p['node']['name']); uq.append(p['node'])
     mut = """mutation publishablePublish($id:ID!,$input:[PublicationInput!]!){publishablePublish(id:$id,input:$input){userErrors{field message}}}"""
-    requests.post(gu, headers=hd, json={'query': mut, 'variables': {"id": f"gid://shopify/Product/{pid}", "input": [{"publicationId": p['id']} for p in uq]}})
+    client.post(gu, headers=hd, json={'query': mut, 'variables': {"id": f"gid://shopify/Product/{pid}", "input": [{"publicationId": p['id']} for p in uq]}})
     return True
 
 
+# ========== 尺寸 / 重量抽取引擎 ==========
+SIZE_TRANS = str.maketrans({'×': 'x', '✕': 'x', 'Φ': '', 'φ': '', ',': ''})
+SIZE_NUM = r'(\d+(?:\.\d+)?)'
+SIZE_LABEL = r'(?:[WDHL]|縦|横|高さ|タテ|ヨコ|奥行き?|幅)?'
+
+
+class SizeWeightRule:
+    """尺寸 + 重量單次抽取：NFKC 正規化（全形數字 / ｍｍ / ㎏ 等）後，一條編譯好的 regex
+    finditer 一遍同時收尺寸與重量，單位統一成 cm / kg。
+    dim_unit：尺寸沒寫單位時當作的單位（None = 必須寫單位）；weight_units：接受的重量單位，順序即優先序；
+    weight_end：g 之後不可接的字元；cylinder：允許「直徑 x 高 mm」兩維"""
+    def __init__(self, dim_prefix='', weight_prefix='', dim_unit=None, weight_units=('kg', 'g'),
+                 weight_end=r'(?![a-z0-9])', cylinder=False, dims=True, ndigits=2):
+        dim = (rf'{dim_prefix}{SIZE_LABEL}\s*(?P<a>\d+(?:\.\d+)?)\s*(?P<ua>mm|cm)?\s*x\s*'
+               rf'{SIZE_LABEL}\s*(?P<b>\d+(?:\.\d+)?)\s*(?P<ub>mm|cm)?'
+               rf'(?:\s*x\s*{SIZE_LABEL}\s*(?P<c>\d+(?:\.\d+)?))?(?:\s*\(?\s*(?P<u>mm|cm)(?:\s*\))?)?')
+        wt = rf'{weight_prefix}(?P<w>\d+(?:\.\d+)?)\s*(?P<wu>kg|g{weight_end})'
+        parts = ([f'(?P<dim>{dim})'] if dims else []) + ([f'(?P<wt>{wt})'] if weight_units else [])
+        self.rx = re.compile('|'.join(parts), re.I)
+        self.dim_unit = dim_unit; self.weight_units = weight_units
+        self.cylinder = cylinder; self.dims = dims; self.ndigits = ndigits
+
+    def __call__(self, text):
+        box = cyl = None; weights = {}
+        for m in self.rx.finditer(unicodedata.normalize('NFKC', text or '').translate(SIZE_TRANS)):
+            if m.lastgroup == 'wt':
+                u = m['wu'].lower()
+                if u in self.weight_units and u not in weights:
+                    weights[u] = float(m['w']) / (1000 if u == 'g' else 1)
+            else:
+                units = [m['ua'] or m['u'] or self.dim_unit, m['ub'] or m['u'] or self.dim_unit, m['u'] or self.dim_unit]
+                nums = [n for n in (m['a'], m['b'], m['c']) if n is not None]
+                if not all(units[:len(nums)]): continue
+                vals = [float(n) / (10 if un.lower() == 'mm' else 1) for n, un in zip(nums, units)]
+                if len(vals) == 3 and box is None: box = vals
+                elif len(vals) == 2 and self.cylinder and cyl is None and (m['u'] or m['ub']): cyl = vals
+            if (box or not self.dims) and len(weights) == len(self.weight_units): break
+        weight = next((weights[u] for u in self.weight_units if u in weights), None)
+        dimension = None
+        if box:
+            l, w, h = box
+            dimension = {'l': l, 'w': w, 'h': h, 'volume_weight': round(l * w * h / 6000, self.ndigits)}
+        elif cyl:
+            d, h = cyl
+            dimension = {'diameter': d, 'height': h, 'volume_weight': round(math.pi * (d / 2) ** 2 * h / 6000, self.ndigits)}
+        vw = dimension['volume_weight'] if dimension else 0
+        return {'dimension': dimension, 'actual_weight': round(weight, 3) if weight else None,
+                'volume_weight': vw, 'final_weight': round(max(vw, weight or 0), self.ndigits)}
+
+
+SIZE_RULE = SizeWeightRule()
+PAGE_SIZE_RULE = SizeWeightRule(weight_units=('kg',))  # 整頁退路只信 kg，避免抓到內容量的 g
+SIZE_FIXTURES = [  # (文字, actual_weight, final_weight)：改 SIZE_RULE 後打 /api/test-size 對一遍
+    ('200×150×60mm 450g', 0.45, 0.45),
+    ('200×150×60mm\u3000450g', 0.45, 0.45),
+    ('200×150×60mm\n450g', 0.45, 0.45),
+    ('120mm×80mm×40mm 250g', 0.25, 0.25),
+    ('20×15×6cm 450g', 0.45, 0.45),
+]
+
+
 def parse_dimension_weight_from_soup(soup):
     dimension = None; weight = None
     for block in soup.select('.DefinitionBlock, dl'):
@@ -301,31 +830,12 @@ def parse_dimension_weight_from_soup(soup):
             dd = dt.find_next_sibling('dd')
             if not dd: continue
             dt_t = dt.get_text(strip=True); dd_t = dd.get_text(strip=True)
-            if '大きさ' in dt_t:
-                dm = re.search(r'(\d+(?:\.\d+)?)\s*[×xX]\s*(\d+(?:\.\d+)?)\s*[×xX]\s*(\d+(?:\.\d+)?)\s*cm', dd_t)
-                if dm:
-                    l,w,h = float(dm.group(1)),float(dm.group(2)),float(dm.group(3))
-                    dimension = {"l":l,"w":w,"h":h,"volume_weight":round((l*w*h)/6000,2)}
-            if '重さ' in dt_t:
-                wm = re.search(r'(\d+(?:\.\d+)?)\s*(kg|g)', dd_t, re.IGNORECASE)
-                if wm:
-                    wv = float(wm.group(1))
-                    weight = wv/1000 if wm.group(2).lower()=='g' else wv
+            if '大きさ' in dt_t: dimension = SIZE_RULE(dd_t)['dimension'] or dimension
+            if '重さ' in dt_t: weight = SIZE_RULE(dd_t)['actual_weight'] or weight
     if not dimension or not weight:
-        pt = soup.get_text()
-        if not dimension:
-            dm = re.search(r'(\d+(?:\.\d+)?)\s*[×xX]\s*(\d+(?:\.\d+)?)\s*[×xX]\s*(\d+(?:\.\d+)?)\s*cm', pt)
-            if dm:
-                l,w,h = float(dm.group(1)),float(dm.group(2)),float(dm.group(3))
-                dimension = {"l":l,"w":w,"h":h,"volume_weight":round((l*w*h)/6000,2)}
-        if not weight:
-            wm = re.search(r'(\d+(?:\.\d+)?)\s*kg', pt, re.IGNORECASE)
-            if wm: weight = float(wm.group(1))
-    final = 0
-    if dimension and weight: final = max(dimension['volume_weight'], weight)
-    elif dimension: final = dimension['volume_weight']
-    elif weight: final = weight
-    else: final = 0.3
+        wi = PAGE_SIZE_RULE(soup.get_text())
+        dimension = dimension or wi['dimension']; weight = weight or wi['actual_weight']
+    final = max(dimension['volume_weight'] if dimension else 0, weight or 0) or 0.3
     return {"dimension": dimension, "actual_weight": weight, "final_weight": round(final, 2)}
 
 
@@ -356,9 +866,7 @@ def translate_landing_html_with_chatgpt(items_data):
     prompt = f"""翻譯以下日本和菓子商品資訊成繁體中文。回傳JSON陣列，保持結構，翻譯name/allergen/expiry。なし→無。
 {json.dumps(items_data, ensure_ascii=False)}"""
     try:
-        r = requests.post("https://api.openai.com/v1/chat/completions",
-            headers={"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"},
-            json={"model": "gpt-4o-mini", "messages": [
+        r = openai_chat({"model": "gpt-4o-mini", "messages": [
                 {"role": "system", "content": "日本和菓子翻譯專家。"},
                 {"role": "user", "content": prompt}], "temperature": 0, "max_tokens": 2000}, timeout=60)
         if r.status_code == 200:
@@ -410,29 +918,88 @@ def scrape_shopify_products():
                 variants = p.get('variants', [])
                 price = int(float(variants[0].get('price', '0'))) if variants else 0
                 images = [img.get('src', '') for img in p.get('images', [])]
+                # v2.4: products.json 的 variants 已帶 available，已上架商品的庫存檢查不必再抓頁面
+                avail = [v['available'] for v in variants if 'available' in v]
                 products.append({
                     'url': f"{BASE_URL}/onlineshop/{handle}",
                     'sku': f"toraya-{handle}",
+                    'handle': handle,
+                    'updated_at': p.get('updated_at', ''),
                     'title': p.get('title', ''),
                     'price': price,
                     'description': '',
                     'images': images,
+                    'available': any(avail) if avail else None,
                     'in_stock': True,
                     'weight': 0,
                     'need_detail_scrape': True
                 })
             print(f"[v2.3] products.json page {page}: {len(page_products)} 筆商品")
             page += 1
-            time.sleep(0.3)
     except Exception as e:
         print(f"[v2.3] scrape_shopify_products 錯誤: {e}")
     print(f"[v2.3] 虎屋官網共爬到 {len(products)} 筆商品")
     return products
 
 
+# ========== 庫存判定（商品區塊內單次多關鍵字掃描） ==========
+class StockDetector:
+    """缺貨關鍵字編成一條 alternation regex，只在商品 / 購物車區塊內掃一次，
+    頁尾、推薦商品裡的「品切れ」不會誤判。region 依序嘗試，第一個命中的 selector 為準，
+    全部沒命中時退回整頁文字（舊行為）。
+    判定順序沿用小倉：缺貨字 → 在庫 ○△× → 購物車（正向訊號，看整頁）→ 缺貨 class"""
+    def __init__(self, sold_out, region=(), marker=r'在庫[：:]\s*([○△×])',
+                 cart=None, cart_text=None, sold_out_css=None):
+        self.sold_out = re.compile('|'.join(map(re.escape, sold_out)))
+        self.region = region; self.marker = re.compile(marker) if marker else None
+        self.cart = cart; self.cart_text = cart_text; self.sold_out_css = sold_out_css
+
+    def scope(self, soup):
+        for sel in self.region:
+            nodes = soup.select(sel)
+            if nodes: return nodes
+        return None
+
+    def __call__(self, soup, page_text=None):
+        nodes = self.scope(soup)
+        if page_text is None and (not nodes or self.cart_text): page_text = soup.get_text()
+        text = '\n'.join(n.get_text() for n in nodes) if nodes else page_text
+        if self.sold_out.search(text): return False
+        if self.marker:
+            m = self.marker.search(text)
+            if m: return m.group(1) != '×'
+        if (self.cart or self.cart_text) and not (
+                (self.cart and soup.select_one(self.cart)) or (self.cart_text and self.cart_text in page_text)):
+            return False
+        if self.sold_out_css and any(n.select_one(self.sold_out_css) for n in (nodes or [soup])): return False
+        return True
+
+
+STOCK_RULE = StockDetector(['在庫がありません','在庫切れ','品切れ','SOLD OUT','売り切れ','完売','販売終了'],
+                           ('.Product__Info', '.ProductForm', 'main'))
+
+
+def parse_html_blocks(soup):
+    """只有 HTML 才有的部分：詰め合わせ內容、說明文字、大きさ / 重さ"""
+    assort_data = extract_landing_page_html(soup)
+    desc = ""
+    for sel in ['.ProductDescription','.product-description','[class*="description"]','[class*="detail"]']:
+        de = soup.select_one(sel)
+        if de: desc = de.get_text(strip=True)[:500]; break
+    if not desc:
+        ai = soup.select_one('.AssortItems')
+        if ai:
+            names = [i.get_text(strip=True) for i in ai.select('.AssortItem h4')[:5]]
+            if names: desc = f"詰め合わせ内容：{', '.join(names)}"
+    wi = parse_dimension_weight_from_soup(soup)
+    if wi['final_weight'] == 0: wi['final_weight'] = DEFAULT_WEIGHT
+    return {'description': desc, 'assort_items_data': assort_data, 'weight': wi['final_weight'], 'weight_info': wi}
+
+
 def scrape_product_detail_selenium(url):
+    """整頁 HTML 解析（JSON 端點失敗時的退路）"""
     try:
-        r = session.get(url, timeout=30)
+        r = session.get_hedged(url, timeout=30)
         if r.status_code != 200: return None
         soup = BeautifulSoup(r.text, 'html.parser'); pt = soup.get_text()
         title = ""
@@ -441,16 +1008,6 @@ def scrape_product_detail_selenium(url):
         if not title:
             tt = soup.select_one('title')
             if tt: title = tt.get_text(strip=True).split('|')[0].strip()
-        assort_data = extract_landing_page_html(soup)
-        desc = ""
-        for sel in ['.ProductDescription','.product-description','[class*="description"]','[class*="detail"]']:
-            de = soup.select_one(sel)
-            if de: desc = de.get_text(strip=True)[:500]; break
-        if not desc:
-            ai = soup.select_one('.AssortItems')
-            if ai:
-                names = [i.get_text(strip=True) for i in ai.select('.AssortItem h4')[:5]]
-                if names: desc = f"詰め合わせ内容：{', '.join(names)}"
         price = 0
         for pat in [r'¥([\d,]+)', r'([\d,]+)円']:
             pm = re.search(pat, pt)
@@ -461,9 +1018,7 @@ def scrape_product_detail_selenium(url):
             um = re.search(r'/products/([^/?]+)', url)
             if um: sku = f"toraya-{um.group(1)}"
         # === v2.2: 缺貨偵測（擴充關鍵字）===
-        in_stock = not any(k in pt for k in ['在庫がありません','在庫切れ','品切れ','SOLD OUT','売り切れ','完売','販売終了'])
-        wi = parse_dimension_weight_from_soup(soup)
-        if wi['final_weight'] == 0: wi['final_weight'] = DEFAULT_WEIGHT
+        in_stock = STOCK_RULE(soup, pt)
         images = []; seen = set()
         for img in soup.select('.ProductImage img, .product-image img, [class*="Gallery"] img'):
             src = img.get('src','') or img.get('data-src','')
@@ -479,14 +1034,110 @@ def scrape_product_detail_selenium(url):
                     bs = src.split('?')[0]
                     if bs not in seen: seen.add(bs); images.append(src)
         return {'url': url, 'sku': sku, 'title': title, 'price': price, 'in_stock': in_stock,
-                'description': desc, 'assort_items_data': assort_data,
-                'weight': wi['final_weight'], 'weight_info': wi, 'images': images[:10]}
+                'images': images[:10], **parse_html_blocks(soup)}
     except Exception as e:
         print(f"[錯誤] {url}: {e}"); return None
 
 
+# ========== v2.4: storefront JSON 快速路徑 ==========
+def shopify_img(src):
+    return 'https:' + src if src and src.startswith('//') else src
+
+
+def fetch_product_json(handle):
+    """虎屋本身是 Shopify：先讀 /products/{handle}.js（價格單位為「分」、含 available），失敗再讀 .json"""
+    try:
+        r = session.get(f"{CHECKOUT_URL}/products/{handle}.js", timeout=30)
+        if r.status_code == 200:
+            p = r.json()
+            variants = [{'id': v.get('id'), 'title': v.get('title', ''), 'price': int(v.get('price', 0)) // 100,
+                         'available': v.get('available'), 'grams': v.get('weight') or 0} for v in p.get('variants', [])]
+            return {'title': p.get('title', ''), 'price': int(p.get('price', 0)) // 100,
+                    'in_stock': bool(p.get('available')), 'variants': variants,
+                    'images': [shopify_img(u) for u in p.get('images', []) if u]}
+        r = session.get(f"{CHECKOUT_URL}/products/{handle}.json", timeout=30)
+        if r.status_code == 200:
+            p = r.json().get('product', {})
+            variants = [{'id': v.get('id'), 'title': v.get('title', ''), 'price': int(float(v.get('price') or 0)),
+                         'available': v.get('available'), 'grams': v.get('grams') or 0} for v in p.get('variants', [])]
+            avail = [v['available'] for v in variants if v['available'] is not None]
+            return {'title': p.get('title', ''), 'price': variants[0]['price'] if variants else 0,
+                    'in_stock': any(avail) if avail else None, 'variants': variants,
+                    'images': [shopify_img(i.get('src', '')) for i in p.get('images', []) if i.get('src')]}
+    except Exception as e:
+        print(f"[JSON] {handle}: {e}")
+    return None
+
+
+def scrape_product_detail_json(item):
+    """價格 / 庫存 / 規格 / 圖片取自 JSON；HTML 只解析詰め合わせ與大きさ・重さ區塊。JSON 失敗才整頁解析"""
+    data = fetch_product_json(item.get('handle') or item['sku'].replace('toraya-', '', 1))
+    if not data: return scrape_product_detail_selenium(item['url'])
+    product = {'url': item['url'], 'sku': item['sku'], 'title': data['title'] or item.get('title', ''),
+               'price': data['price'], 'variants': data['variants'], 'images': data['images'][:10],
+               'description': '', 'assort_items_data': None, 'weight': DEFAULT_WEIGHT, 'weight_info': None}
+    try:
+        r = session.get_hedged(item['url'], timeout=30)
+        if r.status_code == 200:
+            soup = BeautifulSoup(r.text, 'html.parser')
+            product.update(parse_html_blocks(soup))
+            product['in_stock'] = data['in_stock'] if data['in_stock'] is not None else STOCK_RULE(soup)
+    except Exception as e:
+        print(f"[錯誤] {item['url']}: {e}")
+    product.setdefault('in_stock', data['in_stock'] is not False)
+    grams = max((v['grams'] for v in data['variants']), default=0)
+    wi = product['weight_info'] or {}
+    if grams and not wi.get('actual_weight') and not wi.get('dimension'): product['weight'] = round(grams / 1000, 2)
+    return product
+
+
+# ========== v2.5: 來源 feed 快照與 updated_at 增量 ==========
+FEED_INCREMENTAL = os.environ.get("FEED_INCREMENTAL", "false").lower() == "true"
+FEED_SNAPSHOT_TTL = int(os.environ.get("FEED_SNAPSHOT_TTL", "21600"))  # 秒；同步刪除在這段時間內沿用上次的 feed
+
+
+class FeedState:
+    """products.json 快照 + 每個 handle 的 updated_at / available 與上次詳情結果。
+    兩者都沒變、且上次結果已足以判斷（缺貨 / 低價）的新品不再抓詳情、不再翻譯；
+    官網商品集合仍以當次 feed 為準，刪除比對不受影響"""
+    def __init__(self, path, min_price):
+        self.path = path; self.min_price = min_price
+        self.snapshot = []; self.fetched_at = 0; self.lock = threading.Lock()
+        try:
+            with open(path, 'r') as f: self.state = json.load(f)
+        except (OSError, ValueError): self.state = {}
+
+    def products(self, max_age=0):
+        """回傳 (商品列表, 是否沿用快照)；max_age=0 一律重抓"""
+        with self.lock:
+            if self.snapshot and time.time() - self.fetched_at < max_age: return self.snapshot, True
+            products = scrape_shopify_products()
+            if products: self.snapshot = products; self.fetched_at = time.time()
+            return products, False
+
+    def cached(self, item):
+        if not FEED_INCREMENTAL: return None
+        memo = self.state.get(item['handle'])
+        if not memo or memo['updated_at'] != item['updated_at'] or memo['available'] != item['available']: return None
+        if memo['in_stock'] and memo['price'] >= self.min_price: return None
+        return {'url': item['url'], 'sku': item['sku'], 'price': memo['price'], 'in_stock': memo['in_stock'], 'cached': True}
+
+    def record(self, item, product):
+        if item['updated_at']:
+            self.state[item['handle']] = {'updated_at': item['updated_at'], 'available': item['available'],
+                                          'price': product.get('price', 0), 'in_stock': product.get('in_stock', True)}
+
+    def save(self):
+        try:
+            with open(self.path, 'w') as f: json.dump(self.state, f)
+        except OSError as e: print(f"[feed] 狀態寫入失敗: {e}")
+
+
+feed_state = FeedState("feed_state.json", MIN_PRICE)
+
+
 def upload_to_shopify(product, collection_id=None):
-    translated = translate_with_chatgpt(product['title'], product.get('description', ''))
+    translated = translation_batcher.result(product['title'], product.get('description', ''))
     if not translated['success']:
         return {'success': False, 'error': 'translation_failed', 'translated': translated}
     cost = product['price']
@@ -514,10 +1165,10 @@ def upload_to_shopify(product, collection_id=None):
         'metafields_global_description_tag': translated['meta_description'],
         'metafields': [{'namespace': 'custom', 'key': 'link', 'value': product['url'], 'type': 'url'}]
     }}
-    r = requests.post(shopify_api_url('products.json'), headers=get_shopify_headers(), json=sp)
+    r = client.post(shopify_api_url('products.json'), headers=get_shopify_headers(), json=sp)
     if r.status_code == 201:
         cp = r.json()['product']; pid = cp['id']; vid = cp['variants'][0]['id']
-        requests.put(shopify_api_url(f'variants/{vid}.json'), headers=get_shopify_headers(),
+        client.put(shopify_api_url(f'variants/{vid}.json'), headers=get_shopify_headers(),
             json={'variant': {'id': vid, 'cost': f"{cost:.2f}"}})
         if collection_id: add_product_to_collection(pid, collection_id)
         publish_to_all_channels(pid)
@@ -540,10 +1191,10 @@ def sync_delete_stale_products():
 
         # 1. 爬取官網目前所有商品
         sync_status['current_step'] = "爬取虎屋官網商品列表..."
-        product_list = scrape_shopify_products()
+        product_list, reused = feed_state.products(FEED_SNAPSHOT_TTL)
         website_skus = set(item['sku'] for item in product_list)
         log["website_skus_count"] = len(website_skus)
-        print(f"[v2.3 sync] 官網商品: {len(website_skus)} 筆")
+        print(f"[v2.3 sync] 官網商品: {len(website_skus)} 筆{'（沿用 feed 快照）' if reused else ''}")
 
         # === 安全檢查 — 爬蟲結果太少時跳過刪除 ===
         if len(website_skus) < MIN_SCRAPED_PRODUCTS_FOR_DELETE:
@@ -578,7 +1229,6 @@ def sync_delete_stale_products():
                 else:
                     log["errors"].append(f"刪除失敗: {sku}")
                     print(f"[v2.3 sync] ✗ 刪除失敗 {sku}")
-            time.sleep(0.3)
 
         print(f"[v2.3 sync] 完成，共刪除 {len(log['deleted_skus'])} 筆")
         sync_status['current_step'] = f"完成，刪除 {len(log['deleted_skus'])} 筆"
@@ -596,11 +1246,12 @@ def sync_delete_stale_products():
 
 def run_scrape():
     global scrape_status
+    retry_budget.reset()
     try:
         scrape_status.update({"running": True, "progress": 0, "total": 0, "current_product": "",
             "products": [], "errors": [], "uploaded": 0, "skipped": 0,
             "filtered_by_price": 0, "out_of_stock": 0, "deleted": 0,
-            "translation_failed": 0, "translation_stopped": False})
+            "translation_failed": 0, "translation_stopped": False, "unchanged": 0})
 
         scrape_status['current_product'] = "檢查 Shopify 商品..."
         existing_map = get_existing_products_map()
@@ -614,7 +1265,7 @@ def run_scrape():
         toraya_skus = set(toraya_pm.keys())
 
         scrape_status['current_product'] = "爬取虎屋官網商品列表..."
-        product_list = scrape_shopify_products()
+        product_list, _ = feed_state.products()
 
         # === v2.3: 移除無效的 HTML fallback，改為直接報錯 ===
         if not product_list:
@@ -629,25 +1280,34 @@ def run_scrape():
         out_of_stock_skus = set()
         ctf = 0
 
+        # === v2.7: products.json 已有說明的新商品先全部排進批次翻譯（要讀單品 JSON 的等詳情回來再單筆）===
+        for item in product_list:
+            if item['sku'] not in existing_skus and item['available'] is not False \
+                    and not item.get('need_detail_scrape') and item.get('weight', 0):
+                queue_translation(item, MIN_PRICE)
+
         for idx, item in enumerate(product_list):
             scrape_status['progress'] = idx + 1
             scrape_status['current_product'] = f"處理: {item.get('title', item['sku'])}"
 
             if item['sku'] in existing_skus:
-                # 已上架商品也爬詳情頁檢查庫存
+                # 已上架商品：products.json 已有 available 就直接用，沒有才讀單品 JSON
                 if item['sku'] in toraya_skus:
-                    detail = scrape_product_detail_selenium(item['url'])
+                    detail = {'in_stock': item['available']} if item['available'] is not None else scrape_product_detail_json(item)
                     if detail and not detail.get('in_stock', True):
                         out_of_stock_skus.add(item['sku'])
                         scrape_status['out_of_stock'] += 1
-                    time.sleep(0.5)
                 scrape_status['skipped'] += 1; continue
 
             if item.get('price',0) > 0 and item['price'] < MIN_PRICE:
                 scrape_status['skipped'] += 1; continue
 
             if item.get('need_detail_scrape') or item.get('weight',0) == 0:
-                detail = scrape_product_detail_selenium(item['url'])
+                detail = feed_state.cached(item)
+                if detail: scrape_status['unchanged'] += 1
+                else:
+                    detail = scrape_product_detail_json(item)
+                    if detail: feed_state.record(item, detail)
                 if detail:
                     item['assort_items_data'] = detail.get('assort_items_data')
                     item['weight'] = detail.get('weight', 0.3)
@@ -656,9 +1316,9 @@ def run_scrape():
                         existing_imgs = set(item.get('images',[]))
                         for img in detail['images']:
                             if img not in existing_imgs: item.setdefault('images',[]).append(img)
-                    if item.get('price',0) == 0 and detail.get('price',0) > 0: item['price'] = detail['price']
+                    if detail.get('price',0) > 0: item['price'] = detail['price']
                     if not detail.get('in_stock', True): item['in_stock'] = False
-                time.sleep(1)
+            elif item['available'] is False: item['in_stock'] = False
 
             if item.get('price',0) < MIN_PRICE:
                 scrape_status['skipped'] += 1; continue
@@ -680,7 +1340,8 @@ def run_scrape():
                     scrape_status['errors'].append(f'翻譯連續失敗 {ctf} 次，自動停止'); break
             else:
                 scrape_status['errors'].append(f"上傳失敗 {item['sku']}"); ctf = 0
-            time.sleep(1)
+
+        feed_state.save()
 
         # === v2.3: 清理下架商品（含安全檢查）===
         if not scrape_status['translation_stopped']:
@@ -701,7 +1362,6 @@ def run_scrape():
                                 print(f"[已刪除] SKU: {sku}, Product ID: {pid}")
                             else:
                                 scrape_status['errors'].append(f"刪除失敗: {sku}")
-                        time.sleep(0.3)
             else:
                 msg = f"⚠️ 官網只爬到 {len(website_skus)} 筆（安全閾值 {MIN_SCRAPED_PRODUCTS_FOR_DELETE}），跳過刪除"
                 scrape_status['errors'].append(msg)
@@ -759,7 +1419,7 @@ def run_update_shipping():
         pids = []
         url = shopify_api_url("products.json?limit=250&vendor=虎屋&fields=id,body_html")
         while url:
-            r = requests.get(url, headers=get_shopify_headers())
+            r = client.get(url, headers=get_shopify_headers())
             if r.status_code != 200:
                 update_shipping_status["errors"].append(f"取得商品列表失敗: {r.status_code}")
                 break
@@ -775,7 +1435,7 @@ def run_update_shipping():
                 if "國際運費" in body:
                     update_shipping_status["skipped"] += 1
                     continue
-                ru = requests.put(
+                ru = client.put(
                     shopify_api_url(f"products/{pid}.json"),
                     headers=get_shopify_headers(),
                     json={"product": {"id": pid, "body_html": body + SHIPPING_HTML}}
@@ -899,7 +1559,7 @@ def api_scan_japanese():
     products = []
     url = shopify_api_url("products.json?limit=250&vendor=虎屋")
     while url:
-        r = requests.get(url, headers=get_shopify_headers())
+        r = client.get(url, headers=get_shopify_headers())
         if r.status_code != 200: break
         for p in r.json().get('products', []):
             sku = ''; price = ''
@@ -919,7 +1579,7 @@ def api_retranslate_product():
     if not load_shopify_token(): return jsonify({'error': '未設定 Token'}), 400
     data = request.get_json(); pid = data.get('product_id')
     if not pid: return jsonify({'error': '缺少 product_id'}), 400
-    resp = requests.get(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers())
+    resp = client.get(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers())
     if resp.status_code != 200: return jsonify({'error': f'無法取得: {resp.status_code}'}), 400
     product = resp.json().get('product', {})
     translated = translate_with_chatgpt(product.get('title', ''), product.get('body_html', ''))
@@ -974,7 +1634,10 @@ def api_test_translate():
 
 @app.route('/api/status')
 def get_status():
-    return jsonify(scrape_status)
+    return jsonify({**scrape_status, 'pacing': pacer_snapshot(), 'retries': retry_budget.snapshot(),
+                    'translation_cache': translation_cache.snapshot(),
+                    'translation_batch': translation_batcher.snapshot(),
+                    'openai': openai_budget.snapshot()})
 
 
 @app.route('/api/start', methods=['POST'])
@@ -992,11 +1655,19 @@ def start_scrape():
 @app.route('/api/test-shopify')
 def test_shopify():
     if not load_shopify_token(): return jsonify({'error': '未設定 Token'}), 400
-    r = requests.get(shopify_api_url('shop.json'), headers=get_shopify_headers())
+    r = client.get(shopify_api_url('shop.json'), headers=get_shopify_headers())
     if r.status_code == 200: return jsonify({'success': True, 'shop': r.json()['shop']})
     return jsonify({'success': False, 'error': r.text}), 400
 
 
+@app.route('/api/test-size')
+def test_size():
+    rows = [{'text': t, 'expected': [aw, fw], 'got': [r['actual_weight'], r['final_weight']]}
+            for t, aw, fw in SIZE_FIXTURES for r in [SIZE_RULE(t)]]
+    failed = [r for r in rows if r['expected'] != r['got']]
+    return jsonify({'success': not failed, 'total': len(rows), 'failed': failed})
+
+
 @app.route('/api/test-scrape')
 def test_scrape():
     products = scrape_shopify_products()
@@ -1006,7 +1677,7 @@ def test_scrape():
 
 if __name__ == '__main__':
     print("=" * 50)
-    print("虎屋羊羹爬蟲工具 v2.3")
+    print("虎屋羊羹爬蟲工具 v2.8")
     print("修復: 分頁 / 安全檢查 / SKU 比對 / 自動排程")
     print("=" * 50)
     port = int(os.environ.get('PORT', 8080))
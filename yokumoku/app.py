@@ -1,20 +1,42 @@
 """
-YOKUMOKU 商品爬蟲 + Shopify 上架工具 v2.2
+YOKUMOKU 商品爬蟲 + Shopify 上架工具 v3.2
 v2.1: 翻譯保護機制、日文商品掃描、翻譯驗證重試、環境變數、Docker/Zeabur 部署
 v2.2: 缺貨商品自動刪除 - 官網消失或缺貨皆直接刪除
+v2.3: 常駐 Chromium 池 - worker 啟動即開瀏覽器，每個商品只開 context / page，定期回收重啟
+v2.4: 攔截圖片 / 影音 / 字型 / 追蹤請求；改等具體節點出現，不再 networkidle + 固定 sleep
+v2.5: 庫存檢查先走 HTTP 快速路徑（JSON-LD / 伺服器輸出的按鈕），判斷不了才開瀏覽器
+v2.6: 商品列表改攔截無限捲動的搜尋 API 回應，用 JSON 建清單（含冷凍判定），收滿就停；攔不到才退回讀 DOM
+v2.7: 列表卡片 / 商品詳情各用一次 page.evaluate 取回完整 JSON，不再逐個 selector 來回；不再點 slick-next
+v2.8: async Playwright 並行詳情頁 - 同一個 Chromium 同時開 ASYNC_PAGES 頁，每頁各自逾時，結果交回 run_scrape
+v2.9: 瀏覽器 storage_state 與站方 JS / CSS 磁碟快取，跨 context、跨執行共用；有容量上限、定期整包重置
+v3.0: 翻譯快取 - 依 prompt 指紋 + 標題 + 清理後說明的 hash 存檔（translation_cache.json），LRU 上限，/api/status 回報命中率
+v3.1: 批次翻譯：預抓到的新商品每 TRANSLATE_BATCH_SIZE 個打包成一次 gpt-4o-mini 請求（JSON 以 SKU 為 key），逐筆驗證、沒過的退回單筆；修正 prompt JSON 範例大括號造成的 f-string 錯誤
+v3.2: 翻譯 worker pool：TRANSLATE_WORKERS 條執行緒並行翻譯，OpenAI 請求改走獨立 keep-alive 連線池，受 OPENAI_RPM / OPENAI_TPM 預算控管，429 依 Retry-After 全部暫停後重送
 """
 
 from flask import Flask, jsonify, request
 import requests
+from requests.adapters import HTTPAdapter
 import re
+import unicodedata
 import json
 import os
 import time
-from urllib.parse import urljoin
+import random
+from urllib.parse import urljoin, urlparse, parse_qs
+from html.parser import HTMLParser
 import math
 from playwright.sync_api import sync_playwright
+from playwright.async_api import async_playwright
+import asyncio
 import threading
+from collections import OrderedDict
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor, Future
 import base64
+import atexit
+import hashlib
+import shutil
 
 app = Flask(__name__)
 
@@ -28,6 +50,173 @@ MAX_CONSECUTIVE_TRANSLATION_FAILURES = 3
 SHIPPING_HTML = '<div style="margin-top:24px;border-top:1px solid #e8eaf0;padding-top:20px;"><h2 style="font-size:16px;font-weight:700;color:#1a1a2e;border-bottom:2px solid #e8eaf0;padding-bottom:8px;margin:0 0 16px;">國際運費（空運・包稅）</h2><p style="margin:0 0 6px;font-size:13px;color:#444;">✓ 含關稅\u3000✓ 含台灣配送費\u3000✓ 只收實重\u3000✓ 無材積費</p><p style="margin:0 0 12px;font-size:13px;color:#444;">起運 1 kg，未滿 1 kg 以 1 kg 計算，每增加 0.5 kg 加收 ¥500。</p><table style="width:100%;border-collapse:collapse;font-size:13px;margin-bottom:10px;"><tbody><tr style="background:#f0f4ff;"><td style="padding:9px 14px;border:1px solid #dde3f0;">≦ 1.0 kg</td><td style="padding:9px 14px;border:1px solid #dde3f0;font-weight:600;">¥1,000 <span style="color:#888;font-weight:400;">≈ NT$200</span></td></tr><tr style="background:#fff;"><td style="padding:9px 14px;border:1px solid #dde3f0;">1.1 ～ 1.5 kg</td><td style="padding:9px 14px;border:1px solid #dde3f0;font-weight:600;">¥1,500 <span style="color:#888;font-weight:400;">≈ NT$300</span></td></tr><tr style="background:#f0f4ff;"><td style="padding:9px 14px;border:1px solid #dde3f0;">1.6 ～ 2.0 kg</td><td style="padding:9px 14px;border:1px solid #dde3f0;font-weight:600;">¥2,000 <span style="color:#888;font-weight:400;">≈ NT$400</span></td></tr><tr style="background:#fff;"><td style="padding:9px 14px;border:1px solid #dde3f0;">2.1 ～ 2.5 kg</td><td style="padding:9px 14px;border:1px solid #dde3f0;font-weight:600;">¥2,500 <span style="color:#888;font-weight:400;">≈ NT$500</span></td></tr><tr style="background:#f0f4ff;"><td style="padding:9px 14px;border:1px solid #dde3f0;">2.6 ～ 3.0 kg</td><td style="padding:9px 14px;border:1px solid #dde3f0;font-weight:600;">¥3,000 <span style="color:#888;font-weight:400;">≈ NT$600</span></td></tr><tr style="background:#fff;"><td style="padding:9px 14px;border:1px solid #dde3f0;color:#555;">每增加 0.5 kg</td><td style="padding:9px 14px;border:1px solid #dde3f0;color:#555;">+¥500\u3000<span style="color:#888;">+≈ NT$100</span></td></tr></tbody></table><p style="margin:0 0 28px;font-size:12px;color:#999;">NT$ 匯率僅供參考，實際以下單當日匯率為準。運費於商品到倉後出貨前確認重量後統一請款。</p></div>'
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
 
+# ========== 每個 origin 的自適應節流（AIMD） ==========
+
+class OriginPacer:
+    """依回應延遲、429/503 與錯誤率調整請求間隔與併發：
+    順利時間隔線性遞減、併發逐步 +1；被限流 / 出錯時間隔加倍、併發減半"""
+    MIN_DELAY, MAX_DELAY, MAX_LIMIT = 0.05, 30.0, 8
+
+    def __init__(self, host, delay=0.5, limit=2):
+        self.host = host; self.delay = delay; self.limit = limit
+        self.active = 0; self.next_at = 0.0; self.streak = 0
+        self.latency = 0.0; self.ok = 0; self.throttled = 0; self.errors = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.active >= self.limit: self.cond.wait()
+            self.active += 1
+            now = time.time(); start = max(now, self.next_at)
+            self.next_at = start + self.delay
+        if start > now: time.sleep(start - now)
+
+    def release(self, status, elapsed, retry_after=None):
+        with self.cond:
+            self.active -= 1
+            slow = self.latency > 0 and elapsed > self.latency * 3
+            self.latency = elapsed if not self.latency else self.latency * 0.8 + elapsed * 0.2
+            if status is None or status in (429, 503) or status >= 500:
+                if status in (429, 503): self.throttled += 1
+                else: self.errors += 1
+                self.delay = min(self.MAX_DELAY, max(self.delay * 2, retry_after or 0, 0.5))
+                self.limit = max(1, self.limit // 2); self.streak = 0
+                self.next_at = max(self.next_at, time.time() + self.delay)
+            elif slow:
+                self.ok += 1; self.streak = 0
+                self.delay = min(self.MAX_DELAY, self.delay * 1.5)
+            else:
+                self.ok += 1; self.streak += 1
+                self.delay = max(self.MIN_DELAY, self.delay - 0.05)
+                if self.streak >= self.limit * 4 and self.limit < self.MAX_LIMIT:
+                    self.limit += 1; self.streak = 0
+            self.cond.notify_all()
+
+    def snapshot(self):
+        return {'delay': round(self.delay, 2), 'rate_per_sec': round(1 / self.delay, 2),
+                'concurrency': self.limit, 'active': self.active, 'latency': round(self.latency, 2),
+                'ok': self.ok, 'throttled': self.throttled, 'errors': self.errors}
+
+
+origin_pacers = {}
+origin_pacers_lock = threading.Lock()
+
+
+def pacer_for(url):
+    host = urlparse(url).netloc
+    with origin_pacers_lock:
+        if host not in origin_pacers: origin_pacers[host] = OriginPacer(host)
+        return origin_pacers[host]
+
+
+def pacer_snapshot():
+    return {h: p.snapshot() for h, p in list(origin_pacers.items())}
+
+
+# ========== 重試（指數退避 + jitter、每輪預算）與 hedged request ==========
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'}
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "true").lower() == "true"
+
+
+class RetryBudget:
+    """每輪爬取可用的重試 / hedge 次數上限，避免官網故障時重試把流量放大"""
+    def __init__(self, limit=200):
+        self.limit = limit; self.used = 0; self.hedged = 0; self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock: self.used = 0; self.hedged = 0
+
+    def take(self):
+        with self.lock:
+            if self.used >= self.limit: return False
+            self.used += 1; return True
+
+    def snapshot(self):
+        return {'used': self.used, 'limit': self.limit, 'hedged': self.hedged}
+
+
+retry_budget = RetryBudget()
+hedge_pool = ThreadPoolExecutor(max_workers=4)
+
+
+def retry_after_of(r):
+    ra = r.headers.get('Retry-After', '')
+    return float(ra) if ra.isdigit() else None
+
+
+def backoff_delay(attempt, retry_after=None, base=0.5, cap=20.0):
+    """指數退避 + full jitter；有 Retry-After 時不低於它"""
+    return max(random.uniform(0, min(cap, base * (2 ** attempt))), retry_after or 0)
+
+
+class PacedSession(requests.Session):
+    """所有請求先經過該 origin 的 OriginPacer，回應再回饋給它；
+    冪等請求遇到連線錯誤 / 429 / 5xx 時退避重試（POST 一律不重試）"""
+    def send_paced(self, method, url, *args, on_send=None, **kwargs):
+        pacer = pacer_for(url); pacer.acquire()
+        if on_send: on_send()
+        t = time.time(); status = None; retry_after = None
+        try:
+            r = super().request(method, url, *args, **kwargs)
+            status = r.status_code; retry_after = retry_after_of(r)
+            return r
+        finally:
+            pacer.release(status, time.time() - t, retry_after)
+
+    def request(self, method, url, *args, retries=3, **kwargs):
+        retryable = method.upper() in IDEMPOTENT_METHODS; attempt = 0
+        while True:
+            try:
+                r = self.send_paced(method, url, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if not (retryable and attempt < retries and retry_budget.take()): raise
+                wait = backoff_delay(attempt); reason = type(e).__name__
+            else:
+                if r.status_code not in RETRY_STATUSES: return r
+                if not (retryable and attempt < retries and retry_budget.take()): return r
+                wait = backoff_delay(attempt, retry_after_of(r)); reason = r.status_code
+            print(f"[重試] {method} {url} ({reason}) 第 {attempt + 1} 次，{wait:.1f}s 後重送")
+            time.sleep(wait); attempt += 1
+
+    def get_hedged(self, url, hedge_after=None, **kwargs):
+        """慢速詳情頁：主請求在呼叫端執行緒直接送出，真正送出（通過 pacer）後超過 hedge_after 秒
+        （預設為該 origin 平均延遲 2 倍）仍未回應，才把備援請求丟進 hedge_pool；主請求失敗時改用備援的結果。
+        主請求不進 pool，pool 滿載時排隊的時間不會被算成慢回應而多送一份"""
+        if not HEDGE_ENABLED or hedge_pool is None: return self.get(url, **kwargs)
+        pacer = pacer_for(url)
+        hedge_after = hedge_after or max(2.0, pacer.latency * 2)
+        lock = threading.Lock(); state = {'done': False, 'timer': None, 'hedge': None}
+
+        def fire():
+            with lock:
+                if state['done'] or not retry_budget.take(): return
+                with retry_budget.lock: retry_budget.hedged += 1
+                state['hedge'] = hedge_pool.submit(self.get, url, **kwargs)
+
+        def on_send():  # 主請求重試時會再經過 pacer，計時只從第一次送出開始
+            with lock:
+                if state['timer'] or state['done']: return
+                state['timer'] = threading.Timer(hedge_after, fire); state['timer'].daemon = True
+                state['timer'].start()
+
+        error = None
+        try: r = self.get(url, on_send=on_send, **kwargs)
+        except Exception as e: r = None; error = e
+        with lock:
+            state['done'] = True
+            if state['timer']: state['timer'].cancel()
+        hedge = state['hedge']
+        if hedge and (error or r.status_code in RETRY_STATUSES):
+            try: return hedge.result()
+            except Exception: pass
+        if error: raise error
+        return r
+
+
+client = PacedSession()  # Shopify / OpenAI / 圖片請求（官網頁面由 Playwright 抓取）
+
 scrape_status = {
     "running": False, "progress": 0, "total": 0, "current_product": "",
     "products": [], "errors": [], "uploaded": 0, "skipped": 0,
@@ -117,40 +306,225 @@ def clean_html_for_translation(html_text):
     return text.strip()
 
 
-def translate_with_chatgpt(title, description, retry=False):
-    clean_description = clean_html_for_translation(description)
-    prompt = f"""你是專業的日本商品翻譯和 SEO 專家。將以下日本商品資訊翻譯成繁體中文並優化 SEO。
+# ========== OpenAI 連線池與 RPM / TPM 預算 ==========
+OPENAI_URL = "https://api.openai.com/v1/chat/completions"
+OPENAI_RPM = int(os.environ.get("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.environ.get("OPENAI_TPM", "200000"))
+OPENAI_RETRIES = int(os.environ.get("OPENAI_RETRIES", "4"))
+TRANSLATE_WORKERS = int(os.environ.get("TRANSLATE_WORKERS", "4"))
+
+
+class OpenAIBudget:
+    """每分鐘請求數 / token 數兩個 token bucket：送出前先扣預估 token（prompt 字數 + max_tokens），
+    回應後依 usage 多退少補；遇到 429 整個預算暫停，所有 worker 一起等"""
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm; self.tpm = tpm
+        self.requests = float(rpm); self.tokens = float(tpm); self.updated = time.time()
+        self.paused_until = 0.0; self.cond = threading.Condition()
+        self.sent = 0; self.throttled = 0; self.waited = 0.0; self.used_tokens = 0
+
+    def _refill(self):
+        now = time.time(); dt = now - self.updated; self.updated = now
+        self.requests = min(self.rpm, self.requests + dt * self.rpm / 60)
+        self.tokens = min(self.tpm, self.tokens + dt * self.tpm / 60)
+
+    def acquire(self, tokens):
+        tokens = min(tokens, self.tpm); t0 = time.time()
+        with self.cond:
+            while True:
+                self._refill(); now = time.time()
+                if now >= self.paused_until and self.requests >= 1 and self.tokens >= tokens:
+                    self.requests -= 1; self.tokens -= tokens; self.sent += 1; self.waited += now - t0
+                    return
+                self.cond.wait(max(0.05, self.paused_until - now, (1 - self.requests) * 60 / self.rpm,
+                                   (tokens - self.tokens) * 60 / self.tpm))
+
+    def settle(self, estimated, actual):
+        with self.cond:
+            self.tokens += estimated - actual; self.used_tokens += actual
+            self.cond.notify_all()
+
+    def pause(self, seconds):
+        with self.cond:
+            self.throttled += 1; self.paused_until = max(self.paused_until, time.time() + seconds)
+
+    def snapshot(self):
+        with self.cond:
+            self._refill()
+            return {'rpm': self.rpm, 'tpm': self.tpm, 'requests_left': int(self.requests), 'tokens_left': int(self.tokens),
+                    'sent': self.sent, 'throttled': self.throttled, 'waited_sec': round(self.waited, 1),
+                    'used_tokens': self.used_tokens, 'paused': max(0, round(self.paused_until - time.time(), 1))}
+
+
+openai_budget = OpenAIBudget(OPENAI_RPM, OPENAI_TPM)
+openai_session = requests.Session()  # 不走 OriginPacer，改由 openai_budget 控速；keep-alive 連線數對齊 worker 數
+openai_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=TRANSLATE_WORKERS + 2))
+
+
+def openai_chat(payload, timeout=60):
+    """送 chat/completions：先向 openai_budget 取得額度再從連線池送出；
+    429 依 Retry-After（沒有就指數退避）暫停整個預算後重送，5xx / 連線錯誤退避重送，回傳最後一個 response"""
+    est = sum(len(m['content']) for m in payload['messages']) + payload.get('max_tokens', 1000)
+    headers = {"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"}
+    for attempt in range(OPENAI_RETRIES + 1):
+        openai_budget.acquire(est)
+        try:
+            r = openai_session.post(OPENAI_URL, headers=headers, json=payload, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            openai_budget.settle(est, 0)
+            if attempt >= OPENAI_RETRIES: raise
+            wait = backoff_delay(attempt, base=1.0, cap=60.0); reason = type(e).__name__
+        else:
+            if r.status_code == 200:
+                try: used = r.json().get('usage', {}).get('total_tokens', est)
+                except ValueError: used = est
+                openai_budget.settle(est, used); return r
+            openai_budget.settle(est, 0)
+            if r.status_code not in RETRY_STATUSES or attempt >= OPENAI_RETRIES: return r
+            wait = backoff_delay(attempt, retry_after_of(r), base=1.0, cap=60.0); reason = r.status_code
+            if r.status_code == 429:
+                openai_budget.pause(wait)
+                print(f"[OpenAI] 429，全部翻譯暫停 {wait:.1f}s（第 {attempt + 1} 次）"); continue
+        print(f"[OpenAI] {reason}，第 {attempt + 1} 次，{wait:.1f}s 後重送")
+        time.sleep(wait)
+
+
+# ========== 翻譯快取（來源內容 hash） ==========
+TRANSLATION_CACHE_FILE = os.environ.get("TRANSLATION_CACHE_FILE", "translation_cache.json")
+TRANSLATION_CACHE_MAX = int(os.environ.get("TRANSLATION_CACHE_MAX", "3000"))
+TRANSLATION_PROMPT_VERSION = os.environ.get("TRANSLATION_PROMPT_VERSION", "1")  # 改這個值可讓舊快取全部失效
+
+
+class TranslationCache:
+    """翻譯結果以 sha256(prompt 指紋 + 標題 + 清理後說明 + 其他參數) 為 key 存成 JSON 檔，重啟後沿用；
+    LRU：超過 max_entries 淘汰最久沒用到的。只存成功且標題已無日文的結果"""
+    def __init__(self, path, max_entries=3000):
+        self.path = path; self.max_entries = max_entries; self.lock = threading.Lock()
+        self.hits = 0; self.misses = 0; self.evicted = 0; self.dirty = 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f: self.entries = OrderedDict(json.load(f))
+        except (OSError, ValueError):
+            self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1; return None
+            self.entries.move_to_end(key); self.hits += 1
+            return dict(self.entries[key])
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value; self.entries.move_to_end(key); self.dirty += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False); self.evicted += 1
+            if self.dirty >= 5: self._save()
+
+    def has(self, key):
+        with self.lock: return key in self.entries
+
+    def save(self):
+        with self.lock:
+            if self.dirty: self._save()
+
+    def _save(self):
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f: json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(tmp, self.path); self.dirty = 0
+        except OSError as e:
+            print(f"[翻譯快取] 儲存失敗: {e}")
 
-商品名稱：{title}
-商品說明：{clean_description[:1500]}
+    def snapshot(self):
+        total = self.hits + self.misses
+        return {'entries': len(self.entries), 'max': self.max_entries, 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0, 'evicted': self.evicted}
+
+
+translation_cache = TranslationCache(TRANSLATION_CACHE_FILE, TRANSLATION_CACHE_MAX)
+atexit.register(translation_cache.save)
+
+
+def translation_source(description):
+    """快取 key 用的說明文字：去掉 script / style / 標籤與多餘空白"""
+    text = re.sub(r'<(script|style)[^>]*>.*?</\1>', ' ', description or '', flags=re.S | re.I)
+    return re.sub(r'\s+', ' ', re.sub(r'<[^>]+>', ' ', text)).strip()
+
+
+def cached_translation(fn):
+    """translate_with_chatgpt 的快取層；prompt 指紋取自 TRANSLATION_* 常數與翻譯函式內的字串常數，
+    規則 / 詞彙表一改，舊快取自動失效"""
+    consts = [c for f in (fn, translation_input, translation_result) for c in f.__code__.co_consts if isinstance(c, str)]
+    fingerprint = hashlib.sha256(json.dumps([TRANSLATION_PROMPT_VERSION, TRANSLATION_SYSTEM, TRANSLATION_FORMAT,
+                                             TRANSLATION_RULES, consts], ensure_ascii=False)
+                                 .encode('utf-8')).hexdigest()[:16]
+
+    @wraps(fn)
+    def wrapper(title, description, *args, **kwargs):
+        key = translation_key(title, description, *args, **kwargs)
+        hit = translation_cache.get(key)
+        if hit: return hit
+        result = fn(title, description, *args, **kwargs)
+        if result.get('success') and not is_japanese_text(result.get('title', '')): translation_cache.put(key, result)
+        return result
+    wrapper.fingerprint = fingerprint
+    return wrapper
+
+
+def translation_key(title, description, *args, **kwargs):
+    """快取 key：prompt 指紋 + 標題 + 清理後說明 + 其他參數（批次翻譯也用同一個 key）"""
+    return hashlib.sha256(json.dumps([translate_with_chatgpt.fingerprint, title, translation_source(description), args, kwargs],
+                                     ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
 
-只回傳此 JSON 格式，不加 markdown、不加任何其他文字：
-{"title":"翻譯後的商品名稱","description":"翻譯後的商品說明（HTML格式）","page_title":"SEO標題50字以內","meta_description":"SEO描述100字以內"}
 
-規則：
+# ========== 翻譯 prompt ==========
+TRANSLATION_SYSTEM = "你是專業的日本商品翻譯和 SEO 專家。你的輸出必須完全使用繁體中文和英文，絕對禁止出現任何日文字元。"
+TRANSLATION_FORMAT = '{"title":"翻譯後的商品名稱","description":"翻譯後的商品說明（HTML格式）","page_title":"SEO標題50字以內","meta_description":"SEO描述100字以內"}'
+TRANSLATION_RULES = """規則：
 1. 品牌背景：日本高級洋菓子品牌，以奶油雪茄蛋捲聞名
 2. 標題開頭必須是「YOKUMOKU」，後接繁體中文商品名，不得省略
 3. 【強制禁止日文】所有輸出必須是繁體中文或英文，不可出現任何平假名或片假名
 4. 詞彙對照：シガール→雪茄蛋捲（絕對不可譯為香菸）；サンクデリス→五款精選；ビエ→奶油薄餅；ショコラ→巧克力；詰合せ→綜合禮盒
 5. SEO 關鍵字必須自然融入，包含：YOKUMOKU、日本、雪茄蛋捲、洋菓子、伴手禮、送禮
 6. 只回傳 JSON，不得有任何其他文字"""
+
+
+def translation_input(description):
+    """送進 prompt 的商品說明"""
+    return clean_html_for_translation(description)[:1500]
+
+
+def translation_result(t, title, description):
+    """模型回傳的 JSON → 上架用的翻譯結果（單筆 / 批次共用）"""
+    tt = t.get('title', title)
+    if not tt.startswith('YOKUMOKU'): tt = f"YOKUMOKU {tt}"
+    return {'success': True, 'title': tt, 'description': t.get('description', description),
+            'page_title': t.get('page_title', ''), 'meta_description': t.get('meta_description', '')}
+
+
+@cached_translation
+def translate_with_chatgpt(title, description, retry=False):
+    prompt = f"""你是專業的日本商品翻譯和 SEO 專家。將以下日本商品資訊翻譯成繁體中文並優化 SEO。
+
+商品名稱：{title}
+商品說明：{translation_input(description)}
+
+只回傳此 JSON 格式，不加 markdown、不加任何其他文字：
+{TRANSLATION_FORMAT}
+
+{TRANSLATION_RULES}"""
     if retry:
         prompt += "\n\n【重要警告】前次翻譯輸出仍含有日文字元（平假名或片假名），請這次嚴格執行：\n1. 所有日文必須完整翻譯成繁體中文，不得保留任何假名\n2. 若不確定翻譯，請意譯其含義，絕對不可直接保留日文\n3. 商品名稱中的日文單字全部必須翻譯"
     try:
-        r = requests.post("https://api.openai.com/v1/chat/completions",
-            headers={"Authorization": f"Bearer {OPENAI_API_KEY}", "Content-Type": "application/json"},
-            json={"model": "gpt-4o-mini", "messages": [
-                {"role": "system", "content": "你是專業的日本商品翻譯和 SEO 專家。你的輸出必須完全使用繁體中文和英文，絕對禁止出現任何日文字元。"},
+        r = openai_chat({"model": "gpt-4o-mini", "messages": [
+                {"role": "system", "content": TRANSLATION_SYSTEM},
                 {"role": "user", "content": prompt}], "temperature": 0, "max_tokens": 1000}, timeout=60)
         if r.status_code == 200:
             c = r.json()['choices'][0]['message']['content'].strip()
             if c.startswith('```'): c = c.split('\n', 1)[1]
             if c.endswith('```'): c = c.rsplit('```', 1)[0]
             t = json.loads(c.strip())
-            tt = t.get('title', title)
-            if not tt.startswith('YOKUMOKU'): tt = f"YOKUMOKU {tt}"
-            return {'success': True, 'title': tt, 'description': t.get('description', description),
-                    'page_title': t.get('page_title', ''), 'meta_description': t.get('meta_description', '')}
+            return translation_result(t, title, description)
         else:
             return {'success': False, 'error': f"HTTP {r.status_code}: {r.text[:200]}",
                     'title': f"YOKUMOKU {title}", 'description': description, 'page_title': '', 'meta_description': ''}
@@ -159,19 +533,119 @@ def translate_with_chatgpt(title, description, retry=False):
                 'title': f"YOKUMOKU {title}", 'description': description, 'page_title': '', 'meta_description': ''}
 
 
+# ========== 批次翻譯 ==========
+TRANSLATE_BATCH_SIZE = int(os.environ.get("TRANSLATE_BATCH_SIZE", "5"))  # 1 = 不打包，一筆一個請求（仍並行）
+
+
+def translate_batch(items):
+    """items: [(sku, title, description)] → 一次請求翻譯多個商品，回傳 {sku: 翻譯結果}；
+    每筆各自驗證（標題 / 說明齊全、標題無日文），沒過的不放進結果，由呼叫端退回單筆翻譯"""
+    blocks = "\n\n".join(f"SKU：{sku}\n商品名稱：{title}\n商品說明：{translation_input(description)}"
+                         for sku, title, description in items)
+    prompt = f"""你是專業的日本商品翻譯和 SEO 專家。將以下 {len(items)} 個日本商品資訊各自翻譯成繁體中文並優化 SEO。
+
+{blocks}
+
+只回傳一個 JSON 物件，key 為各商品的 SKU，value 為該商品的翻譯結果，不加 markdown、不加任何其他文字：
+{{"SKU":{TRANSLATION_FORMAT}}}
+
+{TRANSLATION_RULES}
+7. 每個 SKU 各自翻譯，不可合併或混用其他商品的內容"""
+    r = openai_chat({"model": "gpt-4o-mini", "messages": [
+            {"role": "system", "content": TRANSLATION_SYSTEM},
+            {"role": "user", "content": prompt}], "temperature": 0, "max_tokens": min(16000, 1000 * len(items)),
+            "response_format": {"type": "json_object"}}, timeout=60 + 20 * len(items))
+    if r.status_code != 200:
+        print(f"[批次翻譯] HTTP {r.status_code}: {r.text[:200]}"); return {}
+    c = r.json()['choices'][0]['message']['content'].strip()
+    if c.startswith('```'): c = c.split('\n', 1)[1]
+    if c.endswith('```'): c = c.rsplit('```', 1)[0]
+    data = json.loads(c.strip())
+    out = {}
+    for sku, title, description in items:
+        t = data.get(sku) if isinstance(data, dict) else None
+        if not isinstance(t, dict) or not t.get('title') or not t.get('description'): continue
+        res = translation_result(t, title, description)
+        if not is_japanese_text(res['title']): out[sku] = res
+    return out
+
+
+class TranslationBatcher:
+    """待上架商品先 submit 排隊，湊滿 size 個就打包成一次請求，交給 workers 條執行緒並行翻譯（size=1 時一筆一個請求）；
+    upload_to_shopify 以 result() 取自己那筆，還在排隊的會先提早送出。批次結果寫進翻譯快取，沒過驗證的商品個別退回單筆翻譯"""
+    def __init__(self, size, workers=1):
+        self.size = max(1, size); self.workers = workers; self.lock = threading.Lock()
+        self.queue = []; self.futures = {}
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='translate')
+        self.batches = 0; self.batched = 0; self.fallbacks = 0
+
+    def submit(self, sku, title, description):
+        if not title: return
+        key = translation_key(title, description)
+        with self.lock:
+            if key in self.futures or translation_cache.has(key): return
+            fu = self.futures[key] = Future()
+            self.queue.append((key, str(sku or len(self.queue)), title, description, fu))
+            if len(self.queue) >= self.size: self._flush()
+
+    def _flush(self):  # 呼叫端持有 lock
+        if self.queue: self.pool.submit(self._run, self.queue); self.queue = []
+
+    def _run(self, chunk):
+        ids = {}
+        for i, entry in enumerate(chunk):
+            ids[entry[1] if entry[1] not in ids else f"{entry[1]}-{i}"] = entry
+        done = {}; single = None
+        if scrape_status.get('translation_stopped'): pass  # 已因翻譯連續失敗停止 → 不再打 API
+        elif len(ids) == 1:
+            sid, (_, _, title, description, _) = next(iter(ids.items()))
+            # 單筆自己會寫快取；沒過驗證也原樣交回，由 upload_to_shopify 判斷，不在 result() 再打一次
+            single = translate_with_chatgpt(title, description)
+            if single.get('success') and not is_japanese_text(single['title']): done[sid] = single
+        else:
+            try: done = translate_batch([(sid, e[2], e[3]) for sid, e in ids.items()])
+            except Exception as e: print(f"[批次翻譯] {e}")
+        with self.lock:
+            self.batches += 1; self.batched += len(done); self.fallbacks += len(ids) - len(done) if single is None else 0
+        for sid, (key, _, _, _, fu) in ids.items():
+            if sid in done: translation_cache.put(key, done[sid])
+            fu.set_result(done.get(sid) or single)
+
+    def result(self, title, description):
+        """有排隊 / 進行中的批次就等它；沒有，或這筆在多筆批次裡沒過驗證，照常單筆翻譯（單筆請求的結果不論成敗直接回傳）"""
+        key = translation_key(title, description)
+        with self.lock:
+            fu = self.futures.pop(key, None)
+            if fu and any(e[0] == key for e in self.queue): self._flush()
+        return (fu.result() if fu else None) or translate_with_chatgpt(title, description)
+
+    def snapshot(self):
+        with self.lock:
+            return {'size': self.size, 'workers': self.workers, 'batches': self.batches, 'batched': self.batched,
+                    'fallbacks': self.fallbacks, 'queued': len(self.queue), 'pending': len(self.futures)}
+
+
+translation_batcher = TranslationBatcher(TRANSLATE_BATCH_SIZE, TRANSLATE_WORKERS)
+
+
+def queue_translation(product, min_price=0):
+    """詳情已到手、之後應該會上架的商品（有庫存、價格達標）先排進批次翻譯；回傳 product，方便接在 fetch 後面"""
+    if product and product.get('title') and product.get('in_stock', True) and product.get('price', 0) >= min_price:
+        translation_batcher.submit(product.get('sku'), product['title'], product.get('description', ''))
+    return product
+
+
 def download_image_to_base64(img_url, max_retries=3):
     headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
                'Accept': 'image/webp,image/apng,image/*,*/*;q=0.8', 'Referer': 'https://www.yokumoku.jp/'}
-    for attempt in range(max_retries):
-        try:
-            r = requests.get(img_url, headers=headers, timeout=30)
-            if r.status_code == 200:
-                ct = r.headers.get('Content-Type', 'image/jpeg')
-                fmt = 'image/png' if 'png' in ct else 'image/gif' if 'gif' in ct else 'image/webp' if 'webp' in ct else 'image/jpeg'
-                return {'success': True, 'base64': base64.b64encode(r.content).decode('utf-8'), 'content_type': fmt}
-        except Exception as e:
-            print(f"[圖片下載] 第 {attempt+1} 次異常: {e}")
-        time.sleep(1)
+    try:
+        r = client.get(img_url, headers=headers, timeout=30, retries=max_retries)
+        if r.status_code == 200:
+            ct = r.headers.get('Content-Type', 'image/jpeg')
+            fmt = 'image/png' if 'png' in ct else 'image/gif' if 'gif' in ct else 'image/webp' if 'webp' in ct else 'image/jpeg'
+            return {'success': True, 'base64': base64.b64encode(r.content).decode('utf-8'), 'content_type': fmt}
+    except Exception as e:
+        print(f"[圖片下載] 下載異常: {e}")
     return {'success': False}
 
 
@@ -181,7 +655,7 @@ def get_existing_products_map():
     pm = {}
     url = shopify_api_url("products.json?limit=250")
     while url:
-        r = requests.get(url, headers=get_shopify_headers())
+        r = client.get(url, headers=get_shopify_headers())
         if r.status_code != 200: break
         for p in r.json().get('products', []):
             pid = p.get('id')
@@ -202,7 +676,7 @@ def get_collection_products_map(collection_id):
     if not collection_id: return pm
     url = shopify_api_url(f"collections/{collection_id}/products.json?limit=250")
     while url:
-        r = requests.get(url, headers=get_shopify_headers())
+        r = client.get(url, headers=get_shopify_headers())
         if r.status_code != 200: break
         for p in r.json().get('products', []):
             pid = p.get('id')
@@ -216,261 +690,864 @@ def get_collection_products_map(collection_id):
 
 
 def delete_product(pid):
-    return requests.delete(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers()).status_code == 200
+    return client.delete(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers()).status_code == 200
 
 
 def update_product(pid, data):
-    r = requests.put(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers(),
+    r = client.put(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers(),
         json={"product": {"id": pid, **data}})
     return r.status_code == 200, r
 
 
 def get_or_create_collection(ct="YOKUMOKU"):
-    r = requests.get(shopify_api_url(f'custom_collections.json?title={ct}'), headers=get_shopify_headers())
+    r = client.get(shopify_api_url(f'custom_collections.json?title={ct}'), headers=get_shopify_headers())
     if r.status_code == 200:
         for c in r.json().get('custom_collections', []):
             if c['title'] == ct: return c['id']
-    r = requests.post(shopify_api_url('custom_collections.json'), headers=get_shopify_headers(),
+    r = client.post(shopify_api_url('custom_collections.json'), headers=get_shopify_headers(),
         json={'custom_collection': {'title': ct, 'published': True}})
     if r.status_code == 201: return r.json()['custom_collection']['id']
     return None
 
 
 def add_product_to_collection(pid, cid):
-    return requests.post(shopify_api_url('collects.json'), headers=get_shopify_headers(),
+    return client.post(shopify_api_url('collects.json'), headers=get_shopify_headers(),
         json={'collect': {'product_id': pid, 'collection_id': cid}}).status_code == 201
 
 
 def publish_to_all_channels(pid):
     gu = f"https://{SHOPIFY_SHOP}.myshopify.com/admin/api/2024-01/graphql.json"
     hd = {'X-Shopify-Access-Token': SHOPIFY_ACCESS_TOKEN, 'Content-Type': 'application/json'}
-    r = requests.post(gu, headers=hd, json={'query': '{ publications(first:20){ edges{ node{ id name }}}}'})
+    r = client.post(gu, headers=hd, json={'query': '{ publications(first:20){ edges{ node{ id name }}}}'})
     if r.status_code != 200: return False
     pubs = r.json().get('data', {}).get('publications', {}).get('edges', [])
     seen = set(); uq = []
     for p in pubs:
         if p['node']['name'] not in seen: seen.add(p['node']['name']); uq.append(p['node'])
     mut = """mutation publishablePublish($id:ID!,$input:[PublicationInput!]!){publishablePublish(id:$id,input:$input){userErrors{field message}}}"""
-    requests.post(gu, headers=hd, json={'query': mut, 'variables': {"id": f"gid://shopify/Product/{pid}", "input": [{"publicationId": p['id']} for p in uq]}})
+    client.post(gu, headers=hd, json={'query': mut, 'variables': {"id": f"gid://shopify/Product/{pid}", "input": [{"publicationId": p['id']} for p in uq]}})
     return True
 
 
+# ========== 尺寸 / 重量抽取引擎 ==========
+SIZE_TRANS = str.maketrans({'×': 'x', '✕': 'x', 'Φ': '', 'φ': '', ',': ''})
+SIZE_NUM = r'(\d+(?:\.\d+)?)'
+SIZE_LABEL = r'(?:[WDHL]|縦|横|高さ|タテ|ヨコ|奥行き?|幅)?'
+
+
+class SizeWeightRule:
+    """尺寸 + 重量單次抽取：NFKC 正規化（全形數字 / ｍｍ / ㎏ 等）後，一條編譯好的 regex
+    finditer 一遍同時收尺寸與重量，單位統一成 cm / kg。
+    dim_unit：尺寸沒寫單位時當作的單位（None = 必須寫單位）；weight_units：接受的重量單位，順序即優先序；
+    weight_end：g 之後不可接的字元；cylinder：允許「直徑 x 高 mm」兩維"""
+    def __init__(self, dim_prefix='', weight_prefix='', dim_unit=None, weight_units=('kg', 'g'),
+                 weight_end=r'(?![a-z0-9])', cylinder=False, dims=True, ndigits=2):
+        dim = (rf'{dim_prefix}{SIZE_LABEL}\s*(?P<a>\d+(?:\.\d+)?)\s*(?P<ua>mm|cm)?\s*x\s*'
+               rf'{SIZE_LABEL}\s*(?P<b>\d+(?:\.\d+)?)\s*(?P<ub>mm|cm)?'
+               rf'(?:\s*x\s*{SIZE_LABEL}\s*(?P<c>\d+(?:\.\d+)?))?(?:\s*\(?\s*(?P<u>mm|cm)(?:\s*\))?)?')
+        wt = rf'{weight_prefix}(?P<w>\d+(?:\.\d+)?)\s*(?P<wu>kg|g{weight_end})'
+        parts = ([f'(?P<dim>{dim})'] if dims else []) + ([f'(?P<wt>{wt})'] if weight_units else [])
+        self.rx = re.compile('|'.join(parts), re.I)
+        self.dim_unit = dim_unit; self.weight_units = weight_units
+        self.cylinder = cylinder; self.dims = dims; self.ndigits = ndigits
+
+    def __call__(self, text):
+        box = cyl = None; weights = {}
+        for m in self.rx.finditer(unicodedata.normalize('NFKC', text or '').translate(SIZE_TRANS)):
+            if m.lastgroup == 'wt':
+                u = m['wu'].lower()
+                if u in self.weight_units and u not in weights:
+                    weights[u] = float(m['w']) / (1000 if u == 'g' else 1)
+            else:
+                units = [m['ua'] or m['u'] or self.dim_unit, m['ub'] or m['u'] or self.dim_unit, m['u'] or self.dim_unit]
+                nums = [n for n in (m['a'], m['b'], m['c']) if n is not None]
+                if not all(units[:len(nums)]): continue
+                vals = [float(n) / (10 if un.lower() == 'mm' else 1) for n, un in zip(nums, units)]
+                if len(vals) == 3 and box is None: box = vals
+                elif len(vals) == 2 and self.cylinder and cyl is None and (m['u'] or m['ub']): cyl = vals
+            if (box or not self.dims) and len(weights) == len(self.weight_units): break
+        weight = next((weights[u] for u in self.weight_units if u in weights), None)
+        dimension = None
+        if box:
+            l, w, h = box
+            dimension = {'l': l, 'w': w, 'h': h, 'volume_weight': round(l * w * h / 6000, self.ndigits)}
+        elif cyl:
+            d, h = cyl
+            dimension = {'diameter': d, 'height': h, 'volume_weight': round(math.pi * (d / 2) ** 2 * h / 6000, self.ndigits)}
+        vw = dimension['volume_weight'] if dimension else 0
+        return {'dimension': dimension, 'actual_weight': round(weight, 3) if weight else None,
+                'volume_weight': vw, 'final_weight': round(max(vw, weight or 0), self.ndigits)}
+
+
+SIZE_RULE = SizeWeightRule(dim_unit='mm', weight_end=r'(?!\w)', cylinder=True)
+SIZE_FIXTURES = [  # (文字, actual_weight, final_weight)：改 SIZE_RULE 後打 /api/test-size 對一遍
+    ('200×150×60mm 450g', 0.45, 0.45),
+    ('200×150×60mm\u3000450g', 0.45, 0.45),
+    ('200×150×60mm\n450g', 0.45, 0.45),
+    ('120mm×80mm×40mm 250g', 0.25, 0.25),
+    ('直径150×高さ60mm 380g', 0.38, 0.38),
+]
+
+
 def parse_size_weight(text):
-    text = text.replace('×', 'x').replace('Ｘ', 'x').replace('ｘ', 'x')
-    text = text.replace('ｍｍ', 'mm').replace('ｇ', 'g').replace('ｋｇ', 'kg')
-    text = text.replace('Φ', 'x').replace(',', '')
-    dimension = None; weight_kg = None
-    for pat in [r'(\d+(?:\.\d+)?)\s*[xX]\s*(\d+(?:\.\d+)?)\s*[xX]\s*(\d+(?:\.\d+)?)\s*mm',
-                r'(\d+)\s*[xX]\s*(\d+)\s*[xX]\s*(\d+)']:
-        dm = re.search(pat, text, re.IGNORECASE)
-        if dm:
-            l, w, h = float(dm.group(1)), float(dm.group(2)), float(dm.group(3))
-            dimension = {"l": l, "w": w, "h": h, "volume_weight": round((l*w*h)/6000000, 2)}
-            break
-    if not dimension:
-        cm = re.search(r'(\d+(?:\.\d+)?)\s*[xX]\s*(\d+(?:\.\d+)?)\s*mm', text, re.IGNORECASE)
-        if cm:
-            d, h = float(cm.group(1)), float(cm.group(2))
-            vol = math.pi * (d/2)**2 * h
-            dimension = {"diameter": d, "height": h, "volume_weight": round(vol/6000000, 2)}
-    wm = re.search(r'(\d+(?:\.\d+)?)\s*kg', text, re.IGNORECASE)
-    gm = re.search(r'(\d+(?:\.\d+)?)\s*g(?![\w])', text)
-    if wm: weight_kg = float(wm.group(1))
-    elif gm: weight_kg = float(gm.group(1)) / 1000
-    final = 0
-    if dimension and weight_kg: final = max(dimension.get('volume_weight', 0), weight_kg)
-    elif dimension: final = dimension.get('volume_weight', 0)
-    elif weight_kg: final = weight_kg
-    return {"dimension": dimension, "actual_weight": weight_kg, "final_weight": round(final, 2)}
+    return SIZE_RULE(text)
+
+
+# ========== v2.9: 瀏覽器 storage_state 與靜態資源磁碟快取 ==========
+BROWSER_STATE_DIR = os.environ.get("BROWSER_STATE_DIR", "browser_state")
+STORAGE_STATE_PATH = os.path.join(BROWSER_STATE_DIR, "storage_state.json")
+PERSIST_STORAGE_STATE = os.environ.get("PERSIST_STORAGE_STATE", "true").lower() == "true"
+ASSET_CACHE_ENABLED = os.environ.get("ASSET_CACHE", "true").lower() == "true"
+ASSET_CACHE_MB = int(os.environ.get("ASSET_CACHE_MB", "200"))
+BROWSER_STATE_RESET_HOURS = float(os.environ.get("BROWSER_STATE_RESET_HOURS", "24"))
+CACHED_TYPES = {'script', 'stylesheet'}
+DROP_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'set-cookie', 'connection'}
+
+
+class AssetCache:
+    """站方 JS / CSS 存在磁碟，所有 context（同步池、async 並行）與每次執行共用，route 攔到同網址直接 fulfill。
+    Playwright 只要開了 route 就會停用瀏覽器本身的 HTTP 快取，所以自己存。
+    超過 max_bytes 依最後使用時間淘汰到 8 成；建立滿 reset_hours 就連同 storage_state 整包清掉重來"""
+    def __init__(self, root, max_bytes, reset_hours):
+        self.state_root = root; self.root = os.path.join(root, 'assets')
+        self.max_bytes = max_bytes; self.reset_after = reset_hours * 3600
+        self.hits = 0; self.misses = 0; self.evicted = 0; self.resets = 0; self.size = None
+        self.lock = threading.Lock()
+
+    def _path(self, url):
+        return os.path.join(self.root, hashlib.sha1(url.encode('utf-8')).hexdigest())
+
+    def maybe_reset(self):
+        """瀏覽器（重新）啟動時呼叫：到期就清空整個 BROWSER_STATE_DIR"""
+        marker = os.path.join(self.state_root, '.created')
+        with self.lock:
+            try:
+                if os.path.exists(marker):
+                    if time.time() - os.path.getmtime(marker) < self.reset_after: return False
+                    self.resets += 1; print("[瀏覽器快取] 已到重置週期，清空 storage_state 與靜態快取")
+                shutil.rmtree(self.state_root, ignore_errors=True)
+                os.makedirs(self.root, exist_ok=True)
+                open(marker, 'w').close(); self.size = 0
+                return True
+            except OSError as e:
+                print(f"[瀏覽器快取] 重置失敗: {e}"); return False
+
+    def get(self, url):
+        path = self._path(url)
+        try:
+            with open(path + '.json') as f: headers = json.load(f)
+            with open(path, 'rb') as f: body = f.read()
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1; return None
+        self.hits += 1
+        return headers, body
+
+    def put(self, url, headers, body):
+        if 'no-store' in headers.get('cache-control', ''): return
+        path = self._path(url); tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, 'wb') as f: f.write(body)
+            os.replace(tmp, path)
+            with open(path + '.json', 'w') as f:
+                json.dump({k: v for k, v in headers.items() if k.lower() not in DROP_HEADERS}, f)
+        except OSError: return
+        with self.lock:
+            self.size = (self._scan() if self.size is None else self.size) + len(body)
+            if self.size > self.max_bytes: self._evict()
+
+    def _bodies(self):
+        try: names = os.listdir(self.root)
+        except OSError: return []
+        return [os.path.join(self.root, n) for n in names if '.' not in n]
+
+    def _scan(self):
+        return sum(os.path.getsize(f) for f in self._bodies() if os.path.exists(f))
+
+    def _evict(self):
+        for f in sorted(self._bodies(), key=lambda f: os.path.getmtime(f) if os.path.exists(f) else 0):
+            if self.size <= self.max_bytes * 0.8: break
+            try:
+                self.size -= os.path.getsize(f); os.remove(f); os.remove(f + '.json'); self.evicted += 1
+            except OSError: pass
+
+    def snapshot(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evicted': self.evicted, 'resets': self.resets,
+                'size_mb': round((self.size or 0) / 1048576, 1), 'max_mb': round(self.max_bytes / 1048576)}
+
+
+asset_cache = AssetCache(BROWSER_STATE_DIR, ASSET_CACHE_MB * 1048576, BROWSER_STATE_RESET_HOURS)
+
+
+def storage_state_opts():
+    """new_context 用：有存過的 cookie / localStorage（同意橫幅等）就帶上"""
+    if PERSIST_STORAGE_STATE and os.path.exists(STORAGE_STATE_PATH): return {'storage_state': STORAGE_STATE_PATH}
+    return {}
+
+
+def storage_state_due():
+    """最多每 10 分鐘存一次"""
+    if not PERSIST_STORAGE_STATE: return False
+    try: return time.time() - os.path.getmtime(STORAGE_STATE_PATH) > 600
+    except OSError: return True
+
+
+def save_storage_state(state):
+    tmp = f"{STORAGE_STATE_PATH}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(BROWSER_STATE_DIR, exist_ok=True)
+        with open(tmp, 'w') as f: json.dump(state, f)
+        os.replace(tmp, STORAGE_STATE_PATH)
+    except OSError as e:
+        print(f"[瀏覽器快取] storage_state 儲存失敗: {e}")
+
+
+def drop_storage_state():
+    try: os.remove(STORAGE_STATE_PATH)
+    except OSError: pass
+
+
+# ========== v2.3: 常駐 Chromium 池 ==========
+BROWSER_UA = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+BROWSER_RECYCLE_PAGES = int(os.environ.get("BROWSER_RECYCLE_PAGES", "100"))
+BROWSER_WARMUP = os.environ.get("BROWSER_WARMUP", "true").lower() == "true"
+# v2.4: 爬取時不需要的資源直接 abort（圖片網址從 src / data-src 屬性讀，不必真的下載）
+BLOCK_RESOURCES = os.environ.get("BLOCK_RESOURCES", "true").lower() == "true"
+BLOCKED_TYPES = {'image', 'media', 'font'}
+BLOCKED_HOSTS = re.compile(r'google-analytics|googletagmanager|googleadservices|doubleclick|facebook\.(?:net|com)|'
+                           r'yjtag|ads-twitter|analytics\.tiktok|criteo|clarity\.ms|hotjar|karte\.io', re.I)
+
+
+class BrowserPool:
+    """整個 worker 共用一個 Chromium，每個任務開自己的 context + page，用完即關。
+    sync API 綁定建立它的執行緒，所有瀏覽器操作都排進同一條專屬執行緒；
+    瀏覽器斷線就連 driver 一起重開，開滿 recycle 頁後回收重啟，避免記憶體一路累積"""
+    def __init__(self, recycle=100):
+        self.recycle = recycle; self.pw = None; self.browser = None
+        self.pages = 0; self.launches = 0; self.tasks = 0; self.failures = 0
+        self.blocked = 0; self.busy = 0.0
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chromium')
+
+    def _close(self, driver=False):
+        try:
+            if self.browser: self.browser.close()
+        except Exception: pass
+        self.browser = None
+        if driver and self.pw:
+            try: self.pw.stop()
+            except Exception: pass
+            self.pw = None
+
+    def _ensure(self):
+        if self.browser and not self.browser.is_connected():
+            print("[瀏覽器池] 瀏覽器已斷線，重新啟動"); self._close(driver=True)
+        elif self.browser and self.pages >= self.recycle:
+            print(f"[瀏覽器池] 已開 {self.pages} 頁，回收重啟"); self._close()
+        if self.browser is None:
+            asset_cache.maybe_reset()
+            if self.pw is None: self.pw = sync_playwright().start()
+            self.browser = self.pw.chromium.launch(headless=True, args=['--disable-dev-shm-usage'])
+            self.pages = 0; self.launches += 1
+        return self.browser
+
+    def _route(self, route):
+        req = route.request
+        if BLOCK_RESOURCES and (req.resource_type in BLOCKED_TYPES or BLOCKED_HOSTS.search(req.url)):
+            self.blocked += 1; return route.abort()
+        if ASSET_CACHE_ENABLED and req.method == 'GET' and req.resource_type in CACHED_TYPES:
+            hit = asset_cache.get(req.url)
+            if hit: return route.fulfill(status=200, headers=hit[0], body=hit[1])
+            try: resp = route.fetch()
+            except Exception: return route.continue_()
+            if resp.status == 200: asset_cache.put(req.url, resp.headers, resp.body())
+            return route.fulfill(response=resp)
+        return route.continue_()
+
+    def _new_context(self, browser, context_opts):
+        opts = {'user_agent': BROWSER_UA, **storage_state_opts(), **context_opts}
+        try: return browser.new_context(**opts)
+        except Exception:
+            if 'storage_state' not in opts: raise
+            drop_storage_state(); opts.pop('storage_state')  # 檔案壞掉就丟掉重來
+            return browser.new_context(**opts)
+
+    def _task(self, fn, context_opts):
+        browser = self._ensure(); t = time.time()
+        context = self._new_context(browser, context_opts)
+        try:
+            if BLOCK_RESOURCES or ASSET_CACHE_ENABLED: context.route('**/*', self._route)
+            page = context.new_page(); self.pages += 1; self.tasks += 1
+            result = fn(page)
+            if storage_state_due(): save_storage_state(context.storage_state())
+            return result
+        except Exception:
+            self.failures += 1; raise
+        finally:
+            try: context.close()
+            except Exception: pass
+            self.busy += time.time() - t
+
+    def run(self, fn, **context_opts):
+        """借一個 page 執行 fn(page) 並回傳結果；context_opts 直接傳給 new_context"""
+        return self.executor.submit(self._task, fn, context_opts).result()
+
+    def warmup(self):
+        self.executor.submit(self._ensure)
+
+    def shutdown(self):
+        try: self.executor.submit(self._close, True).result(timeout=10)
+        except Exception: pass
+
+    def snapshot(self):
+        return {'running': self.browser is not None, 'pages': self.pages,
+                'recycle': self.recycle, 'launches': self.launches, 'tasks': self.tasks, 'failures': self.failures,
+                'blocked_requests': self.blocked, 'avg_task_sec': round(self.busy / self.tasks, 2) if self.tasks else 0}
+
+
+browser_pool = BrowserPool(BROWSER_RECYCLE_PAGES)
+atexit.register(browser_pool.shutdown)
 
 
 # ========== Playwright 爬蟲 ==========
 
+def goto_ready(page, url, selectors=(), timeout=60000, wait_ms=10000):
+    """v2.4: 只等 DOMContentLoaded，接著依序等 selectors 出現（共用 wait_ms 的期限，逾時就照現況解析）"""
+    page.goto(url, wait_until='domcontentloaded', timeout=timeout)
+    deadline = time.time() + wait_ms / 1000
+    for sel in selectors:
+        left = int((deadline - time.time()) * 1000)
+        if left <= 0: break
+        try: page.wait_for_selector(sel, state='attached', timeout=left)
+        except Exception: pass
+
+
+def wait_more(page, selector, count, wait_ms=5000):
+    """v2.4: 等 selector 的數量超過 count（取代捲動後的固定 sleep），有長出來回傳 True"""
+    try:
+        page.wait_for_function('([sel, n]) => document.querySelectorAll(sel).length > n',
+                               arg=[selector, count], timeout=wait_ms)
+        return True
+    except Exception:
+        return False
+
+
+# ========== v2.6: 搜尋 API 擷取（取代捲動讀 DOM） ==========
+SEARCH_API_CAPTURE = os.environ.get("SEARCH_API_CAPTURE", "true").lower() == "true"
+SEARCH_API_RX = re.compile(os.environ.get("SEARCH_API_PATTERN", r'/api/[^?]*(?:search|product|goods|item)'), re.I)
+OBJECT_ID_RX = re.compile(r'[a-f0-9]{24}')
+# 冷凍判定只看分類 / 標籤 / 溫層 / 配送屬性與商品名，說明、注意事項（冷凍保存はお避けください 之類）不算
+FROZEN_KEY_RX = re.compile(r'categor|tag|label|icon|temperature|temp_|delivery|shipping|cool|^name$|^title$', re.I)
+FROZEN_SKIP_KEY_RX = re.compile(r'note|desc|caution|memo|comment|text|body|detail|storage', re.I)
+PRODUCT_LINK = 'a[href*="/products/"]'
+SCROLL_JS = 'window.scrollTo(0, document.body.scrollHeight)'
+# v2.7: 一次取回所有卡片 {sku, href, frozen}，同一 sku 只看第一個連結所在的卡片
+CARDS_JS = r"""() => {
+    const seen = new Set(), out = [];
+    for (const a of document.querySelectorAll('a[href*="/products/"]')) {
+        const href = a.getAttribute('href') || '', m = href.match(/\/products\/([a-f0-9]+)\//);
+        if (!m || seen.has(m[1])) continue;
+        seen.add(m[1]);
+        const card = a.closest('.p-product-list__item') || a.closest('article') || a.closest('div');
+        out.push({sku: m[1], href, frozen: !!card && card.innerHTML.includes('冷凍')});
+    }
+    return out;
+}"""
+
+
+def api_products(payload):
+    """從 API JSON 找商品物件：帶 24 碼 hex id（_id / id / product_id）的 dict 即一個商品，不再往下找"""
+    found = []
+
+    def walk(o):
+        if isinstance(o, dict):
+            pid = next((str(o[k]) for k in ('_id', 'id', 'product_id', 'productId')
+                        if OBJECT_ID_RX.fullmatch(str(o.get(k, '')))), None)
+            if pid: found.append((pid, o)); return
+            for v in o.values(): walk(v)
+        elif isinstance(o, list):
+            for v in o: walk(v)
+    walk(payload)
+    return found
+
+
+def api_total(payload):
+    """分頁回應裡的總筆數，找不到回傳 None"""
+    queue = [payload]
+    while queue:
+        o = queue.pop(0)
+        if not isinstance(o, dict): continue
+        for k in ('total', 'total_count', 'totalCount', 'total_hits', 'totalHits'):
+            if type(o.get(k)) is int: return o[k]
+        queue.extend(v for v in o.values() if isinstance(v, dict))
+    return None
+
+
+def api_frozen(obj):
+    """API 商品物件是否冷凍：只看 FROZEN_KEY_RX 欄位（含其下的 list / dict）裡的字串"""
+    def strings(o):
+        if isinstance(o, str): yield o
+        elif isinstance(o, dict):
+            for k, v in o.items():
+                if not FROZEN_SKIP_KEY_RX.search(str(k)): yield from strings(v)
+        elif isinstance(o, list):
+            for v in o: yield from strings(v)
+    return any('冷凍' in t for k, v in obj.items()
+               if FROZEN_KEY_RX.search(str(k)) and not FROZEN_SKIP_KEY_RX.search(str(k)) for t in strings(v))
+
+
+def api_shape(url):
+    """API 回應的型別：路徑（數字視為同一頁碼）+ query 參數名；只跟著第一頁那種回應翻頁"""
+    u = urlparse(url)
+    return re.sub(r'\d+', '0', u.path), tuple(sorted(parse_qs(u.query, keep_blank_values=True)))
+
+
+def api_item_url(pid, obj, hrefs):
+    """優先用頁面上實際的連結（含 slug），其次 API 給的網址"""
+    if pid in hrefs: return urljoin(BASE_URL, hrefs[pid])
+    for k in ('url', 'path', 'href', 'link'):
+        v = obj.get(k)
+        if isinstance(v, str) and f'/products/{pid}' in v: return urljoin(BASE_URL, v)
+    return f"{BASE_URL}/products/{pid}/"
+
+
+def list_from_api(page, responses):
+    """v2.6: responses 由 page.on('response') 收集；只認第一個帶商品的回應那種型別（api_shape），
+    每次捲動只等下一個同型回應，收滿 total 筆、某頁沒有新商品、或連兩次捲動都沒有回應就結束。
+    一個 API 回應都沒攔到，或收到的比 total / 頁面上的卡片少（清單會拿來刪商品，寧可退回 DOM）回傳 None"""
+    items = {}; state = {'parsed': 0, 'total': None, 'shape': None}
+
+    def same_shape(r):
+        return state['shape'] is None or api_shape(r.url) == state['shape']
+
+    def drain():
+        batch = []
+        while state['parsed'] < len(responses):
+            r = responses[state['parsed']]; state['parsed'] += 1
+            if not same_shape(r): continue
+            try: data = r.json()
+            except Exception: continue
+            found = api_products(data)
+            if found: batch.append((api_shape(r.url), data, found))
+        if batch and state['shape'] is None:  # 同時有推薦 / 相關商品等回應時，以商品最多的那個當第一頁
+            state['shape'], data, _ = max(batch, key=lambda b: len(b[2])); state['total'] = api_total(data)
+        new = 0
+        for shape, _, found in batch:
+            if shape != state['shape']: continue
+            for pid, obj in found:
+                if pid not in items: items[pid] = obj; new += 1
+        return new
+
+    drain(); idle = 0
+    for _ in range(50):
+        if state['total'] and len(items) >= state['total']: break
+        try:
+            with page.expect_response(lambda r: bool(SEARCH_API_RX.search(r.url)) and same_shape(r), timeout=5000) as info:
+                page.evaluate(SCROLL_JS)
+            if info.value not in responses: responses.append(info.value)
+        except Exception:
+            idle += 1
+            if idle >= 2 or not responses: break
+            continue
+        idle = 0
+        if not drain(): break
+        print(f"[進度] API 已收到 {len(items)}{'/' + str(state['total']) if state['total'] else ''} 個商品...")
+    if not items: return None
+    cards = page.evaluate(CARDS_JS)
+    if len(items) < max(state['total'] or 0, len(cards)):
+        print(f"[WARN] API 只收到 {len(items)} 個商品（total {state['total']}，頁面卡片 {len(cards)}），不採用")
+        return None
+    products = []; hrefs = {c['sku']: c['href'] for c in cards}; frozen = {c['sku'] for c in cards if c['frozen']}
+    for pid, obj in items.items():
+        if pid in frozen or api_frozen(obj):
+            print(f"[跳過] 冷凍商品: {pid}"); continue
+        products.append({'url': api_item_url(pid, obj, hrefs), 'sku': pid})
+    # 第一頁若是伺服器直接輸出（沒有走 API），從 DOM 補上
+    products.extend(cards_from_dom(page, skip=set(items)))
+    return products
+
+
+def scroll_to_end(page):
+    count_js = 'document.querySelectorAll(\'a[href*="/products/"]\').length'
+    current_count = page.evaluate(count_js); idle = 0
+    for _ in range(50):
+        page.evaluate(SCROLL_JS)
+        if wait_more(page, PRODUCT_LINK, current_count): idle = 0
+        else:
+            idle += 1
+            if idle >= 2: break
+        current_count = page.evaluate(count_js)
+        print(f"[進度] 已載入約 {current_count // 2} 個商品...")
+
+
+def cards_from_dom(page, skip=()):
+    products = []
+    for card in page.evaluate(CARDS_JS):
+        if card['sku'] in skip: continue
+        if card['frozen']:
+            print(f"[跳過] 冷凍商品: {card['sku']}"); continue
+        products.append({'url': urljoin(BASE_URL, card['href']), 'sku': card['sku']})
+    return products
+
+
 def scrape_product_list():
     products = []
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context(user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
-        page = context.new_page()
+
+    def task(page):
+        responses = []
+        if SEARCH_API_CAPTURE:
+            page.on('response', lambda r: responses.append(r)
+                    if r.request.resource_type in ('xhr', 'fetch') and SEARCH_API_RX.search(r.url) else None)
         print("[INFO] 正在載入商品列表頁面...")
-        page.goto(SEARCH_URL, wait_until='networkidle', timeout=60000)
-        time.sleep(3)
-        last_height = 0; scroll_attempts = 0
-        while scroll_attempts < 50:
-            page.evaluate('window.scrollTo(0, document.body.scrollHeight)')
-            time.sleep(1.5)
-            new_height = page.evaluate('document.body.scrollHeight')
-            if new_height == last_height:
-                scroll_attempts += 1
-                if scroll_attempts >= 3: break
-            else: scroll_attempts = 0
-            last_height = new_height
-            current_count = len(page.query_selector_all('a[href*="/products/"]'))
-            print(f"[進度] 已載入約 {current_count // 2} 個商品...")
-        all_links = page.query_selector_all('a[href*="/products/"]')
-        seen_skus = set()
-        for link in all_links:
-            try:
-                href = link.get_attribute('href')
-                if not href or '/products/' not in href: continue
-                sku_match = re.search(r'/products/([a-f0-9]+)/', href)
-                if not sku_match: continue
-                sku = sku_match.group(1)
-                if sku in seen_skus: continue
-                seen_skus.add(sku)
-                is_frozen = False
-                try:
-                    card = link.evaluate_handle('el => el.closest(".p-product-list__item") || el.closest("article") || el.closest("div")')
-                    card_html = card.evaluate('el => el.innerHTML')
-                    if '冷凍' in card_html: is_frozen = True
-                except: pass
-                if is_frozen:
-                    print(f"[跳過] 冷凍商品: {sku}"); continue
-                products.append({'url': urljoin(BASE_URL, href), 'sku': sku})
-            except: continue
-        browser.close()
+        goto_ready(page, SEARCH_URL, [PRODUCT_LINK])
+        found = list_from_api(page, responses) if SEARCH_API_CAPTURE else None
+        if found is None:
+            if SEARCH_API_CAPTURE: print("[INFO] 沒攔到可用的搜尋 API 清單，改用捲動讀 DOM")
+            scroll_to_end(page)
+            found = cards_from_dom(page)
+        products.extend(found)
+    browser_pool.run(task)
     print(f"[INFO] 共收集 {len(products)} 個商品")
     return products
 
 
+# ========== v2.5: 庫存檢查 HTTP 快速路徑 ==========
+STOCK_FAST_PATH = os.environ.get("STOCK_FAST_PATH", "true").lower() == "true"
+SOLD_OUT_WORDS = ['品切れ', '在庫がありません', '在庫切れ', 'SOLD OUT', '売り切れ', '完売', '販売終了']
+PAGE_HEADERS = {'User-Agent': BROWSER_UA, 'Accept-Language': 'ja,en;q=0.8',
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8'}
+LD_JSON_RX = re.compile(r'<script[^>]+application/ld\+json[^>]*>(.*?)</script>', re.S | re.I)
+AVAILABILITY_RX = re.compile(r'"availability"\s*:\s*"(?:https?://schema\.org/)?(\w+)"')
+OOS_BUTTON_RX = re.compile(r'<button[^>]*class="[^"]*\boos\b[^"]*"[^>]*>(.*?)</button>', re.S | re.I)
+CART_BUTTON_RX = re.compile(r'<button[^>]*>\s*(?:<[^>]+>\s*)*(?:カートに入れる|カートへ入れる|購入手続き)', re.I)
+stock_path_stats = {'fast': 0, 'browser': 0, 'errors': 0}
+DETAIL_BLOCK_CLASS = 'p-details'  # 商品詳情區塊；相關商品、推薦等區塊在它外面
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+HIDDEN_TAGS = {'script', 'style', 'template', 'noscript'}
+
+
+class DetailTextParser(HTMLParser):
+    """只收 .p-details 區塊內的文字；script / template / hidden / display:none 等不會顯示的元素略過"""
+    def __init__(self):
+        super().__init__(); self.stack = []; self.parts = []; self.found = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_TAGS: return
+        a = dict(attrs); parent = self.stack[-1] if self.stack else (False, False)
+        style = (a.get('style') or '').replace(' ', '').lower()
+        inside = parent[0] or DETAIL_BLOCK_CLASS in (a.get('class') or '').split()
+        hidden = parent[1] or tag in HIDDEN_TAGS or 'hidden' in a or a.get('aria-hidden') == 'true' \
+            or 'display:none' in style or 'visibility:hidden' in style
+        self.found = self.found or inside
+        self.stack.append((inside, hidden, tag))
+
+    def handle_endtag(self, tag):
+        for i in range(len(self.stack) - 1, -1, -1):
+            if self.stack[i][2] == tag: del self.stack[i:]; return
+
+    def handle_data(self, data):
+        if self.stack and self.stack[-1][0] and not self.stack[-1][1]: self.parts.append(data)
+
+
+def detail_block_text(html):
+    """.p-details 區塊的可見文字；伺服器 HTML 裡沒有這個區塊回傳 None"""
+    parser = DetailTextParser(); parser.feed(html); parser.close()
+    return ' '.join(parser.parts) if parser.found else None
+
+
+def stock_from_html(html):
+    """伺服器輸出的 HTML 判斷庫存：JSON-LD availability > .oos 按鈕 > 詳情區塊可見文字的售完字樣 / 購物車按鈕；
+    售完字樣與購物車按鈕同時出現（JS 切換的提示）或都沒有（內容靠 JS 才渲染）回傳 None，交給瀏覽器判斷"""
+    for block in LD_JSON_RX.findall(html):
+        m = AVAILABILITY_RX.search(block)
+        if m: return m.group(1).lower() in ('instock', 'limitedavailability', 'preorder', 'presale')
+    m = OOS_BUTTON_RX.search(html)
+    if m and any(k in m.group(1) for k in ('品切れ', '在庫なし')): return False
+    detail = detail_block_text(html)
+    sold_out = detail is not None and any(k in detail for k in SOLD_OUT_WORDS)
+    cart = bool(CART_BUTTON_RX.search(html))
+    if sold_out and cart: return None
+    if sold_out: return False
+    if cart: return True
+    return None
+
+
+def http_stock_state(url):
+    """不開瀏覽器，直接 GET 商品頁；非 200 或判斷不了回傳 None"""
+    try:
+        r = client.get(url, headers=PAGE_HEADERS, timeout=20)
+        if r.status_code != 200: return None
+        return stock_from_html(r.text)
+    except Exception as e:
+        stock_path_stats['errors'] += 1
+        print(f"[庫存快速路徑] {url}: {e}")
+        return None
+
+
+def stock_path_snapshot():
+    total = stock_path_stats['fast'] + stock_path_stats['browser']
+    return {**stock_path_stats, 'fast_hit_rate': round(stock_path_stats['fast'] / total, 3) if total else 0}
+
+
+# ========== v2.7: 商品詳情單次 evaluate ==========
+# 各欄位的候選 selector 順序與舊版逐一 query_selector 相同：title / subtitle 取第一個「有元素且字數 > 2」的，
+# 價格每個 selector 取第一個元素的文字交給 Python 解析，description 取第一個存在的元素
+DETAIL_JS = r"""() => {
+    const q = s => document.querySelector(s), qa = s => [...document.querySelectorAll(s)];
+    const text = el => el ? (el.innerText || '').trim() : '';
+    const pick = sels => { for (const s of sels) { const t = text(q(s)); if (t.length > 2) return t; } return ''; };
+    const src = img => img.getAttribute('data-src') || img.getAttribute('src') || '';
+    const desc = ['.p-details__description', '.description', '[class*="description"]'].map(q).find(Boolean);
+    const oos = q('button.oos') || q('.oos');
+    const og = q('meta[property="og:image"]');
+    const title = pick(['h1.h3.u-weight-bold', 'h1.u-weight-bold', '.p-details__title h1', '.p-details h1', 'h1']);
+    const tags = qa('.p-details [class*="tag"], .p-details [class*="icon"], .p-details [class*="label"]').map(text).join(' ');
+    return {
+        title, subtitle: pick(['p.u-color-gray', '.p-details__subtitle', '.u-color-gray']),
+        price_texts: ['.p-price__price', '.p-price', '[class*="price"]', '.price'].map(s => q(s) ? text(q(s)) : null),
+        description: desc ? desc.innerHTML : '',
+        oos_text: oos ? text(oos) : null,
+        body_text: document.body ? document.body.innerText : '',
+        dd_texts: qa('dd').map(text),
+        thumbs: qa('.p-details__thumbnails img').map(src),
+        slides: qa('.p-details__mainimage .slick-slide:not(.slick-cloned) img').map(src),
+        cdn_images: qa('img[src*="cloudfront.net/full/goods/"], img[data-src*="cloudfront.net/full/goods/"]').map(src),
+        og_image: og ? og.getAttribute('content') : '',
+        frozen: /冷凍/.test(title + ' ' + tags),
+    };
+}"""
+SKIP_IMAGE_PATTERNS = ['dummy_product_thumbnail', 'play_button', 'details/caution/', 'about_clack', 'about_shopper', 'data:image/png;base64']
+
+
+def stock_from_record(rec):
+    if rec['oos_text'] and ('品切れ' in rec['oos_text'] or '在庫なし' in rec['oos_text']): return False
+    return not any(k in rec['body_text'] for k in SOLD_OUT_WORDS)
+
+
+def full_image_url(src):
+    src = re.sub(r'/ex/[\d.]+/[\d.]+/', '/full/', src)
+    src = re.sub(r'/ex/[\d.]+/', '/full/', src)
+    if src.startswith('//'): return 'https:' + src
+    return src if src.startswith('http') else urljoin(BASE_URL, src)
+
+
+def apply_detail_record(product, rec):
+    """把 DETAIL_JS 的結果套進 product（規則同舊版逐欄抓取）"""
+    product['in_stock'] = stock_from_record(rec)
+    product['is_frozen'] = rec['frozen']
+    product['title'] = rec['title']; product['subtitle'] = rec['subtitle']
+    for t in rec['price_texts']:
+        if t is None: continue
+        pm = re.search(r'([\d,]+)', t.replace('¥', '').replace('￥', ''))
+        if pm: product['price'] = int(pm.group(1).replace(',', '')); break
+    product['description'] = rec['description']
+    for text in rec['dd_texts']:
+        has_size = (re.search(r'\d+\s*[×xXΦ]\s*\d+\s*[×xX]\s*\d+', text) or
+                    re.search(r'\d+\s*Φ\s*[×xX]\s*\d+', text) or
+                    re.search(r'\d+\s*[×xX]\s*\d+(?:\.\d+)?\s*mm', text))
+        has_weight = re.search(r'\d+(?:,\d+)?\s*[gG]', text)
+        if has_size or has_weight:
+            product['size_weight_text'] = text
+            product['weight'] = parse_size_weight(text)['final_weight']; break
+    if not product['weight']:
+        wm = re.search(r'(\d+(?:,\d+)?)\s*[gG](?![\w])', rec['body_text'])
+        if wm: product['weight'] = round(float(wm.group(1).replace(',', '')) / 1000, 2)
+    if product['weight'] == 0: product['weight'] = 0.5
+    images = []
+    for group in ('thumbs', 'slides'):
+        if group == 'slides' and len(images) >= 3: break
+        for src in rec[group]:
+            if not src or any(pat in src for pat in SKIP_IMAGE_PATTERNS): continue
+            src = full_image_url(src)
+            if src not in images: images.append(src)
+    if len(images) < 3:
+        for src in rec['cdn_images']:
+            if src and src.startswith('//'): src = 'https:' + src
+            if src and src not in images: images.append(src)
+    if not images and rec['og_image']: images.append(rec['og_image'])
+    product['images'] = images[:10]
+    return product
+
+
 def check_product_in_stock(url):
-    """v2.2: 快速檢查商品庫存狀態（不抓完整詳情）"""
+    """v2.2: 快速檢查商品庫存狀態（不抓完整詳情）
+    v2.5: 先試 HTTP 快速路徑，結果不明確才借瀏覽器"""
+    if STOCK_FAST_PATH:
+        state = http_stock_state(url)
+        if state is not None:
+            stock_path_stats['fast'] += 1; return state
+    stock_path_stats['browser'] += 1
+
+    def task(page):
+        goto_ready(page, url, ['.p-details', '.p-price__price, .p-price'], timeout=30000)
+        return stock_from_record(page.evaluate(DETAIL_JS))
     try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            context = browser.new_context(user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36')
-            page = context.new_page()
-            page.goto(url, wait_until='networkidle', timeout=30000)
-            time.sleep(2)
-            oos_btn = page.query_selector('button.oos') or page.query_selector('.oos')
-            in_stock = True
-            if oos_btn:
-                oos_text = oos_btn.inner_text()
-                if '品切れ' in oos_text or '在庫なし' in oos_text:
-                    in_stock = False
-            # 也檢查頁面文字
-            if in_stock:
-                pt = page.inner_text('body')
-                if any(k in pt for k in ['品切れ', '在庫がありません', '在庫切れ', 'SOLD OUT', '売り切れ', '完売', '販売終了']):
-                    in_stock = False
-            browser.close()
-            return in_stock
+        return browser_pool.run(task)
     except Exception as e:
         print(f"[庫存檢查錯誤] {url}: {e}")
         return True  # 錯誤時預設有庫存，避免誤刪
 
 
-def scrape_product_detail(url):
+def new_product(url):
     product = {'url': url, 'title': '', 'subtitle': '', 'price': 0, 'description': '',
                'size_weight_text': '', 'weight': 0, 'images': [], 'in_stock': True, 'is_frozen': False, 'sku': ''}
     sku_match = re.search(r'/products/([a-f0-9]+)/', url)
     if sku_match: product['sku'] = sku_match.group(1)
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context(user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                                      viewport={'width': 1920, 'height': 1080})
-        page = context.new_page()
+    return product
+
+
+def scrape_product_detail(url):
+    product = new_product(url)
+
+    def task(page):
         try:
-            page.goto(url, wait_until='networkidle', timeout=60000)
-            try: page.wait_for_selector('.p-details', timeout=10000)
-            except: pass
-            time.sleep(5)
-            page.evaluate('window.scrollTo(0, document.body.scrollHeight / 2)')
-            time.sleep(1)
-            page.evaluate('window.scrollTo(0, 0)')
-            time.sleep(1)
-            oos_btn = page.query_selector('button.oos') or page.query_selector('.oos')
-            if oos_btn:
-                oos_text = oos_btn.inner_text()
-                if '品切れ' in oos_text or '在庫なし' in oos_text: product['in_stock'] = False
-            # === v2.2: 擴充缺貨偵測 ===
-            if product['in_stock']:
-                pt = page.inner_text('body')
-                if any(k in pt for k in ['品切れ', '在庫がありません', '在庫切れ', 'SOLD OUT', '売り切れ', '完売', '販売終了']):
-                    product['in_stock'] = False
-            for sel in ['h1.h3.u-weight-bold', 'h1.u-weight-bold', '.p-details__title h1', '.p-details h1', 'h1']:
-                el = page.query_selector(sel)
-                if el:
-                    t = el.inner_text().strip()
-                    if t and len(t) > 2: product['title'] = t; break
-            for sel in ['p.u-color-gray', '.p-details__subtitle', '.u-color-gray']:
-                el = page.query_selector(sel)
-                if el:
-                    t = el.inner_text().strip()
-                    if t and len(t) > 2: product['subtitle'] = t; break
-            for sel in ['.p-price__price', '.p-price', '[class*="price"]', '.price']:
-                el = page.query_selector(sel)
-                if el:
-                    pm = re.search(r'([\d,]+)', el.inner_text().replace('¥', '').replace('￥', ''))
-                    if pm: product['price'] = int(pm.group(1).replace(',', '')); break
-            for sel in ['.p-details__description', '.description', '[class*="description"]']:
-                el = page.query_selector(sel)
-                if el: product['description'] = el.inner_html(); break
-            for dd in page.query_selector_all('dd'):
-                text = dd.inner_text()
-                has_size = (re.search(r'\d+\s*[×xXΦ]\s*\d+\s*[×xX]\s*\d+', text) or
-                            re.search(r'\d+\s*Φ\s*[×xX]\s*\d+', text) or
-                            re.search(r'\d+\s*[×xX]\s*\d+(?:\.\d+)?\s*mm', text))
-                has_weight = re.search(r'\d+(?:,\d+)?\s*[gG]', text)
-                if has_size or has_weight:
-                    product['size_weight_text'] = text
-                    wi = parse_size_weight(text)
-                    product['weight'] = wi['final_weight']; break
-            if not product['weight']:
-                page_text = page.inner_text('body')
-                wm = re.search(r'(\d+(?:,\d+)?)\s*[gG](?![\w])', page_text)
-                if wm: product['weight'] = round(float(wm.group(1).replace(',', '')) / 1000, 2)
-            if product['weight'] == 0: product['weight'] = 0.5
-            images = []
-            skip_patterns = ['dummy_product_thumbnail', 'play_button', 'details/caution/', 'about_clack', 'about_shopper', 'data:image/png;base64']
-            try:
-                for _ in range(3):
-                    nb = page.query_selector('.slick-next')
-                    if nb: nb.click(); time.sleep(0.3)
-            except: pass
-            tc = page.query_selector('.p-details__thumbnails')
-            if tc:
-                for img in tc.query_selector_all('img'):
-                    src = img.get_attribute('data-src') or img.get_attribute('src')
-                    if not src or any(pat in src for pat in skip_patterns): continue
-                    src = re.sub(r'/ex/[\d.]+/[\d.]+/', '/full/', src)
-                    src = re.sub(r'/ex/[\d.]+/', '/full/', src)
-                    if src.startswith('//'): src = 'https:' + src
-                    elif not src.startswith('http'): src = urljoin(BASE_URL, src)
-                    if src not in images: images.append(src)
-            if len(images) < 3:
-                sc = page.query_selector('.p-details__mainimage')
-                if sc:
-                    for img in sc.query_selector_all('.slick-slide:not(.slick-cloned) img'):
-                        src = img.get_attribute('data-src') or img.get_attribute('src')
-                        if not src or any(pat in src for pat in skip_patterns): continue
-                        src = re.sub(r'/ex/[\d.]+/', '/full/', src)
-                        if src.startswith('//'): src = 'https:' + src
-                        elif not src.startswith('http'): src = urljoin(BASE_URL, src)
-                        if src not in images: images.append(src)
-            if len(images) < 3:
-                for img in page.query_selector_all('img[src*="cloudfront.net/full/goods/"], img[data-src*="cloudfront.net/full/goods/"]'):
-                    src = img.get_attribute('data-src') or img.get_attribute('src')
-                    if src and src not in images:
-                        if src.startswith('//'): src = 'https:' + src
-                        images.append(src)
-            if not images:
-                og = page.query_selector('meta[property="og:image"]')
-                if og:
-                    src = og.get_attribute('content')
-                    if src: images.append(src)
-            product['images'] = images[:10]
+            goto_ready(page, url, ['.p-details', '.p-price__price, .p-price',
+                                   '.p-details__thumbnails img, .p-details__mainimage img'])
+            apply_detail_record(product, page.evaluate(DETAIL_JS))
         except Exception as e:
             print(f"[ERROR] 爬取商品詳細失敗: {e}")
-        finally:
-            browser.close()
+    browser_pool.run(task, viewport={'width': 1920, 'height': 1080})
     return product
 
 
+# ========== v2.8: async Playwright 並行詳情頁 ==========
+ASYNC_PAGES = int(os.environ.get("ASYNC_PAGES", "4"))  # <= 1 表示關閉，逐頁走同步池
+ASYNC_PAGE_TIMEOUT = float(os.environ.get("ASYNC_PAGE_TIMEOUT", "45"))
+
+
+async def goto_ready_async(page, url, selectors=(), timeout=60000, wait_ms=10000):
+    await page.goto(url, wait_until='domcontentloaded', timeout=timeout)
+    deadline = time.time() + wait_ms / 1000
+    for sel in selectors:
+        left = int((deadline - time.time()) * 1000)
+        if left <= 0: break
+        try: await page.wait_for_selector(sel, state='attached', timeout=left)
+        except Exception: pass
+
+
+class AsyncBrowser:
+    """專屬執行緒跑 asyncio loop + async_playwright：同一個 Chromium 同時開 size 個 page（semaphore 控制），
+    每頁各自 ASYNC_PAGE_TIMEOUT 逾時；失敗 / 逾時的頁回傳 None，由呼叫端改走同步池。
+    回收規則同 BrowserPool，但只在批次之間重啟；每輪爬完由 run_scrape 呼叫 release 關掉，不與同步池一起常駐"""
+    def __init__(self, size=4, recycle=100):
+        self.size = size; self.recycle = recycle
+        self.loop = None; self.pw = None; self.browser = None; self.lock = threading.Lock()
+        self.opened = 0; self.launches = 0; self.pages = 0; self.timeouts = 0; self.failures = 0
+
+    def _loop(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, daemon=True, name='chromium-async').start()
+            return self.loop
+
+    async def _ensure(self):
+        if self.browser and (not self.browser.is_connected() or self.opened >= self.recycle):
+            try: await self.browser.close()
+            except Exception: pass
+            self.browser = None
+        if self.browser is None:
+            asset_cache.maybe_reset()
+            if self.pw is None: self.pw = await async_playwright().start()
+            self.browser = await self.pw.chromium.launch(headless=True, args=['--disable-dev-shm-usage'])
+            self.opened = 0; self.launches += 1
+        return self.browser
+
+    async def _route(self, route):
+        req = route.request
+        if BLOCK_RESOURCES and (req.resource_type in BLOCKED_TYPES or BLOCKED_HOSTS.search(req.url)):
+            browser_pool.blocked += 1; return await route.abort()
+        if ASSET_CACHE_ENABLED and req.method == 'GET' and req.resource_type in CACHED_TYPES:
+            hit = asset_cache.get(req.url)
+            if hit: return await route.fulfill(status=200, headers=hit[0], body=hit[1])
+            try: resp = await route.fetch()
+            except Exception: return await route.continue_()
+            if resp.status == 200: asset_cache.put(req.url, resp.headers, await resp.body())
+            return await route.fulfill(response=resp)
+        await route.continue_()
+
+    async def _new_context(self, browser):
+        opts = {'user_agent': BROWSER_UA, 'viewport': {'width': 1920, 'height': 1080}, **storage_state_opts()}
+        try: return await browser.new_context(**opts)
+        except Exception:
+            if 'storage_state' not in opts: raise
+            drop_storage_state(); opts.pop('storage_state')
+            return await browser.new_context(**opts)
+
+    async def _load(self, page, url):
+        await goto_ready_async(page, url, ['.p-details', '.p-price__price, .p-price',
+                                           '.p-details__thumbnails img, .p-details__mainimage img'])
+        return await page.evaluate(DETAIL_JS)
+
+    async def _detail(self, browser, sem, url):
+        async with sem:
+            context = await self._new_context(browser)
+            try:
+                if BLOCK_RESOURCES or ASSET_CACHE_ENABLED: await context.route('**/*', self._route)
+                page = await context.new_page(); self.opened += 1; self.pages += 1
+                rec = await asyncio.wait_for(self._load(page, url), ASYNC_PAGE_TIMEOUT)
+                if storage_state_due(): save_storage_state(await context.storage_state())
+                return url, apply_detail_record(new_product(url), rec)
+            except asyncio.TimeoutError:
+                self.timeouts += 1; print(f"[並行詳情] 逾時 {ASYNC_PAGE_TIMEOUT}s: {url}")
+            except Exception as e:
+                self.failures += 1; print(f"[並行詳情] 失敗 {url}: {e}")
+            finally:
+                try: await context.close()
+                except Exception: pass
+        return url, None
+
+    async def _batch(self, urls):
+        browser = await self._ensure(); sem = asyncio.Semaphore(self.size)
+        return dict(await asyncio.gather(*(self._detail(browser, sem, u) for u in urls)))
+
+    def scrape_details(self, urls):
+        """同時抓多個詳情頁，回傳 {url: product 或 None}"""
+        if not urls: return {}
+        return asyncio.run_coroutine_threadsafe(self._batch(urls), self._loop()).result()
+
+    async def _release(self):
+        if self.browser:
+            try: await self.browser.close()
+            except Exception: pass
+        self.browser = None
+
+    def release(self):
+        """關掉 Chromium（driver 與 loop 留著），下一批再啟動"""
+        if self.loop is None: return
+        try: asyncio.run_coroutine_threadsafe(self._release(), self.loop).result(timeout=10)
+        except Exception: pass
+
+    async def _close(self):
+        if self.browser:
+            try: await self.browser.close()
+            except Exception: pass
+        if self.pw: await self.pw.stop()
+        self.browser = None; self.pw = None
+
+    def shutdown(self):
+        if self.loop is None: return
+        try: asyncio.run_coroutine_threadsafe(self._close(), self.loop).result(timeout=10)
+        except Exception: pass
+
+    def snapshot(self):
+        return {'size': self.size, 'running': self.browser is not None, 'pages': self.pages,
+                'launches': self.launches, 'timeouts': self.timeouts, 'failures': self.failures}
+
+
+async_browser = AsyncBrowser(ASYNC_PAGES, BROWSER_RECYCLE_PAGES)
+atexit.register(async_browser.shutdown)
+# 並行詳情頁開著時同步池不預熱（列表 / 庫存 / 補抓第一次用到才啟動），避免 worker 一開就常駐兩個 Chromium
+if BROWSER_WARMUP and ASYNC_PAGES <= 1: browser_pool.warmup()
+
+
+def listing_title(product):
+    """翻譯用的原文標題：有副標就接在後面"""
+    return f"{product['title']} - {product['subtitle']}" if product.get('subtitle') else product['title']
+
+
 def upload_to_shopify(product, collection_id=None):
-    original_title = product['title']
-    if product.get('subtitle'): original_title = f"{product['title']} - {product['subtitle']}"
-    translated = translate_with_chatgpt(original_title, product.get('description', ''))
+    original_title = listing_title(product)
+    translated = translation_batcher.result(original_title, product.get('description', ''))
     if not translated['success']:
         return {'success': False, 'error': 'translation_failed', 'translated': translated}
     if is_japanese_text(translated['title']):
@@ -491,7 +1568,6 @@ def upload_to_shopify(product, collection_id=None):
         if result['success']:
             images_b64.append({'attachment': result['base64'], 'position': idx+1,
                                'filename': f"yokumoku_{product['sku']}_{idx+1}.jpg"})
-        time.sleep(0.5)
     sp = {'product': {
         'title': translated['title'], 'body_html': translated['description'] + SHIPPING_HTML,
         'vendor': 'YOKUMOKU', 'product_type': 'クッキー・洋菓子',
@@ -504,10 +1580,10 @@ def upload_to_shopify(product, collection_id=None):
         'metafields_global_description_tag': translated['meta_description'],
         'metafields': [{'namespace': 'custom', 'key': 'link', 'value': product['url'], 'type': 'url'}]
     }}
-    r = requests.post(shopify_api_url('products.json'), headers=get_shopify_headers(), json=sp)
+    r = client.post(shopify_api_url('products.json'), headers=get_shopify_headers(), json=sp)
     if r.status_code == 201:
         cp = r.json()['product']; pid = cp['id']; vid = cp['variants'][0]['id']
-        requests.put(shopify_api_url(f'variants/{vid}.json'), headers=get_shopify_headers(),
+        client.put(shopify_api_url(f'variants/{vid}.json'), headers=get_shopify_headers(),
             json={'variant': {'id': vid, 'cost': f"{cost:.2f}"}})
         if collection_id: add_product_to_collection(pid, collection_id)
         publish_to_all_channels(pid)
@@ -517,6 +1593,7 @@ def upload_to_shopify(product, collection_id=None):
 
 def run_scrape():
     global scrape_status
+    retry_budget.reset()
     try:
         scrape_status.update({"running": True, "progress": 0, "total": 0, "current_product": "",
             "products": [], "errors": [], "uploaded": 0, "skipped": 0,
@@ -544,6 +1621,9 @@ def run_scrape():
         # === v2.2: 記錄缺貨的 SKU ===
         out_of_stock_skus = set()
         ctf = 0
+        # === v2.8: 新商品詳情頁一次並行抓一批 ===
+        new_items = [item for item in product_list if item['sku'] not in existing_skus]
+        details = {}; fetched = set()
 
         for idx, item in enumerate(product_list):
             scrape_status['progress'] = idx + 1
@@ -555,12 +1635,21 @@ def run_scrape():
                     if not check_product_in_stock(item['url']):
                         out_of_stock_skus.add(item['sku'])
                         scrape_status['out_of_stock'] += 1
-                    time.sleep(0.5)
                 scrape_status['skipped_exists'] += 1
                 scrape_status['skipped'] += 1
                 continue
 
-            product = scrape_product_detail(item['url'])
+            if ASYNC_PAGES > 1 and item['url'] not in fetched:
+                batch = [i['url'] for i in new_items if i['url'] not in fetched][:ASYNC_PAGES * 2]
+                scrape_status['current_product'] = f"並行抓取詳情 {len(batch)} 頁..."
+                fetched.update(batch)
+                try: details.update(async_browser.scrape_details(batch))
+                except Exception as e: print(f"[並行詳情] 批次失敗，改逐頁抓取: {e}")
+                for url in batch:  # === v3.1 這批新商品一起送批次翻譯 ===
+                    p = details.get(url)
+                    if p and p.get('title') and not p.get('is_frozen') and p.get('in_stock', True) and p.get('price', 0) >= MIN_PRICE:
+                        translation_batcher.submit(p.get('sku'), listing_title(p), p.get('description', ''))
+            product = details.pop(item['url'], None) or scrape_product_detail(item['url'])
 
             if product.get('is_frozen'):
                 scrape_status['skipped_frozen'] += 1
@@ -598,7 +1687,6 @@ def run_scrape():
                     scrape_status['errors'].append({'error': f'翻譯連續失敗 {ctf} 次，自動停止'}); break
             else:
                 scrape_status['errors'].append({'sku': product['sku'], 'error': result.get('error', '')}); ctf = 0
-            time.sleep(1)
 
         # === v2.2: 合併需要刪除的 SKU ===
         if not scrape_status['translation_stopped']:
@@ -615,12 +1703,12 @@ def run_scrape():
                             print(f"[已刪除] SKU: {sku}, Product ID: {pid}")
                         else:
                             scrape_status['errors'].append({'sku': sku, 'error': '刪除失敗'})
-                    time.sleep(0.3)
 
         scrape_status['current_product'] = "完成！" if not scrape_status['translation_stopped'] else "翻譯異常停止"
     except Exception as e:
         scrape_status['errors'].append({'error': str(e)})
     finally:
+        async_browser.release()  # 並行詳情頁的 Chromium 只在爬取期間存在
         scrape_status['running'] = False
 
 
@@ -640,7 +1728,7 @@ def run_update_shipping():
         pids = []
         url = shopify_api_url("products.json?limit=250&vendor=YOKUMOKU&fields=id,body_html")
         while url:
-            r = requests.get(url, headers=get_shopify_headers())
+            r = client.get(url, headers=get_shopify_headers())
             if r.status_code != 200:
                 update_shipping_status["errors"].append(f"取得商品列表失敗: {r.status_code}")
                 break
@@ -656,7 +1744,7 @@ def run_update_shipping():
                 if "國際運費" in body:
                     update_shipping_status["skipped"] += 1
                     continue
-                ru = requests.put(
+                ru = client.put(
                     shopify_api_url(f"products/{pid}.json"),
                     headers=get_shopify_headers(),
                     json={"product": {"id": pid, "body_html": body + SHIPPING_HTML}}
@@ -770,7 +1858,7 @@ def api_scan_japanese():
     products = []
     url = shopify_api_url("products.json?limit=250&vendor=YOKUMOKU")
     while url:
-        r = requests.get(url, headers=get_shopify_headers())
+        r = client.get(url, headers=get_shopify_headers())
         if r.status_code != 200: break
         for p in r.json().get('products', []):
             sku = ''; price = ''
@@ -790,7 +1878,7 @@ def api_retranslate_product():
     if not load_shopify_token(): return jsonify({'error': '未設定 Token'}), 400
     data = request.get_json(); pid = data.get('product_id')
     if not pid: return jsonify({'error': '缺少 product_id'}), 400
-    resp = requests.get(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers())
+    resp = client.get(shopify_api_url(f"products/{pid}.json"), headers=get_shopify_headers())
     if resp.status_code != 200: return jsonify({'error': f'無法取得: {resp.status_code}'}), 400
     product = resp.json().get('product', {})
     translated = translate_with_chatgpt(product.get('title', ''), product.get('body_html', ''))
@@ -826,7 +1914,12 @@ def api_test_translate():
 
 @app.route('/api/status')
 def get_status():
-    return jsonify(scrape_status)
+    return jsonify({**scrape_status, 'pacing': pacer_snapshot(), 'retries': retry_budget.snapshot(),
+                    'browser': browser_pool.snapshot(), 'async_browser': async_browser.snapshot(),
+                    'asset_cache': asset_cache.snapshot(), 'stock_path': stock_path_snapshot(),
+                    'translation_cache': translation_cache.snapshot(),
+                    'translation_batch': translation_batcher.snapshot(),
+                    'openai': openai_budget.snapshot()})
 
 
 @app.route('/api/start-scrape', methods=['POST'])
@@ -856,11 +1949,19 @@ def cron_trigger():
 @app.route('/api/test-shopify')
 def test_shopify():
     if not load_shopify_token(): return jsonify({'success': False, 'error': '未設定環境變數'})
-    r = requests.get(shopify_api_url('shop.json'), headers=get_shopify_headers())
+    r = client.get(shopify_api_url('shop.json'), headers=get_shopify_headers())
     if r.status_code == 200: return jsonify({'success': True, 'shop': r.json()['shop']})
     return jsonify({'success': False, 'error': r.text}), 400
 
 
+@app.route('/api/test-size')
+def test_size():
+    rows = [{'text': t, 'expected': [aw, fw], 'got': [r['actual_weight'], r['final_weight']]}
+            for t, aw, fw in SIZE_FIXTURES for r in [SIZE_RULE(t)]]
+    failed = [r for r in rows if r['expected'] != r['got']]
+    return jsonify({'success': not failed, 'total': len(rows), 'failed': failed})
+
+
 @app.route('/api/test-scrape')
 def test_scrape():
     product = scrape_product_detail("https://www.yokumoku.jp/products/5d70b5f1dbbfdc006fd21f3c/%E3%80%905%E7%A8%AE-40%E5%80%8B%E5%85%A5%E3%82%8A%E3%80%91%E3%82%B5%E3%83%B3%E3%82%AF-%E3%83%87%E3%83%AA%E3%82%B9")
@@ -871,8 +1972,8 @@ def test_scrape():
 
 if __name__ == '__main__':
     print("=" * 50)
-    print("YOKUMOKU 爬蟲工具 v2.2")
-    print("新增: 缺貨商品自動刪除")
+    print("YOKUMOKU 爬蟲工具 v3.2")
+    print("新增: 翻譯 worker pool（RPM / TPM 預算）")
     print("=" * 50)
     port = int(os.environ.get('PORT', 8080))
     app.run(host='0.0.0.0', port=port, debug=False)